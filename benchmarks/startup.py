@@ -0,0 +1,77 @@
+"""
+Startup time of the csvcli command, checked against a budget.
+
+It measures how long `import csvcli.cli` takes with `python -X importtime`, and checks that none of the heavy modules
+are loaded before a command needs them. It exits with status 1 if the import goes over budget or a heavy module
+shows up, so it can run in CI.
+
+Usage: python benchmarks/startup.py [--budget-ms 250] [--runs 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+# median import time of csvcli.cli allowed, in milliseconds
+DEFAULT_BUDGET_MS = 250
+
+# modules that must only be imported by the commands that use them
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'pandasql', 'sqlalchemy', 'openpyxl']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_import_times():
+    """
+    :return: dict with the cumulative import time in microseconds of every module imported by csvcli.cli
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import csvcli.cli'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+
+    times = {}
+
+    # lines look like "import time:       412 |       1873 |   click.core"
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative_us)
+
+    return times
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [get_import_times() for run in range(args.runs)]
+    import_ms = statistics.median(times['csvcli.cli'] for times in runs) / 1000
+
+    heavy = [module for module in runs[0] if module.split('.')[0] in HEAVY_MODULES]
+    slowest = sorted(runs[0].items(), key=lambda item: item[1], reverse=True)[1:6]
+
+    print(f"import csvcli.cli: {import_ms:.1f}ms (budget {args.budget_ms:g}ms, median of {args.runs} runs)")
+    print("slowest imports: " + ", ".join(f"{module} {cumulative_us / 1000:.1f}ms" for module, cumulative_us in slowest))
+
+    failed = False
+
+    if import_ms > args.budget_ms:
+        print("over budget")
+        failed = True
+
+    if len(heavy) > 0:
+        print("heavy modules imported at startup: " + ", ".join(sorted({module.split('.')[0] for module in heavy})))
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
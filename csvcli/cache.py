@@ -0,0 +1,275 @@
+"""
+On-disk cache of parsed CSV and Excel files.
+
+With --cache, the first command that reads a file also writes a parquet copy of it into the cache directory, along
+with the delimiter that was sniffed. Later commands read the copy instead of parsing the file again, and get the
+parquet fast paths: row counts and data types from metadata, row groups skipped by filters, Arrow-native selections.
+
+Results of queries are kept the same way, keyed by the file, how it was parsed and the normalized text of the query,
+so running a query again only reads its result.
+
+Entries are keyed by the path, size and modification time of the file, plus a hash of its contents if asked to.
+Once the cache grows over its size limit the least recently used entries are evicted.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+
+CACHE_DIR_ENV = 'CSVCLI_CACHE_DIR'
+CACHE_MAX_SIZE_ENV = 'CSVCLI_CACHE_MAX_SIZE'
+DEFAULT_CACHE_MAX_SIZE = '10GB'
+
+HASH_BLOCK_BYTES = 4 * 1024 * 1024
+
+META_FILENAME = 'meta.json'
+DATA_FILENAME = 'data.parquet'
+
+# keys of a fingerprint that change with the contents of the file, the rest tell what the entry is about
+VERSION_KEYS = ['size', 'mtime_ns', 'hash']
+
+
+def get_cache_dir():
+
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'csvcli')
+
+
+def get_cache_max_bytes():
+
+    from csvcli.functions import parse_size
+
+    return parse_size(os.environ.get(CACHE_MAX_SIZE_ENV) or DEFAULT_CACHE_MAX_SIZE)
+
+
+def hash_file(filepath, block_bytes=HASH_BLOCK_BYTES):
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_bytes), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def get_file_fingerprint(filepath, content_hash=False):
+    """
+    :param content_hash: true to also hash the contents of the file, for files whose modification time can not be trusted
+    :return: dict that changes whenever the file does
+    """
+
+    stat = os.stat(filepath)
+    fingerprint = {'path': os.path.abspath(filepath), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    if content_hash:
+        fingerprint['hash'] = hash_file(filepath)
+
+    return fingerprint
+
+
+def is_older_version(fingerprint, other_fingerprint):
+    """
+    :return: true if both fingerprints are about the same thing, i.e. the same query on the same file, but the
+             file changed in between
+    """
+
+    def get_subject(fingerprint):
+        return {key: value for key, value in fingerprint.items() if key not in VERSION_KEYS}
+
+    return fingerprint != other_fingerprint and get_subject(fingerprint) == get_subject(other_fingerprint)
+
+
+def get_entry_dir(cache_dir, fingerprint):
+
+    key = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+    return os.path.join(cache_dir, key)
+
+
+def write_meta(entry_dir, meta):
+
+    # the meta file is replaced whole, so a reader never sees half of it
+    file_descriptor, temp_filepath = tempfile.mkstemp(prefix='.meta.', dir=entry_dir)
+    with os.fdopen(file_descriptor, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temp_filepath, os.path.join(entry_dir, META_FILENAME))
+
+
+def read_meta(entry_dir):
+
+    try:
+        with open(os.path.join(entry_dir, META_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_entry(cache_dir, fingerprint):
+    """
+    Looks up the cached copy of a file and marks it as just used
+    :return: metadata of the entry, with the path of the copy as 'data_filepath' if it could be written.
+             None if the file is not cached
+    """
+
+    entry_dir = get_entry_dir(cache_dir=cache_dir, fingerprint=fingerprint)
+    meta = read_meta(entry_dir=entry_dir)
+
+    if meta is None or meta.get('fingerprint') != fingerprint:
+        return None
+
+    if meta['status'] == 'ok':
+        if not os.path.exists(os.path.join(entry_dir, DATA_FILENAME)):
+            return None
+        meta['data_filepath'] = os.path.join(entry_dir, DATA_FILENAME)
+
+    meta['last_used'] = time.time()
+
+    try:
+        write_meta(entry_dir=entry_dir, meta={key: value for key, value in meta.items() if key != 'data_filepath'})
+    except OSError:
+        pass
+
+    return meta
+
+
+def write_data(get_chunks, filepath):
+    """
+    Writes a sequence of chunks into one parquet file, widening the columns whose types change from chunk to chunk
+    :param get_chunks: function returning an iterable of Pandas DataFrames
+    :return: true if the file was written, false if the contents do not fit in a parquet file
+    """
+
+    import pyarrow as pa
+    from csvcli.functions import write_chunks_to_parquet
+
+    try:
+        write_chunks_to_parquet(chunks=get_chunks(), filepath=filepath)
+        return True
+
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return False
+
+
+def write_entry(cache_dir, fingerprint, get_chunks, info):
+    """
+    Writes the parsed contents of a file, or the result of a query, into the cache, then evicts the least recently
+    used entries if the cache went over its size limit. Contents that can not be written are recorded as such,
+    so they are not tried again
+    :param get_chunks: function returning a new iterable of Pandas DataFrames with the contents to cache
+    :param info: dict of details kept in the metadata, i.e. the delimiter the file was parsed with
+    :return: metadata of the entry as returned by read_entry, None if the cache directory can not be written
+    """
+
+    entry_dir = get_entry_dir(cache_dir=cache_dir, fingerprint=fingerprint)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+    except OSError:
+        return None
+
+    try:
+        success = write_data(get_chunks=get_chunks, filepath=os.path.join(temp_dir, DATA_FILENAME))
+
+        if not success and os.path.exists(os.path.join(temp_dir, DATA_FILENAME)):
+            os.remove(os.path.join(temp_dir, DATA_FILENAME))
+
+        now = time.time()
+        meta = {'fingerprint': fingerprint, 'status': 'ok' if success else 'failed', 'created': now, 'last_used': now,
+                'bytes': os.path.getsize(os.path.join(temp_dir, DATA_FILENAME)) if success else 0, **info}
+        write_meta(entry_dir=temp_dir, meta=meta)
+
+        other_meta = read_meta(entry_dir=entry_dir)
+
+        # the entry only shows up once it is complete. One written meanwhile by another command, i.e. the server
+        # loading the same file, is kept as it may already be read
+        if other_meta is not None and other_meta.get('fingerprint') == fingerprint and other_meta['status'] == 'ok':
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        else:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(temp_dir, entry_dir)
+
+    # i.e. a result with two columns of the same name, parquet does not allow it
+    except (OSError, ValueError):
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return None
+
+    # entries of older versions of the file will not be used again
+    for other_entry_dir, other_meta in list_entries(cache_dir=cache_dir):
+        if is_older_version(fingerprint=fingerprint, other_fingerprint=other_meta['fingerprint']):
+            shutil.rmtree(other_entry_dir, ignore_errors=True)
+
+    evict_entries(cache_dir=cache_dir, max_bytes=get_cache_max_bytes(), keep=entry_dir)
+
+    return read_entry(cache_dir=cache_dir, fingerprint=fingerprint)
+
+
+def list_entries(cache_dir):
+    """
+    :return: list of (entry directory, metadata) of the cached files, the most recently used first
+    """
+
+    if not os.path.isdir(cache_dir):
+        return []
+
+    entries = []
+
+    for name in os.listdir(cache_dir):
+        entry_dir = os.path.join(cache_dir, name)
+        meta = read_meta(entry_dir=entry_dir) if not name.startswith('.') else None
+        if meta is not None:
+            entries.append((entry_dir, meta))
+
+    return sorted(entries, key=lambda entry: entry[1]['last_used'], reverse=True)
+
+
+def evict_entries(cache_dir, max_bytes, keep=None):
+    """
+    Removes the least recently used entries until the cache fits in max_bytes
+    :param keep: (optional) entry directory that is never removed, i.e. the one just written
+    :return: number of entries removed
+    """
+
+    entries = list_entries(cache_dir=cache_dir)
+    total_bytes = sum(meta['bytes'] for entry_dir, meta in entries)
+    removed = 0
+
+    for entry_dir, meta in reversed(entries):
+
+        if total_bytes <= max_bytes:
+            break
+
+        if entry_dir == keep:
+            continue
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total_bytes -= meta['bytes']
+        removed += 1
+
+    return removed
+
+
+def clear_cache(cache_dir):
+    """
+    :return: tuple (number of entries removed, bytes freed)
+    """
+
+    entries = list_entries(cache_dir=cache_dir)
+
+    for entry_dir, meta in entries:
+        shutil.rmtree(entry_dir, ignore_errors=True)
+
+    # leftovers of writes that were interrupted
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if name.startswith('.tmp-'):
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+    return len(entries), sum(meta['bytes'] for entry_dir, meta in entries)
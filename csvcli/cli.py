@@ -1,13 +1,43 @@
+import os
+import sys
 import click
-from csvcli.functions import *
-from show.show import *
-import curses
+from csvcli.files import get_filename, get_file_extension, get_format_from_file_extension, get_new_filepath, \
+    sniff_delimiter, is_valid_delimiter, get_col_list
+
+# pandas, pyarrow and the rest of the heavy modules are imported by the commands that use them,
+# so the arguments are checked and --help is shown without waiting for them to load
+
+
+# number of rows used to infer the data types of CSV and excel files
+DTYPE_SAMPLE_ROWS = 10000
+
+# commands that read the whole file, so with --cache they write the cached copy when there is none yet.
+# the others only use it when it is already there
+CACHE_BUILD_COMMANDS = ['show', 'tail', 'columns', 'describe', 'null-counts', 'value-counts', 'select', 'query']
+
+# commands that read the file, so they are sent to the server started with `csvcli serve` when there is one
+SERVE_COMMANDS = CACHE_BUILD_COMMANDS + ['head']
+
+# commands that go through the whole file, so the server loads it to keep it for the next ones. The others have their
+# own fast paths and only use it once it is loaded
+PRELOAD_COMMANDS = ['describe', 'null-counts', 'value-counts', 'select', 'query']
+
+# files kept in memory by the server, handed to the commands it runs. See csvcli/server.py
+RESIDENT_DFS = {}
 
 
 class CommonContext:
 
-    def __init__(self, filepath, delimiter):
+    def __init__(self, filepath, delimiter, workers=None, compact=False, output=None, cache=False, cache_hash=False,
+                 build_cache=False):
         self.filepath = filepath
+        self.workers = workers
+        self.compact = compact
+        self.cache = cache or cache_hash
+        self.cache_hash = cache_hash
+
+        # results are browsed in the terminal, but written as text when they go to a pipe or a file
+        self.output = output if output is not None else ('table' if sys.stdout.isatty() else 'plain')
 
         if not os.path.exists(self.filepath):
             click.echo(f"\nOuch! Could not find '{self.filepath}'")
@@ -19,11 +49,31 @@ class CommonContext:
         self.format = get_format_from_file_extension(file_extension=self.file_extension)
         self.delimiter = None
         self.is_delimiter_a_guess = None
+        self.delimiter_confidence = None
+
+        cache_entry = None
+        fingerprint = None
+
+        if (cache or cache_hash) and self.format in ['csv', 'excel']:
 
-        if self.format == 'csv':
+            from csvcli.cache import get_file_fingerprint
+
+            fingerprint = get_file_fingerprint(filepath=self.filepath, content_hash=cache_hash)
+            cache_entry = self.read_cache_entry(fingerprint=fingerprint)
+
+            # a delimiter given with -d that differs from the cached one means the file has to be parsed again
+            if cache_entry is not None and delimiter is not None and delimiter != cache_entry['delimiter']:
+                cache_entry = None
+
+        if cache_entry is not None:
+            self.delimiter = cache_entry['delimiter']
+            self.is_delimiter_a_guess = cache_entry['is_delimiter_a_guess']
+            self.delimiter_confidence = cache_entry['delimiter_confidence']
+
+        elif self.format == 'csv':
 
             if delimiter is None:
-                guessed_delimiter = guess_delimiter(filepath=filepath)
+                guessed_delimiter, confidence = sniff_delimiter(filepath=filepath)
 
                 if guessed_delimiter is None:
                     click.echo(f"Ouch! We could not guess the delimiter of {filepath}, please use the '-d' option input a delimiter")
@@ -31,6 +81,7 @@ class CommonContext:
                 else:
                     self.is_delimiter_a_guess = True
                     self.delimiter = guessed_delimiter
+                    self.delimiter_confidence = confidence
 
             else:
                 if is_valid_delimiter(delimiter=delimiter, filepath=filepath):
@@ -43,13 +94,294 @@ class CommonContext:
         else:
             self.delimiter = None
 
-        self.df = read_file_to_df(filepath=self.filepath, format=self.format, delimiter=self.delimiter)
+        if fingerprint is not None and cache_entry is None and build_cache:
+            cache_entry = self.write_cache_entry(fingerprint=fingerprint)
+
+        # the data is read from the cached parquet copy when there is one, the original file is still the one
+        # shown, converted or indexed
+        self.data_filepath = self.filepath
+        self.data_format = self.format
+        self.data_delimiter = self.delimiter
+
+        if cache_entry is not None and cache_entry['status'] == 'ok':
+            self.data_filepath = cache_entry['data_filepath']
+            self.data_format = 'parquet'
+            self.data_delimiter = None
+
+        # the data is only read from disk once a command asks for it
+        self._df = RESIDENT_DFS.get(self.get_resident_key())
+        self._columns = None
+        self._row_count = None
+        self._fingerprint = fingerprint
+
+    def get_resident_key(self):
+        """
+        What tells apart the ways the file can be loaded, for the server to keep them
+        """
+
+        return os.path.abspath(self.filepath), self.data_filepath, self.delimiter, self.compact
+
+    def is_loaded(self):
+        """
+        True if the file is already in memory, then commands use it instead of reading the file
+        """
+
+        return self._df is not None
+
+    def get_fingerprint(self):
+        """
+        What identifies the current version of the file in the cache
+        """
+
+        from csvcli.cache import get_file_fingerprint
+
+        if self._fingerprint is None:
+            self._fingerprint = get_file_fingerprint(filepath=self.filepath, content_hash=self.cache_hash)
+
+        return self._fingerprint
+
+    def read_cache_entry(self, fingerprint):
+        """
+        Cached copy of the file, if any. See csvcli/cache.py
+        """
+
+        from csvcli.cache import get_cache_dir, read_entry
+
+        return read_entry(cache_dir=get_cache_dir(), fingerprint=fingerprint)
+
+    def write_cache_entry(self, fingerprint):
+        """
+        Parses the full file into the cache, along with how it was parsed
+        """
+
+        from csvcli.cache import get_cache_dir, write_entry
+        from csvcli.functions import DEFAULT_CHUNK_ROWS, iter_file_chunks
+
+        def get_chunks():
+            # one row group per chunk, so filters on the copy can skip them
+            return iter_file_chunks(filepath=self.filepath, format=self.format, delimiter=self.delimiter,
+                                    chunk_rows=DEFAULT_CHUNK_ROWS, workers=self.workers)
+
+        return write_entry(cache_dir=get_cache_dir(),
+                           fingerprint=fingerprint,
+                           get_chunks=get_chunks,
+                           info={'delimiter': self.delimiter,
+                                 'is_delimiter_a_guess': self.is_delimiter_a_guess,
+                                 'delimiter_confidence': self.delimiter_confidence})
+
+    @property
+    def df(self):
+        """
+        Full contents of the file, read on first access
+        """
+
+        from csvcli.functions import get_compact_df, read_file_to_df
+
+        if self._df is None:
+            self._df = read_file_to_df(filepath=self.data_filepath, format=self.data_format, delimiter=self.data_delimiter,
+                                       workers=self.workers)
+
+            if self.compact:
+                self._df = get_compact_df(df=self._df)
+
+        return self._df
+
+    def get_schema(self):
+        """
+        Column names of the file, read from the header or metadata only
+        """
+
+        from csvcli.functions import read_file_columns
+
+        if self._columns is None:
+            if self._df is not None:
+                self._columns = self._df.columns.tolist()
+            else:
+                self._columns = read_file_columns(filepath=self.data_filepath, format=self.data_format, delimiter=self.data_delimiter)
+
+        return self._columns
+
+    def get_head(self, n):
+        """
+        First n rows of the file, only those are read if the file is not loaded yet
+        """
+
+        from csvcli.functions import read_file_head
+
+        if self._df is not None:
+            return self._df.head(n)
+
+        return read_file_head(filepath=self.data_filepath, format=self.data_format, delimiter=self.data_delimiter, n=n)
+
+    def assert_columns(self, col_list):
+
+        for col in col_list:
+            if col not in self.get_schema():
+                click.echo(f"Ouch! Column '{col}' does not seem to exist...")
+                sys.exit(0)
+
+    def iter_chunks(self, col_list=None, chunk_rows=None, where=None):
+        """
+        Subset of columns of the file as a sequence of DataFrames, so it never has to be fully in memory.
+        Parquet row groups where the where condition can not be true are skipped, the rows are not filtered
+        """
+
+        from csvcli.functions import DEFAULT_CHUNK_ROWS, iter_file_chunks
+
+        if col_list is not None:
+            self.assert_columns(col_list=col_list)
+
+        if self._df is not None:
+            yield self._df if col_list is None else self._df[col_list]
+            return
+
+        yield from iter_file_chunks(filepath=self.data_filepath, format=self.data_format, delimiter=self.data_delimiter,
+                                    chunk_rows=chunk_rows if chunk_rows is not None else DEFAULT_CHUNK_ROWS,
+                                    columns=col_list, workers=self.workers, where=where)
+
+    def is_arrow_native(self):
+        """
+        True if the file can be handled as Arrow tables from reader to writer, see iter_tables
+        """
+
+        # compact dtypes are pandas ones, so they need the pandas path
+        return self.data_format == 'parquet' and not self.compact and not self.is_loaded()
+
+    def iter_tables(self, col_list=None, chunk_rows=None, where=None):
+        """
+        Subset of columns of a parquet file as a sequence of Arrow tables, so nothing is converted to pandas.
+        Row groups where the where condition can not be true are skipped, the rows are not filtered
+        """
+
+        from csvcli.functions import iter_parquet_tables
+
+        if col_list is not None:
+            self.assert_columns(col_list=col_list)
+
+        return iter_parquet_tables(filepath=self.data_filepath, chunk_rows=chunk_rows, columns=col_list, where=where)
+
+    def get_columns(self, col_list=None, where=None):
+        """
+        Subset of columns of the file, in the given order, all of them without col_list.
+        Parquet row groups where the where condition can not be true are skipped, the rows are not filtered
+        """
+
+        from csvcli.functions import get_compact_df, read_file_to_df
+
+        if col_list is not None:
+            self.assert_columns(col_list=col_list)
+
+        if self._df is not None or (col_list is None and where is None):
+            return self.df if col_list is None else self.df[col_list]
+
+        # only the requested columns are parsed
+        df = read_file_to_df(filepath=self.data_filepath, format=self.data_format, delimiter=self.data_delimiter, columns=col_list,
+                             workers=self.workers, where=where)
+
+        return get_compact_df(df=df) if self.compact else df
+
+    def get_row_source(self):
+        """
+        Rows of the file read on demand, one page at a time, when the format allows it
+        """
+
+        from csvcli.functions import read_csv_index
+        from csvcli.rows import CsvRowSource, DataFrameRowSource, ParquetRowSource
+
+        if self._df is not None or self.data_format == 'excel':
+            return DataFrameRowSource(self.df)
+
+        if self.data_format == 'parquet':
+            return ParquetRowSource(filepath=self.data_filepath)
+
+        # with an up to date index any row of a CSV file is one seek away
+        return CsvRowSource(filepath=self.data_filepath, delimiter=self.data_delimiter, index=read_csv_index(filepath=self.data_filepath))
+
+    def get_row_count(self, exact=False):
+        """
+        Number of rows of the file, from metadata or a new line count when possible.
+        With exact the file is fully loaded if that is the only way to know it, otherwise None is returned
+        """
+
+        from csvcli.functions import read_file_row_count
+
+        if self._row_count is None:
+            if self._df is not None or exact:
+                self._row_count = self.df.shape[0]
+            else:
+                self._row_count = read_file_row_count(filepath=self.data_filepath, format=self.data_format)
+
+        return self._row_count
+
+    def get_dtypes(self, exact=False):
+        """
+        Column names and data types of the file, from metadata or a sample of the rows unless exact is set
+        """
+
+        from csvcli.functions import get_dtypes, read_parquet_dtypes
+
+        if self._df is not None or exact:
+            return get_dtypes(df=self.df, pretty=True)
+
+        if self.data_format == 'parquet':
+            return read_parquet_dtypes(filepath=self.data_filepath)
+
+        return get_dtypes(df=self.get_head(n=DTYPE_SAMPLE_ROWS), pretty=True)
+
+    def get_summary_stats(self, exact=False, chunk_rows=None):
+        """
+        Summary statistics of the numeric columns, in one pass with approximate percentiles unless exact is set
+        """
+
+        from csvcli.functions import get_numeric_columns, get_parquet_summary_stats, get_summary_stats, \
+            get_summary_stats_in_chunks, read_parquet_numeric_columns
+
+        if self._df is not None or exact:
+            return get_summary_stats(df=self.df)
+
+        if self.data_format == 'parquet':
+            columns = read_parquet_numeric_columns(filepath=self.data_filepath)
+        else:
+            columns = get_numeric_columns(df=self.get_head(n=DTYPE_SAMPLE_ROWS))
+
+        # describe() falls back to text columns when there are no numeric ones
+        if len(columns) == 0:
+            return get_summary_stats(df=self.df)
+
+        if self.data_format == 'parquet':
+            return get_parquet_summary_stats(filepath=self.data_filepath, columns=columns, workers=self.workers)
+
+        df = get_summary_stats_in_chunks(chunks=self.iter_chunks(col_list=columns, chunk_rows=chunk_rows), columns=columns)
+
+        # i.e. every column picked from the first rows holds text further down
+        if len(df.columns) == 0:
+            return get_summary_stats(df=self.df)
+
+        return df
+
+    def get_null_counts(self, chunk_rows=None):
+        """
+        Counts of null values per column, from the parquet statistics or in one pass over the file
+        """
+
+        from csvcli.functions import get_null_columns, get_null_columns_in_chunks, read_parquet_null_counts
+
+        if self._df is not None:
+            return get_null_columns(df=self.df)
+
+        if self.data_format == 'parquet':
+            return read_parquet_null_counts(filepath=self.data_filepath)
+
+        return get_null_columns_in_chunks(chunks=self.iter_chunks(chunk_rows=chunk_rows))
 
     def display_info_header(self):
         click.echo(f"\nFilename: {self.full_filename}")
         if self.format == 'csv' and self.delimiter != ',' and self.is_delimiter_a_guess:
-            click.echo(f"Infered CSV Delimiter: '{self.delimiter}'")
-        click.echo(f"\nTotal number of rows: {self.df.shape[0]}\n")
+            click.echo(f"Infered CSV Delimiter: '{self.delimiter}' (confidence: {self.delimiter_confidence:.0%})")
+
+        row_count = self.get_row_count()
+        if row_count is not None:
+            click.echo(f"\nTotal number of rows: {row_count}\n")
 
 
 @click.group()
@@ -57,7 +389,12 @@ class CommonContext:
 @click.pass_context
 @click.argument("filepath", type=str, required=True)
 @click.option("-d", "--delimiter", type=str, help="(optional) Only for CSV files. If you want to override the automatic guess. Must be a 1-character string.")
-def cli(common_ctx, filepath, delimiter):
+@click.option("-w", "--workers", type=int, help="(optional) Number of processes used to read large CSV files and parquet row groups. Defaults to the number of cores")
+@click.option("--compact", is_flag=True, help="Load the file with the smallest data types that hold its values, for files that barely fit in memory")
+@click.option("-o", "--output", type=click.Choice(['table', 'plain', 'csv', 'tsv', 'jsonl', 'markdown']), help="(optional) How results are shown. 'table' browses them in the terminal, the others write them to stdout. Defaults to 'table', or 'plain' when stdout is not a terminal")
+@click.option("--cache", is_flag=True, envvar="CSVCLI_CACHE", help="Keep a parsed copy of CSV and excel files on disk, so the next commands on the same file skip parsing it. See 'csvcli cache --help'")
+@click.option("--cache-hash", is_flag=True, envvar="CSVCLI_CACHE_HASH", help="Like --cache, but the copy is also matched by a hash of the file contents instead of trusting its modification time")
+def cli(common_ctx, filepath, delimiter, workers, compact, output, cache, cache_hash):
     """
 
     WELCOME to csvcli, a simple command-line interface to work with CSV, excel and parquet files.
@@ -75,7 +412,35 @@ def cli(common_ctx, filepath, delimiter):
 
     """
 
-    common_ctx.obj = CommonContext(filepath, delimiter)
+    common_ctx.obj = CommonContext(filepath, delimiter, workers, compact, output, cache, cache_hash,
+                                   build_cache=common_ctx.invoked_subcommand in CACHE_BUILD_COMMANDS)
+
+
+def display(common_ctx, display_type, df=None, chunks=None, **kwargs):
+    """
+    Browses a result in the terminal, or writes it to stdout when another output was chosen
+    :param chunks: (optional) iterable of Pandas DataFrames written one at a time instead of df, only for stdout
+    :param kwargs: other arguments of display_full_table, i.e. the RowSource to browse as rows
+    """
+
+    if common_ctx.obj.output == 'table':
+
+        import curses
+        from show.show import display_full_table
+
+        curses.wrapper(display_full_table,
+                       full_filename=common_ctx.obj.full_filename,
+                       format=common_ctx.obj.format,
+                       is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
+                       delimiter=common_ctx.obj.delimiter,
+                       delimiter_confidence=common_ctx.obj.delimiter_confidence,
+                       df=df, display_type=display_type, **kwargs)
+
+    else:
+
+        from show.output import write_output
+
+        write_output(chunks=chunks if chunks is not None else [df], output=common_ctx.obj.output)
 
 
 """
@@ -85,17 +450,29 @@ EXPLORE YOUR DATA
 
 @cli.command()
 @click.pass_context
-def show(common_ctx):
+@click.option("--rows", "row_range", type=str, help="(optional) Range of rows to display i.e. '1000000:1000100'")
+def show(common_ctx, row_range):
     """
     Displays the full contents of the CSV, Excel or Apache Parquet file.
     """
 
-    curses.wrapper(display_full_table,
-                   full_filename=common_ctx.obj.full_filename,
-                   format=common_ctx.obj.format,
-                   is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
-                   delimiter=common_ctx.obj.delimiter,
-                   df=common_ctx.obj.df, display_type="all")
+    from csvcli.functions import parse_row_range
+
+    if row_range is not None:
+
+        start, stop = parse_row_range(rows=row_range)
+        source = common_ctx.obj.get_row_source()
+        df = source.get_rows(start, stop if stop is not None else source.get_row_count())
+
+        display(common_ctx, df=df, display_type="rows")
+        return
+
+    if common_ctx.obj.output != 'table':
+        # the file is written as it is read, so it never has to fit in memory
+        display(common_ctx, chunks=common_ctx.obj.iter_chunks(), display_type="all")
+        return
+
+    display(common_ctx, df=None, rows=common_ctx.obj.get_row_source(), display_type="all")
 
 
 @cli.command()
@@ -106,65 +483,77 @@ def head(common_ctx, rowcount):
     Displays only the first rows of the file.
     """
 
-    common_ctx.obj.df = filter_df(df=common_ctx.obj.df, head=True, n=rowcount).copy()
+    df = common_ctx.obj.get_head(n=rowcount)
 
-    curses.wrapper(display_full_table,
-                   full_filename=common_ctx.obj.full_filename,
-                   format=common_ctx.obj.format,
-                   is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
-                   delimiter=common_ctx.obj.delimiter,
-                   df=common_ctx.obj.df, display_type="head")
+    display(common_ctx, df=df, display_type="head")
 
 
 @cli.command()
 @click.pass_context
-def columns(common_ctx):
+@click.argument("rowcount", type=int, default=5, required=False)
+def tail(common_ctx, rowcount):
+    """
+    Displays only the last rows of the file.
+    """
+
+    source = common_ctx.obj.get_row_source()
+    row_count = source.get_row_count()
+
+    df = source.get_rows(max(row_count - rowcount, 0), row_count)
+
+    display(common_ctx, df=df, display_type="tail")
+
+
+@cli.command()
+@click.pass_context
+@click.option("--exact", is_flag=True, help="Scan the full file to get the data types and row count instead of using metadata and a sample of rows")
+@click.option("--memory", is_flag=True, help="Load the full file and show the memory taken by every column, as loaded and with --compact")
+def columns(common_ctx, exact, memory):
     """
     Displays the column names and data types of the file.
     """
 
-    common_ctx.obj.df = get_dtypes(df=common_ctx.obj.df, pretty=True)
+    from csvcli.functions import get_memory_report
+
+    if memory:
+
+        # the report compares with the default data types, so the file is not loaded compact
+        common_ctx.obj.compact = False
+
+        display(common_ctx, df=get_memory_report(df=common_ctx.obj.df), display_type="memory")
+        return
+
+    df = common_ctx.obj.get_dtypes(exact=exact)
+    row_count = common_ctx.obj.get_row_count(exact=exact)
 
-    curses.wrapper(display_full_table,
-                   full_filename=common_ctx.obj.full_filename,
-                   format=common_ctx.obj.format,
-                   is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
-                   delimiter=common_ctx.obj.delimiter,
-                   df=common_ctx.obj.df, display_type="columns")
+    display(common_ctx, df=df, display_type="columns", row_count=row_count)
 
 
 @cli.command()
 @click.pass_context
-def describe(common_ctx):
+@click.option("--exact", is_flag=True, help="Load the full file to compute exact percentiles instead of approximate ones")
+@click.option("--chunk-rows", type=int, help="(optional) Number of rows processed at a time. Defaults to 100000")
+def describe(common_ctx, exact, chunk_rows):
     """
     Displays a table with summary statistics.
     """
 
-    common_ctx.obj.df = get_summary_stats(df=common_ctx.obj.df)
+    df = common_ctx.obj.get_summary_stats(exact=exact, chunk_rows=chunk_rows)
 
-    curses.wrapper(display_full_table,
-                   full_filename=common_ctx.obj.full_filename,
-                   format=common_ctx.obj.format,
-                   is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
-                   delimiter=common_ctx.obj.delimiter,
-                   df=common_ctx.obj.df, display_type="describe")
+    display(common_ctx, df=df, display_type="describe")
 
 
 @cli.command()
 @click.pass_context
-def null_counts(common_ctx):
+@click.option("--chunk-rows", type=int, help="(optional) Number of rows processed at a time. Defaults to 100000")
+def null_counts(common_ctx, chunk_rows):
     """
     Displays the counts of null values per column.
     """
 
-    common_ctx.obj.df = get_null_columns(df=common_ctx.obj.df)
+    df = common_ctx.obj.get_null_counts(chunk_rows=chunk_rows)
 
-    curses.wrapper(display_full_table,
-                   full_filename=common_ctx.obj.full_filename,
-                   format=common_ctx.obj.format,
-                   is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
-                   delimiter=common_ctx.obj.delimiter,
-                   df=common_ctx.obj.df, display_type="null_counts")
+    display(common_ctx, df=df, display_type="null_counts")
 
 
 
@@ -173,27 +562,37 @@ def null_counts(common_ctx):
 @cli.command()
 @click.pass_context
 @click.option("-c", "--column", type=str, help="Name of column to count the unique values for")
-def value_counts(common_ctx, column):
+@click.option("--approx", is_flag=True, help="Only find the most frequent values, with bounded memory. For columns with too many unique values")
+@click.option("--top", type=int, default=20, help="Number of most frequent values to find with --approx. Defaults to 20")
+@click.option("--chunk-rows", type=int, help="(optional) Number of rows counted at a time. Defaults to 100000")
+def value_counts(common_ctx, column, approx, top, chunk_rows):
     """
     Displays the unique values in a column
     """
 
+    from csvcli.functions import get_approx_value_counts, get_value_counts_in_chunks
+
     if column is None:
         click.echo("Ouch! You forgot to indicate the column. Please use the -c option to do so")
         sys.exit(0)
 
-    elif column not in common_ctx.obj.df.columns:
+    elif column not in common_ctx.obj.get_schema():
         click.echo(f"Ouch! The column '{column}' does not seem to be present in '{common_ctx.obj.filepath}'")
         sys.exit(0)
 
-    common_ctx.obj.df = get_value_counts(df=common_ctx.obj.df, column=column)
+    # only the column is read, chunk by chunk
+    chunks = common_ctx.obj.iter_chunks(col_list=[column], chunk_rows=chunk_rows)
+
+    if approx:
+        df, error = get_approx_value_counts(chunks=chunks, column=column, top=top)
+        display_type = "value_counts_approx"
 
-    curses.wrapper(display_full_table,
-                   full_filename=common_ctx.obj.full_filename,
-                   format=common_ctx.obj.format,
-                   is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
-                   delimiter=common_ctx.obj.delimiter,
-                   df=common_ctx.obj.df, display_type="value_counts")
+    else:
+        df = get_value_counts_in_chunks(chunks=chunks, column=column)
+        error = None
+        display_type = "value_counts"
+
+    display(common_ctx, df=df, display_type=display_type, count_error=error)
 
 
 """
@@ -206,28 +605,144 @@ FILTER AND QUERY
 @click.option("-c", "--columns", type=str, help="Names of selected columns to show separated by commas")
 @click.option("-s", "--sort-by", type=str, help="Name of column to sort by")
 @click.argument("order", type=str, default="ASC", required=False)
+@click.option("-l", "--limit", type=int, help="(optional) Maximum number of rows in the result")
+@click.option("-f", "--filter", "condition", type=str, help="(optional) SQL condition the rows must meet i.e. \"country = 'ES' AND units > 10\"")
 @click.option("-save", "--save-to", type=str, help="Path to the destination file i.e. 'myfiles/data.csv'. The file extension determines output format")
-def select(common_ctx, columns, sort_by, order, save_to):
+@click.option("--chunk-rows", type=int, help="(optional) Number of rows read and sorted in memory at a time. Defaults to 100000")
+def select(common_ctx, columns, sort_by, order, limit, condition, save_to, chunk_rows):
 
     """
     Allows you to display subsets of columns and sort.
     """
 
+    from csvcli.functions import filter_df, filter_df_by_condition, filter_table_by_condition, get_ascending, \
+        get_filter_columns, get_first_rows, iter_first_table_rows, output_to_file, parse_filter, write_chunks_to_file, \
+        write_tables_to_file
+    from csvcli.sort import get_top_rows, iter_sorted_chunks
+
     if columns is None:
         click.echo("Ouch! You forgot to indicate the columns, Please use the -c option to do so")
         sys.exit(0)
 
-    common_ctx.obj.df = filter_df(df=common_ctx.obj.df, columns=columns, sort_by=sort_by, order=order).copy()
+    col_list = get_col_list(col_string=columns)
+
+    # the sort column has to be read too, even if it is not selected
+    if sort_by is not None and sort_by not in col_list:
+        col_list.append(sort_by)
+
+    common_ctx.obj.assert_columns(col_list=col_list)
+
+    filter_text = condition
+
+    if condition is not None:
+        condition = parse_filter(condition=condition)
+        col_list += [col for col in get_filter_columns(condition=condition, columns=common_ctx.obj.get_schema())
+                     if col not in col_list]
+
+    def iter_chunks():
+
+        # parquet row groups the filter rules out are not even read
+        chunks = common_ctx.obj.iter_chunks(col_list=col_list, chunk_rows=chunk_rows, where=condition)
+
+        if condition is None:
+            return chunks
+
+        return (filter_df_by_condition(df=chunk, condition=condition, filter_text=filter_text)
+                for chunk in chunks)
+
+    # results written to stdout are streamed as chunks when they do not have to be built whole
+    df = None
+    chunks = None
+
+    if sort_by is None and common_ctx.obj.is_arrow_native():
+
+        # the rows are projected, filtered and limited in Arrow, only what is displayed is converted to pandas
+        tables = common_ctx.obj.iter_tables(col_list=col_list, chunk_rows=chunk_rows, where=condition)
+
+        if condition is not None:
+            tables = (filter_table_by_condition(table=table, condition=condition, filter_text=filter_text)
+                      for table in tables)
+
+        tables = (table.select(get_col_list(col_string=columns)) for table in tables)
+
+        if limit is not None:
+            tables = iter_first_table_rows(tables=tables, n=limit)
+
+        if save_to is not None:
+
+            file_ext = get_file_extension(save_to)
+            format = get_format_from_file_extension(file_extension=file_ext)
+
+            success = write_tables_to_file(tables=tables, filepath=save_to, desired_format=format)
+
+            if success:
+                click.echo(f"successfully exported your selection result into {save_to}")
+            else:
+                click.echo(f"Ouch! Something went wrong. We could not export your selection result")
+
+            return
+
+        if common_ctx.obj.output != 'table':
+            chunks = (table.to_pandas() for table in tables)
+        else:
+            import pyarrow as pa
+            df = pa.concat_tables(list(tables)).to_pandas()
+
+    elif sort_by is not None and limit is not None:
+
+        # only the top rows are kept while reading, the full sorted result is never built
+        df = filter_df(df=get_top_rows(chunks=iter_chunks(), sort_by=sort_by, ascending=get_ascending(order=order),
+                                       n=limit),
+                       columns=columns)
+
+    elif sort_by is not None and save_to is not None:
+
+        # large files are sorted in chunks spilled to disk and merged straight into the destination file
+        chunks = iter_chunks()
+        sorted_chunks = iter_sorted_chunks(chunks=chunks, sort_by=sort_by, ascending=get_ascending(order=order))
+
+        file_ext = get_file_extension(save_to)
+        format = get_format_from_file_extension(file_extension=file_ext)
+
+        success = write_chunks_to_file(chunks=(filter_df(df=chunk, columns=columns) for chunk in sorted_chunks),
+                                       filepath=save_to,
+                                       desired_format=format)
+
+        if success:
+            click.echo(f"successfully exported your selection result into {save_to}")
+        else:
+            click.echo(f"Ouch! Something went wrong. We could not export your selection result")
+
+        return
+
+    elif sort_by is not None and save_to is None and common_ctx.obj.output != 'table':
+
+        # the result is sorted like when saving it, in chunks spilled to disk, and written as it is merged
+        sorted_chunks = iter_sorted_chunks(chunks=iter_chunks(), sort_by=sort_by, ascending=get_ascending(order=order))
+        chunks = (filter_df(df=chunk, columns=columns) for chunk in sorted_chunks)
+
+    elif limit is not None and condition is None:
+        df = filter_df(df=common_ctx.obj.get_head(n=limit), columns=columns)
+
+    elif limit is not None:
+        # the file is only read until enough rows meet the filter
+        df = filter_df(df=get_first_rows(chunks=iter_chunks(), n=limit), columns=columns)
+
+    elif save_to is None and common_ctx.obj.output != 'table':
+        chunks = (filter_df(df=chunk, columns=columns) for chunk in iter_chunks())
+
+    else:
+        df = common_ctx.obj.get_columns(col_list=col_list, where=condition)
+
+        if condition is not None:
+            df = filter_df_by_condition(df=df, condition=condition, filter_text=filter_text)
+
+        df = filter_df(df=df, columns=columns, sort_by=sort_by, order=order)
 
     # we show result on screen if not save selected
     if save_to is None:
 
-        curses.wrapper(display_full_table,
-                       full_filename=common_ctx.obj.full_filename,
-                       format=common_ctx.obj.format,
-                       is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
-                       delimiter=common_ctx.obj.delimiter,
-                       df=common_ctx.obj.df, display_type="select")
+        display(common_ctx, df=df, chunks=chunks, display_type="select")
 
     # if save selected, do not show result on screen, just write to file and confirm
     else:
@@ -235,7 +750,7 @@ def select(common_ctx, columns, sort_by, order, save_to):
         file_ext = get_file_extension(save_to)
         format = get_format_from_file_extension(file_extension=file_ext)
 
-        success = output_to_file(df=common_ctx.obj.df,
+        success = output_to_file(df=df,
                                  filepath=save_to,
                                  desired_format=format)
 
@@ -249,33 +764,88 @@ def select(common_ctx, columns, sort_by, order, save_to):
 @click.pass_context
 @click.option("-q", "--query", type=str, help="SQL query you want to run against the file")
 @click.option("-save", "--save-to", type=str, help="Path to the destination file i.e. 'myfiles/data.csv'. The file extension determines output format")
-def query(common_ctx, query, save_to):
+@click.option("--no-cache", is_flag=True, help="With --cache, run the query even if its result is cached, and do not cache the new result")
+def query(common_ctx, query, save_to, no_cache):
 
     """
     Allows you to query the file using SQL queries.
     """
 
-    common_ctx.obj.df = filter_df_by_query(df=common_ctx.obj.df, query=query).copy()
+    from csvcli.functions import get_query_columns, output_to_file, query_file_in_chunks, iter_query_in_chunks, \
+        save_query_in_chunks
+
+    query_columns = get_query_columns(query=query, columns=common_ctx.obj.get_schema())
+
+    # with --cache, a query that already ran on this version of the file only reads its result
+    use_cache = common_ctx.obj.cache and not no_cache
+    cached_df = read_query_result(common_ctx=common_ctx, query=query) if use_cache else None
 
     # we show result on screen if not save selected
     if save_to is None:
 
-        curses.wrapper(display_full_table,
-                       full_filename=common_ctx.obj.full_filename,
-                       format=common_ctx.obj.format,
-                       is_delimiter_a_guess=common_ctx.obj.is_delimiter_a_guess,
-                       delimiter=common_ctx.obj.delimiter,
-                       df=common_ctx.obj.df, display_type="query", query=query)
+        df = cached_df
+        chunks = None
+
+        # queries that only filter rows run chunk by chunk and stop reading once their LIMIT is met
+        if df is None and common_ctx.obj.is_loaded():
+            df = run_query(common_ctx=common_ctx, query=query, query_columns=query_columns)
+
+        elif df is None and common_ctx.obj.output != 'table':
+            # written to stdout, every chunk of the result goes out as soon as it is ready
+            chunks = iter_query_in_chunks(filepath=common_ctx.obj.data_filepath,
+                                          format=common_ctx.obj.data_format,
+                                          delimiter=common_ctx.obj.data_delimiter,
+                                          query=query,
+                                          columns=query_columns,
+                                          workers=common_ctx.obj.workers)
+        elif df is None:
+            df = query_file_in_chunks(filepath=common_ctx.obj.data_filepath,
+                                      format=common_ctx.obj.data_format,
+                                      delimiter=common_ctx.obj.data_delimiter,
+                                      query=query,
+                                      columns=query_columns,
+                                      workers=common_ctx.obj.workers)
+
+        if df is None and chunks is None:
+            df = run_query(common_ctx=common_ctx, query=query, query_columns=query_columns)
+
+        # results streamed to stdout are never whole, so they are not cached
+        if df is not None and cached_df is None and use_cache:
+            write_query_result(common_ctx=common_ctx, query=query, df=df)
+
+        display(common_ctx, df=df, chunks=chunks, display_type="query", query=query)
 
     # if save selected, do not show result on screen, just write to file and confirm
     else:
 
-        file_ext = get_file_extension(save_to)
-        format = get_format_from_file_extension(file_extension=file_ext)
+        success = None
 
-        success = output_to_file(df=common_ctx.obj.df,
-                                 filepath=save_to,
-                                 desired_format=format)
+        # every chunk of the result is written as soon as it is ready
+        if cached_df is None and not common_ctx.obj.is_loaded():
+            success = save_query_in_chunks(filepath=common_ctx.obj.data_filepath,
+                                           format=common_ctx.obj.data_format,
+                                           delimiter=common_ctx.obj.data_delimiter,
+                                           query=query,
+                                           save_to=save_to,
+                                           columns=query_columns,
+                                           workers=common_ctx.obj.workers)
+
+        if not success:
+
+            df = cached_df
+
+            if df is None:
+                df = run_query(common_ctx=common_ctx, query=query, query_columns=query_columns)
+
+                if use_cache:
+                    write_query_result(common_ctx=common_ctx, query=query, df=df)
+
+            file_ext = get_file_extension(save_to)
+            format = get_format_from_file_extension(file_extension=file_ext)
+
+            success = output_to_file(df=df,
+                                     filepath=save_to,
+                                     desired_format=format)
 
         if success:
             click.echo(f"successfully exported your query result into {save_to}")
@@ -284,6 +854,73 @@ def query(common_ctx, query, save_to):
             click.echo(f"Ouch! Something went wrong. We could not export your query result")
 
 
+def run_query(common_ctx, query, query_columns):
+
+    from csvcli.functions import filter_df_by_query, get_query_where
+
+    # parquet row groups the WHERE clause rules out are not read
+    where = get_query_where(query=query) if common_ctx.obj.data_format == 'parquet' else None
+
+    return filter_df_by_query(df=common_ctx.obj.get_columns(col_list=query_columns, where=where), query=query)
+
+
+def get_query_fingerprint(common_ctx, query):
+
+    from csvcli.sql import ENGINE_VERSION, normalize_query
+
+    # the same query gives other results when the file is parsed differently or by another version of the engine
+    return {**common_ctx.obj.get_fingerprint(),
+            'delimiter': common_ctx.obj.delimiter,
+            'compact': common_ctx.obj.compact,
+            'engine': ENGINE_VERSION,
+            'query': normalize_query(query)}
+
+
+def read_query_result(common_ctx, query):
+    """
+    Result of the same query on the same version of the file, if it is cached
+    :return: Pandas DataFrame, None if there is none
+    """
+
+    import pandas as pd
+    from csvcli.cache import get_cache_dir, read_entry
+    from csvcli.sql import get_query_column_names
+
+    entry = read_entry(cache_dir=get_cache_dir(), fingerprint=get_query_fingerprint(common_ctx=common_ctx, query=query))
+
+    if entry is None or entry['status'] != 'ok':
+        return None
+
+    df = pd.read_parquet(entry['data_filepath'])
+
+    # columns without an alias are named after their expression as it is written, which may have changed
+    if entry['query'] != query:
+
+        # the columns of the file as queries see them
+        columns = [str(col).replace(' ', '_') for col in common_ctx.obj.get_schema()]
+        names = get_query_column_names(query=query, columns=columns)
+
+        if names is None or (None in names and any(name is not None for name in names)):
+            return None
+
+        if None not in names:
+            if len(names) != df.shape[1]:
+                return None
+            df.columns = names
+
+    return df
+
+
+def write_query_result(common_ctx, query, df):
+
+    from csvcli.cache import get_cache_dir, write_entry
+
+    write_entry(cache_dir=get_cache_dir(),
+                fingerprint=get_query_fingerprint(common_ctx=common_ctx, query=query),
+                get_chunks=lambda: [df],
+                info={'query': query})
+
+
 """
 CHANGE THE FORMAT
 """
@@ -293,21 +930,40 @@ CHANGE THE FORMAT
 @click.pass_context
 @click.option("-to", "--format", type=str, help="Output format. Options: 'csv', 'excel' or 'parquet'")
 @click.option("-D", "--delimiter", type=str, help="(optional) Only for CSV files. Delimiter if other than comma i.e. ';'. Must be a 1-character string.")
-def convert(common_ctx, format, delimiter):
+@click.option("--chunk-rows", type=int, help="(optional) Number of rows converted at a time. Defaults to 100000")
+@click.option("--max-memory", type=str, help="(optional) Approximate memory budget for the conversion i.e. '512MB'. Used to choose the number of rows converted at a time")
+def convert(common_ctx, format, delimiter, chunk_rows, max_memory):
 
     """
     Allows you to convert to CSV, Excel or Apache Parquet.
     """
 
+    from csvcli.functions import DEFAULT_CHUNK_ROWS, delete_local_file, get_chunk_rows, iter_file_chunks, parse_size, \
+        write_chunks_to_file
+
     new_filepath = get_new_filepath(filepath=common_ctx.obj.filepath, desired_format=format)
 
     # if the new format is different from the original one
     if get_file_extension(filepath=new_filepath) != common_ctx.obj.file_extension:
 
-        success = output_to_file(df=common_ctx.obj.df,
-                                 filepath=new_filepath,
-                                 desired_format=format,
-                                 delimiter=delimiter)
+        if chunk_rows is None and max_memory is not None:
+            chunk_rows = get_chunk_rows(filepath=common_ctx.obj.filepath,
+                                        format=common_ctx.obj.format,
+                                        delimiter=common_ctx.obj.delimiter,
+                                        max_memory=parse_size(max_memory))
+
+        # the file is converted chunk by chunk, so it never has to fit in memory
+        chunks = iter_file_chunks(filepath=common_ctx.obj.filepath,
+                                  format=common_ctx.obj.format,
+                                  delimiter=common_ctx.obj.delimiter,
+                                  chunk_rows=chunk_rows if chunk_rows is not None else DEFAULT_CHUNK_ROWS,
+                                  workers=common_ctx.obj.workers)
+
+        # the new file is only in place once it is complete, so the original is never deleted before
+        success = write_chunks_to_file(chunks=chunks,
+                                       filepath=new_filepath,
+                                       desired_format=format,
+                                       delimiter=delimiter)
 
         if success:
             delete_local_file(filepath=common_ctx.obj.filepath)
@@ -320,6 +976,37 @@ def convert(common_ctx, format, delimiter):
         click.echo("Ouch! The original formal of the file and the new format you selected are identical")
 
 
+@cli.command()
+@click.pass_context
+@click.option("--every", type=int, help="(optional) Number of rows between two offsets of the index. Defaults to 1000")
+def index(common_ctx, every):
+
+    """
+    Builds an index of a CSV file so show, tail and show --rows can seek to any row.
+    """
+
+    from csvcli.functions import CSV_INDEX_EVERY, build_csv_index, get_csv_index_filepath
+
+    if common_ctx.obj.format != 'csv':
+        click.echo("Ouch! You can only index CSV files")
+        sys.exit(0)
+
+    every = every if every is not None else CSV_INDEX_EVERY
+
+    if every < 1:
+        click.echo("Ouch! The number of rows between two offsets must be at least 1")
+        sys.exit(0)
+
+    try:
+        csv_index = build_csv_index(filepath=common_ctx.obj.filepath, every=every)
+    except OSError as error:
+        click.echo(f"Ouch! We could not write the index: {error}")
+        sys.exit(0)
+
+    click.echo(f"successfully indexed {csv_index['row_count']} rows of {common_ctx.obj.filepath} "
+               f"into {get_csv_index_filepath(filepath=common_ctx.obj.filepath)}")
+
+
 @cli.command()
 @click.pass_context
 @click.option("-to", "--new-delimiter", type=str, help="Output delimiter if other than comma i.e. ';'. Must be a 1-character string.")
@@ -329,28 +1016,132 @@ def change_delimiter(common_ctx, new_delimiter):
     Changes the delimiter of a CSV file.
     """
 
+    from csvcli.functions import change_csv_delimiter
+
     if get_file_extension(filepath=common_ctx.obj.filepath) == '.csv':
 
-        # create back up of original file
-        os.system(f"cp {common_ctx.obj.filepath} temp")
+        if new_delimiter is None:
+            new_delimiter = ','
 
-        # attempt write op on file
-        success = output_to_file(df=common_ctx.obj.df,
-                                 filepath=common_ctx.obj.filepath,
-                                 desired_format='csv',
-                                 delimiter=new_delimiter)
+        if len(new_delimiter) != 1:
+            click.echo("\nOuch! CSV delimiter must be a 1-character string")
+            sys.exit(0)
+
+        # the file is rewritten in one streaming pass and replaces the original only once complete
+        success = change_csv_delimiter(filepath=common_ctx.obj.filepath,
+                                       delimiter=common_ctx.obj.delimiter,
+                                       new_delimiter=new_delimiter)
 
-        # if write op went through, delete back up
         if success:
-            os.remove("temp")
             click.echo(f"successfully changed CSV delimiter of {common_ctx.obj.filepath} to '{new_delimiter}'")
 
-        # else restore original from back up
         else:
-            os.system(f"cp temp {common_ctx.obj.filepath}")
-            os.remove("temp")
             click.echo(f"Ouch! Something went wrong, try with a different delimiter")
 
+    else:
+        click.echo("Ouch! You can only change delimiter of CSV files")
+
+"""
+MANAGE THE CACHE
+"""
+
+
+@click.group(name="cache")
+def cache_cli():
+    """
+    Manages the parsed copies of CSV and excel files kept with --cache, and the results of queries.
+
+    They are stored in $CSVCLI_CACHE_DIR, by default ~/.cache/csvcli. Once they take more than $CSVCLI_CACHE_MAX_SIZE,
+    by default 10GB, the least recently used ones are removed.
+    """
+
+
+@cache_cli.command(name="ls")
+def cache_ls():
+    """
+    Lists the cached files and query results, the most recently used first.
+    """
+
+    import time
+    from csvcli.cache import get_cache_dir, get_cache_max_bytes, list_entries
+    from csvcli.functions import format_size
+
+    cache_dir = get_cache_dir()
+    entries = list_entries(cache_dir=cache_dir)
+
+    click.echo(f"\nCache directory: {cache_dir}")
+    click.echo(f"Size: {format_size(sum(meta['bytes'] for entry_dir, meta in entries))} "
+               f"of {format_size(get_cache_max_bytes())}\n")
+
+    for entry_dir, meta in entries:
+
+        last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(meta['last_used']))
+        size = format_size(meta['bytes']) if meta['status'] == 'ok' else 'could not be cached'
+
+        query = f"  query: {' '.join(meta['query'].split())}" if 'query' in meta else ''
+
+        click.echo(f"{last_used}  {size:>10}  {meta['fingerprint']['path']}{query}")
+
+
+@cache_cli.command(name="clear")
+def cache_clear():
+    """
+    Removes all the cached files and query results.
+    """
+
+    from csvcli.cache import clear_cache, get_cache_dir
+    from csvcli.functions import format_size
+
+    count, size = clear_cache(cache_dir=get_cache_dir())
+
+    click.echo(f"successfully removed {count} cached files, {format_size(size)} freed")
+
+
+"""
+KEEP FILES IN MEMORY
+"""
+
+
+@click.command(name="serve")
+@click.option("--socket", "socket_path", type=str, help="(optional) Path of the Unix socket to listen on. Defaults to $CSVCLI_SOCKET, or csvcli-<uid>.sock in $XDG_RUNTIME_DIR or the temporary directory")
+@click.option("--max-memory", type=str, default="4GB", help="(optional) Memory taken by the files kept loaded before the least recently used ones are dropped i.e. '16GB'. Defaults to 4GB")
+def serve_cli(socket_path, max_memory):
+    """
+    Keeps the files you work on loaded in memory, until it is stopped with Ctrl+C.
+
+    While it runs, csvcli sends the commands that read a file (show, head, tail, columns, describe, null-counts,
+    value-counts, select and query) to it. The first command on a file loads it, the next ones run right away.
+    Files are loaded again when they change.
+    """
+
+    from csvcli.functions import parse_size
+    from csvcli.server import get_socket_path, is_supported, serve
+
+    if not is_supported():
+        click.echo("Ouch! csvcli serve only runs on Linux and macOS")
+        sys.exit(0)
+
+    serve(socket_path=socket_path if socket_path is not None else get_socket_path(), max_bytes=parse_size(max_memory))
+
+
+def main():
+    """
+    Entry point of the csvcli command. The first argument of every other command is a file, so the cache and serve
+    commands are told apart before the arguments are parsed. The others run on the server if there is one
+    """
+
+    from csvcli.server import forward_command
+
+    if sys.argv[1:2] == ['cache']:
+        cache_cli(args=sys.argv[2:], prog_name="csvcli cache")
+
+    elif sys.argv[1:2] == ['serve']:
+        serve_cli(args=sys.argv[2:], prog_name="csvcli serve")
 
     else:
-        click.echo("Ouch! You can only change delimiter of CSV files")
\ No newline at end of file
+        status = forward_command(args=sys.argv[1:])
+
+        if status is None:
+            cli()
+        else:
+            sys.exit(status)
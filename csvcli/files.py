@@ -0,0 +1,222 @@
+"""
+Helpers about file paths, formats and delimiters.
+
+They only need the standard library, so the CLI can check its arguments without loading pandas.
+"""
+
+import os
+import csv
+import io
+import sys
+import click
+
+
+def get_filename(filepath):
+    return os.path.splitext(filepath)[0]
+
+
+def get_file_extension(filepath):
+    return os.path.splitext(filepath)[1]
+
+
+def assert_param(param, **kwargs):
+    assert param in kwargs.keys(), f"Missing param: {param}!"
+
+
+def check_path(original_function):
+    def wrapper(*args, **kwargs):
+
+        assert_param('filepath', **kwargs)
+
+        # check if filepath exists
+        if os.path.exists(kwargs['filepath']):
+            return original_function(*args, **kwargs)
+        else:
+            click.echo(f"\nOuch! Could not find '{kwargs['filepath']}'")
+            sys.exit(0)
+
+    return wrapper
+
+
+def validate_format(format):
+    if not isinstance(format, str) or format not in['csv', 'excel', 'parquet']:
+        click.echo("Ouch! Invalid format choice. You need to choose between 'csv', 'excel' or 'parquet'.")
+        sys.exit()
+
+
+def get_filepath_without_extension(filepath):
+    current_file_ext = get_file_extension(filepath=filepath)
+    return filepath[:-len(current_file_ext)]
+
+
+def get_new_filepath(filepath, desired_format):
+
+    validate_format(desired_format)
+
+    filepath_wo_ext = get_filepath_without_extension(filepath=filepath)
+
+    if desired_format == 'csv':
+        return filepath_wo_ext + ".csv"
+
+    elif desired_format == 'excel':
+        return filepath_wo_ext + ".xlsx"
+
+    elif desired_format == 'parquet':
+        return filepath_wo_ext + ".parquet"
+
+
+def get_col_list(col_string):
+
+    # convert input str into list of columns
+    col_list = col_string.split(',')
+
+    # discard any potential trailing and leading white spaces generated by user input
+    col_list = [x.strip(' ') for x in col_list].copy()
+
+    return col_list
+
+
+def get_format_from_file_extension(file_extension):
+
+    if file_extension == '.csv':
+        format = 'csv'
+
+    elif file_extension == '.parquet':
+        format = 'parquet'
+
+    elif file_extension in ['.xlsx', '.xls']:
+        format = 'excel'
+
+    else:
+        click.echo("Ouch! csvcli can only process CSV, excel and parquet files")
+        sys.exit(0)
+
+    return format
+
+
+DELIMITER_CANDIDATES = [',', '\t', ';', '|']
+
+# the sniffer only looks at a bounded sample of the file so startup cost does not grow with file size
+SNIFF_HEAD_BYTES = 64 * 1024
+SNIFF_BLOCK_BYTES = 16 * 1024
+SNIFF_BLOCK_COUNT = 3
+
+
+def read_sample_blocks(filepath, head_bytes=SNIFF_HEAD_BYTES, block_bytes=SNIFF_BLOCK_BYTES, block_count=SNIFF_BLOCK_COUNT):
+    """
+    Reads a bounded sample of a text file: its first bytes plus a few evenly spaced blocks
+    :return: list of str blocks, the first one starts at the beginning of the file. Every block only contains whole lines
+    """
+
+    file_size = os.path.getsize(filepath)
+    blocks = []
+
+    with open(filepath, 'rb') as f:
+
+        head = f.read(head_bytes)
+
+        # drop the last line if it was cut by the sample boundary
+        if file_size > head_bytes and b'\n' in head:
+            head = head[:head.rindex(b'\n') + 1]
+
+        blocks.append(head)
+
+        if file_size > head_bytes + block_bytes:
+
+            step = (file_size - head_bytes) // (block_count + 1)
+
+            for i in range(1, block_count + 1):
+                f.seek(head_bytes + i * step)
+                block = f.read(block_bytes)
+
+                # only keep the whole lines inside the block
+                if block.count(b'\n') < 2:
+                    continue
+
+                blocks.append(block[block.index(b'\n') + 1:block.rindex(b'\n') + 1])
+
+    return [block.decode('utf-8', errors='replace') for block in blocks]
+
+
+def get_field_counts(text, delimiter):
+
+    # the csv module is quote-aware, so delimiters and new lines inside quoted values are not counted
+    return [len(row) for row in csv.reader(io.StringIO(text, newline=''), delimiter=delimiter) if len(row) > 0]
+
+
+def score_delimiter(delimiter, blocks):
+    """
+    Scores a candidate delimiter by how consistent the column count is across the sampled records
+    :param delimiter: 1-character string
+    :param blocks: sample blocks as returned by read_sample_blocks
+    :return: tuple (column count of the header, share of sampled records with that column count, max column count in the first block)
+    """
+
+    head_counts = get_field_counts(blocks[0], delimiter)
+
+    if len(head_counts) == 0:
+        return 0, 0.0, 0
+
+    column_count = head_counts[0]
+
+    # blocks from the middle of the file may start inside a quoted value, so they only count towards consistency
+    record_counts = head_counts[1:]
+    for block in blocks[1:]:
+        record_counts += get_field_counts(block, delimiter)
+
+    # a file with only a header is as consistent as it gets
+    if len(record_counts) == 0:
+        return column_count, 1.0, column_count
+
+    consistency = sum(1 for count in record_counts if count == column_count) / len(record_counts)
+
+    return column_count, consistency, max(head_counts)
+
+
+def is_valid_score(score):
+
+    column_count, consistency, max_count = score
+
+    # pandas refuses to parse records with more fields than the header
+    return column_count > 1 and max_count <= column_count
+
+
+def sniff_delimiter(filepath, candidates=DELIMITER_CANDIDATES):
+    """
+    Guesses the delimiter of a CSV file from a bounded sample of it
+    :param filepath: path to the CSV file
+    :param candidates: delimiters to try, earlier ones win ties
+    :return: tuple (delimiter, confidence) where confidence goes from 0 to 1. (None, 0.0) if no candidate fits
+    """
+
+    blocks = read_sample_blocks(filepath=filepath)
+
+    best_delimiter = None
+    best_consistency = 0.0
+
+    for delim in candidates:
+        score = score_delimiter(delimiter=delim, blocks=blocks)
+
+        if is_valid_score(score) and score[1] > best_consistency:
+            best_delimiter = delim
+            best_consistency = score[1]
+
+    return best_delimiter, best_consistency
+
+
+def guess_delimiter(filepath):
+
+    delimiter, confidence = sniff_delimiter(filepath=filepath)
+
+    return delimiter
+
+
+def is_valid_delimiter(delimiter, filepath):
+
+    if not len(delimiter) == 1:
+        click.echo("\nOuch! CSV delimiter must be a 1-character string")
+        sys.exit(0)
+
+    blocks = read_sample_blocks(filepath=filepath)
+
+    return is_valid_score(score_delimiter(delimiter=delimiter, blocks=blocks))
@@ -1,65 +1,25 @@
 import os
+import csv
+import io
+import json
+import mmap
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
 import sys
-from tabulate import tabulate
 import click
-import pandasql as psql
 import numpy
-from pandasql.sqldf import PandaSQLException
+from csvcli.files import get_filename, get_file_extension, assert_param, check_path, validate_format, \
+    get_filepath_without_extension, get_new_filepath, get_col_list, get_format_from_file_extension, \
+    DELIMITER_CANDIDATES, SNIFF_HEAD_BYTES, read_sample_blocks, get_field_counts, score_delimiter, is_valid_score, \
+    sniff_delimiter, guess_delimiter, is_valid_delimiter
+from csvcli.sketches import FrequentItemsSketch, SummaryStatsSketch
+from csvcli.sql import execute_query, parse_query, parse_condition, filter_rows, is_streamable_query, iter_query_chunks, \
+    is_never_true, get_expr_columns, get_row_mask, UnsupportedQuery
 
-
-def get_filename(filepath):
-    return os.path.splitext(filepath)[0]
-
-
-def get_file_extension(filepath):
-    return os.path.splitext(filepath)[1]
-
-
-def assert_param(param, **kwargs):
-    assert param in kwargs.keys(), f"Missing param: {param}!"
-
-
-def check_path(original_function):
-    def wrapper(*args, **kwargs):
-
-        assert_param('filepath', **kwargs)
-
-        # check if filepath exists
-        if os.path.exists(kwargs['filepath']):
-            return original_function(*args, **kwargs)
-        else:
-            click.echo(f"\nOuch! Could not find '{kwargs['filepath']}'")
-            sys.exit(0)
-
-    return wrapper
-
-
-def validate_format(format):
-    if not isinstance(format, str) or format not in['csv', 'excel', 'parquet']:
-        click.echo("Ouch! Invalid format choice. You need to choose between 'csv', 'excel' or 'parquet'.")
-        sys.exit()
-
-
-def get_filepath_without_extension(filepath):
-    current_file_ext = get_file_extension(filepath=filepath)
-    return filepath[:-len(current_file_ext)]
-
-
-def get_new_filepath(filepath, desired_format):
-
-    validate_format(desired_format)
-
-    filepath_wo_ext = get_filepath_without_extension(filepath=filepath)
-
-    if desired_format == 'csv':
-        return filepath_wo_ext + ".csv"
-
-    elif desired_format == 'excel':
-        return filepath_wo_ext + ".xlsx"
-
-    elif desired_format == 'parquet':
-        return filepath_wo_ext + ".parquet"
+# pyarrow, pandasql and openpyxl are imported by the functions that use them, as they take long to load
 
 
 def output_to_file(*args, **kwargs):
@@ -115,227 +75,2016 @@ def delete_local_file(filepath):
     os.remove(filepath)
 
 
-def pd_tabulate(my_df, headers='keys'):
-    return tabulate(my_df, headers=headers, tablefmt='fancy_grid')
+def get_temp_filepath(filepath):
+
+    # the temp file lives next to the destination so it can be renamed into place atomically
+    directory = os.path.dirname(os.path.abspath(filepath))
+    # it keeps the extension of the destination as some writers check it
+    file_descriptor, temp_filepath = tempfile.mkstemp(prefix=f".{os.path.basename(filepath)}.",
+                                                      suffix=f".tmp{get_file_extension(filepath=filepath)}",
+                                                      dir=directory)
+    os.close(file_descriptor)
 
+    # mkstemp makes it readable by its owner only, once renamed into place it has the mode of any new file
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(temp_filepath, 0o666 & ~umask)
 
-def get_col_list(col_string):
+    return temp_filepath
 
-    # convert input str into list of columns
-    col_list = col_string.split(',')
 
-    # discard any potential trailing and leading white spaces generated by user input
-    col_list = [x.strip(' ') for x in col_list].copy()
+def write_chunks_to_file(chunks, filepath, desired_format, delimiter=None):
+    """
+    Writes an iterable of DataFrames into one file, holding only one chunk in memory at a time.
+    The output is written to a temp file first and only renamed into place once it is complete.
+    :param chunks: iterable of Pandas DataFrames with the same columns, there must be at least one
+    :param filepath: path where the output file will be stored
+    :param desired_format: has to be 'csv', 'excel' or 'parquet'
+    :param delimiter: (optional) csv delimiter if other than comma
+    :return: true if write operation went through, false otherwise
+    """
 
-    return col_list
+    validate_format(desired_format)
 
+    temp_filepath = get_temp_filepath(filepath=filepath)
 
-def get_format_from_file_extension(file_extension):
+    try:
 
-    if file_extension == '.csv':
-        format = 'csv'
+        if desired_format == 'csv':
+            with open(temp_filepath, 'w', newline='') as f:
+                for index, chunk in enumerate(chunks):
+                    chunk.to_csv(f, sep=delimiter if delimiter is not None else ',', index=False, header=index == 0)
 
-    elif file_extension == '.parquet':
-        format = 'parquet'
+        elif desired_format == 'parquet':
+            write_chunks_to_parquet(chunks=chunks, filepath=temp_filepath)
 
-    elif file_extension in ['.xlsx', '.xls']:
-        format = 'excel'
+        elif desired_format == 'excel':
+            # excel files can not be appended to, and they are capped at about a million rows anyway
+            pd.concat(chunks, ignore_index=True).to_excel(temp_filepath, index=False)
 
-    else:
-        click.echo("Ouch! csvcli can only process CSV, excel and parquet files")
-        sys.exit(0)
+        os.replace(temp_filepath, filepath)
+        return True
 
-    return format
+    except Exception:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        return False
 
 
-def guess_delimiter(filepath):
+REWRITE_BLOCK_BYTES = 4 * 1024 * 1024
 
-    for delim in [',', '\t', ';', '|']:
-        if is_valid_delimiter(delimiter=delim, filepath=filepath):
-            return delim
 
-    return None
+def rewrite_delimiter_bytes(filepath, new_filepath, delimiter, new_delimiter, block_bytes=REWRITE_BLOCK_BYTES):
+    """
+    Replaces the delimiter of a CSV file block by block, only outside of quoted values
+    :return: true if done, false if a value would need new quotes (it contains the new delimiter) or a delimiter is not 1 byte
+    """
 
+    old_byte = delimiter.encode('utf-8')
+    new_byte = new_delimiter.encode('utf-8')
 
-def is_valid_delimiter(delimiter, filepath):
+    if len(old_byte) != 1 or len(new_byte) != 1:
+        return False
 
-    if not len(delimiter) == 1:
-        click.echo("\nOuch! CSV delimiter must be a 1-character string")
-        sys.exit(0)
+    in_quotes = False
+
+    with open(filepath, 'rb') as f_in, open(new_filepath, 'wb') as f_out:
+
+        block = f_in.read(block_bytes)
+
+        while block:
+
+            # splitting on quotes gives segments that alternate between outside and inside of quoted values
+            segments = block.split(b'"')
+            first_outside = 1 if in_quotes else 0
+
+            outside = segments[first_outside::2]
+
+            if any(new_byte in segment for segment in outside):
+                return False
+
+            segments[first_outside::2] = [segment.replace(old_byte, new_byte) for segment in outside]
+
+            f_out.write(b'"'.join(segments))
+
+            # an odd number of quotes in the block flips whether the next block starts inside a quoted value
+            if len(segments) % 2 == 0:
+                in_quotes = not in_quotes
+
+            block = f_in.read(block_bytes)
+
+    return True
+
+
+def rewrite_delimiter_csv(filepath, new_filepath, delimiter, new_delimiter):
+
+    # keep the line endings of the original file
+    with open(filepath, 'rb') as f:
+        line_terminator = '\r\n' if b'\r\n' in f.read(SNIFF_HEAD_BYTES) else '\n'
+
+    with open(filepath, 'r', newline='', encoding='utf-8') as f_in, \
+            open(new_filepath, 'w', newline='', encoding='utf-8') as f_out:
+
+        writer = csv.writer(f_out, delimiter=new_delimiter, lineterminator=line_terminator)
+        writer.writerows(csv.reader(f_in, delimiter=delimiter))
+
+
+def change_csv_delimiter(filepath, delimiter, new_delimiter):
+    """
+    Changes the delimiter of a CSV file in a single streaming pass, without parsing it into a DataFrame.
+    The original file is replaced atomically once the new one is complete.
+    :return: true if the delimiter was changed, false otherwise
+    """
+
+    temp_filepath = get_temp_filepath(filepath=filepath)
 
     try:
-        df = pd.read_csv(filepath, delimiter=delimiter, engine='c')
-        if df.shape[1] > 1:
-            return True
-        else:
-            return False
+        # values that contain the new delimiter need to be quoted, the csv module takes care of that
+        if not rewrite_delimiter_bytes(filepath=filepath, new_filepath=temp_filepath,
+                                       delimiter=delimiter, new_delimiter=new_delimiter):
+            rewrite_delimiter_csv(filepath=filepath, new_filepath=temp_filepath,
+                                  delimiter=delimiter, new_delimiter=new_delimiter)
+
+        shutil.copymode(filepath, temp_filepath)
+        os.replace(temp_filepath, filepath)
+        return True
 
     except Exception:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        return False
+
+
+def get_parquet_schema(df):
+
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+
+    # columns that are empty in the first chunk get a string type so later values still fit
+    for index, field in enumerate(schema):
+        if pa.types.is_null(field.type):
+            schema = schema.set(index, pa.field(field.name, pa.large_string()))
+
+    return schema
+
+
+def get_conflicting_columns(chunk, schema):
+    """
+    :return: tuple (columns that have to be floats, columns that have to be text) for the chunk to fit the schema
+    """
+
+    import pyarrow as pa
+
+    float_columns = []
+    text_columns = []
+
+    for field in schema:
         try:
-            df = pd.read_csv(filepath, delimiter=delimiter, engine='python')
-            if df.shape[1] > 1:
-                return True
+            pa.array(chunk[field.name], type=field.type, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            if pd.api.types.is_numeric_dtype(chunk[field.name].dtype) and \
+                    (pa.types.is_integer(field.type) or pa.types.is_floating(field.type)):
+                float_columns.append(field.name)
             else:
-                return False
+                text_columns.append(field.name)
+
+    return float_columns, text_columns
+
+
+def get_mixed_columns(chunk):
+    """
+    :return: list of columns with values of more than one type, that have to be text
+    """
+
+    import pyarrow as pa
+
+    mixed_columns = []
+
+    for col in chunk.columns:
+        try:
+            pa.array(chunk[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            mixed_columns.append(col)
+
+    return mixed_columns
+
+
+def get_chunk_as_text(chunk, text_columns):
+
+    for col in text_columns:
+        if col in chunk.columns:
+            chunk[col] = chunk[col].where(chunk[col].isna(), chunk[col].astype(str))
+
+    return chunk
+
+
+def get_widened_schema(schema, float_columns, text_columns):
+
+    import pyarrow as pa
+
+    for col in float_columns:
+        schema = schema.set(schema.get_field_index(col), pa.field(col, pa.float64()))
+    for col in text_columns:
+        schema = schema.set(schema.get_field_index(col), pa.field(col, pa.large_string()))
+
+    return schema
+
+
+def copy_parquet_widened(filepath, new_filepath, schema, text_columns):
+    """
+    Starts a new parquet file with the row groups of another one, converted to the wider types of schema
+    :return: ParquetWriter of the new file, still open for more row groups
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = pq.ParquetWriter(new_filepath, schema)
+    parquet_file = pq.ParquetFile(filepath)
+
+    for index in range(parquet_file.num_row_groups):
+        chunk = get_chunk_as_text(chunk=parquet_file.read_row_group(index).to_pandas(), text_columns=text_columns)
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+    return writer
+
+
+def write_chunks_to_parquet(chunks, filepath):
+    """
+    Writes DataFrames into one parquet file, every one of them a row group. The schema is set by the first one, when a
+    later one does not fit it, i.e. a column empty so far gets text, the columns at fault are widened to floats or
+    text and the row groups already written are copied with the wider types
+    :param chunks: iterable of Pandas DataFrames with the same columns, there must be at least one
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_errors = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError)
+
+    writer = None
+    schema = None
+    text_columns = []
+    # row groups go to another file every time the types are widened, it is moved to filepath at the end
+    current_filepath = filepath
+
+    try:
+        for chunk in chunks:
+
+            chunk = get_chunk_as_text(chunk=chunk, text_columns=text_columns)
+
+            if writer is None:
+                try:
+                    schema = get_parquet_schema(chunk)
+                except arrow_errors:
+                    text_columns += get_mixed_columns(chunk=chunk)
+                    schema = get_parquet_schema(get_chunk_as_text(chunk=chunk, text_columns=text_columns))
+                writer = pq.ParquetWriter(current_filepath, schema)
+
+            try:
+                table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+            except arrow_errors:
+                new_float_columns, new_text_columns = get_conflicting_columns(chunk=chunk, schema=schema)
+                if len(new_float_columns) == 0 and len(new_text_columns) == 0:
+                    raise
+
+                text_columns += new_text_columns
+                schema = get_widened_schema(schema=schema, float_columns=new_float_columns,
+                                            text_columns=new_text_columns)
+
+                writer.close()
+                writer = None
+                previous_filepath, current_filepath = current_filepath, get_temp_filepath(filepath=filepath)
+                writer = copy_parquet_widened(filepath=previous_filepath, new_filepath=current_filepath,
+                                              schema=schema, text_columns=text_columns)
+                if previous_filepath != filepath:
+                    os.remove(previous_filepath)
+
+                table = pa.Table.from_pandas(get_chunk_as_text(chunk=chunk, text_columns=text_columns),
+                                             schema=schema, preserve_index=False)
+
+            writer.write_table(table)
+
+        writer.close()
+        writer = None
+
+        if current_filepath != filepath:
+            os.replace(current_filepath, filepath)
+
+    finally:
+        if writer is not None:
+            writer.close()
+        if current_filepath != filepath and os.path.exists(current_filepath):
+            os.remove(current_filepath)
 
-        except Exception:
-            return False
+
+def write_tables_to_file(tables, filepath, desired_format, delimiter=None):
+    """
+    Writes an iterable of Arrow tables into one file, like write_chunks_to_file.
+    Parquet files are written straight from the Arrow buffers. Other formats go through pandas one table at a time,
+    so they are written exactly like the rest of the commands write them
+    :param tables: iterable of Arrow tables with the same schema, there must be at least one
+    :return: true if write operation went through, false otherwise
+    """
+
+    if desired_format != 'parquet':
+        return write_chunks_to_file(chunks=(table.to_pandas() for table in tables), filepath=filepath,
+                                    desired_format=desired_format, delimiter=delimiter)
+
+    import pyarrow.parquet as pq
+
+    temp_filepath = get_temp_filepath(filepath=filepath)
+    writer = None
+
+    try:
+
+        try:
+            for table in tables:
+                if writer is None:
+                    writer = pq.ParquetWriter(temp_filepath, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        os.replace(temp_filepath, filepath)
+        return True
+
+    except Exception:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        return False
+
+
+@check_path
+def read_file_to_df(filepath, format, delimiter, columns=None, workers=None, where=None):
+    """
+    Reads a file into a DataFrame
+    :param columns: (optional) list of columns to read, the others are skipped by the reader instead of being parsed
+    :param workers: (optional) number of processes parsing large CSV files (threads reading parquet row groups),
+                    defaults to the number of cores
+    :param where: (optional) condition as returned by parse_condition, parquet row groups where it can not be true
+                  are skipped. The rows read are not filtered
+    :return: Pandas DataFrame, with the columns in the requested order if any
+    """
+
+    data = None
+
+    if is_parallel_csv(filepath=filepath, format=format, workers=workers):
+        data = read_csv_parallel(filepath=filepath, delimiter=delimiter, workers=workers, columns=columns)
+
+    elif format == 'csv':
+        data = pd.read_csv(filepath, delimiter=delimiter, usecols=columns)
+
+    elif format == 'parquet':
+        data = read_parquet_to_df(filepath=filepath, columns=columns, where=where, workers=workers)
+
+    elif format == 'excel':
+        data = pd.read_excel(filepath, usecols=columns)
+
+    # readers return the columns in file order
+    if columns is not None:
+        data = data[columns]
+
+    return data
+
+
+def read_parquet_head(filepath, n):
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(filepath)
+
+    batches = []
+    row_count = 0
+
+    # batches are decoded one at a time, so we stop reading as soon as we have enough rows
+    for batch in parquet_file.iter_batches(batch_size=max(n, 1)):
+        batches.append(batch)
+        row_count += batch.num_rows
+        if row_count >= n:
+            break
+
+    table = pa.Table.from_batches(batches, schema=parquet_file.schema_arrow)
+
+    return table.slice(0, n).to_pandas()
+
+
+def iter_excel_chunks(filepath, chunk_rows):
+
+    from openpyxl import load_workbook
+
+    # only xlsx files can be streamed, xlrd has to load old xls files fully anyway
+    if get_file_extension(filepath=filepath) != '.xlsx':
+        df = pd.read_excel(filepath)
+        for offset in range(0, max(df.shape[0], 1), chunk_rows):
+            yield df[offset:offset + chunk_rows]
+        return
+
+    workbook = load_workbook(filepath, read_only=True, data_only=True)
+
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+
+        records = []
+        for row in rows:
+            records.append(row)
+            if len(records) == chunk_rows:
+                yield pd.DataFrame.from_records(records, columns=header)
+                records = []
+
+        if len(records) > 0:
+            yield pd.DataFrame.from_records(records, columns=header)
+
+    finally:
+        workbook.close()
+
+
+def read_excel_head(filepath, n):
+
+    # only xlsx files can be streamed, xlrd has to load old xls files fully anyway
+    if get_file_extension(filepath=filepath) != '.xlsx':
+        return pd.read_excel(filepath, nrows=n)
+
+    chunk = next(iter_excel_chunks(filepath=filepath, chunk_rows=max(n, 1)), None)
+
+    if chunk is None:
+        return pd.read_excel(filepath, nrows=0)
+
+    return chunk.head(n)
 
 
 @check_path
-def read_file_to_df(filepath, format, delimiter):
+def read_file_head(filepath, format, delimiter, n):
+    """
+    Reads only the first rows of a file, so time and memory do not depend on the size of the file
+    :return: Pandas DataFrame with at most n rows
+    """
 
     data = None
 
     if format == 'csv':
-        data = pd.read_csv(filepath, delimiter=delimiter)
+        data = pd.read_csv(filepath, delimiter=delimiter, nrows=n)
 
     elif format == 'parquet':
-        data = pd.read_parquet(filepath)
+        data = read_parquet_head(filepath=filepath, n=n)
 
     elif format == 'excel':
-        data = pd.read_excel(filepath)
+        data = read_excel_head(filepath=filepath, n=n)
 
     return data
 
 
-def assert_col_in_df(df, column):
-    if column not in df.columns:
-        click.echo(f"Ouch! Column '{column}' does not seem to exist...")
-        sys.exit(0)
+def is_pandas_index_column(column):
+    return column.startswith('__index_level_') and column.endswith('__')
 
 
-def filter_df(df, head=False, n=None, columns=None, sort_by=None, order='ASC'):
+@check_path
+def read_file_columns(filepath, format, delimiter):
+    """
+    Reads only the column names of a file, without loading its data
+    :return: list of column names
+    """
 
-    output_df = df.copy()
+    columns = []
 
-    if columns is not None:
+    if format == 'csv':
+        columns = pd.read_csv(filepath, delimiter=delimiter, nrows=0).columns.tolist()
 
-        col_list = get_col_list(col_string=columns)
+    elif format == 'parquet':
+        import pyarrow.parquet as pq
+        # the footer schema also lists the index pandas may have stored along the data
+        columns = [col for col in pq.read_schema(filepath).names if not is_pandas_index_column(col)]
 
-        for col in col_list:
-            assert_col_in_df(df=output_df, column=col)
+    elif format == 'excel':
+        columns = pd.read_excel(filepath, nrows=0).columns.tolist()
 
-        output_df = df[col_list].copy()
+    return columns
 
-    if sort_by is not None:
-        assert_col_in_df(df=output_df, column=sort_by)
-        if order.lower() in ['asc', 'ascending']:
-            output_df = output_df.sort_values(by=sort_by, ascending=True)
-        elif order.lower() in ['desc', 'descending']:
-            output_df = output_df.sort_values(by=sort_by, ascending=False)
-        else:
-            click.echo("Ouch! Wrong order value, you can choose either ASC for ascending or DESC for descending")
-            sys.exit(0)
 
-    if head:
-        if n is not None:
-            output_df = output_df.head(n)
-        else:
-            output_df = output_df.head()
+COUNT_CHUNK_BYTES = 16 * 1024 * 1024
 
-    return output_df
 
+def count_csv_records(filepath, chunk_bytes=COUNT_CHUNK_BYTES):
+    """
+    Counts the data rows of a CSV file by counting its new lines over a memory map.
+    New lines inside quoted values are not counted as record boundaries.
+    :return: number of records without the header
+    """
 
-def display_df(df, headers='keys'):
-    click.echo(pd_tabulate(df, headers=headers))
+    file_size = os.path.getsize(filepath)
 
+    if file_size == 0:
+        return 0
 
-def paginated_display(df, filename, chunksize=25000):
+    boundary_count = 0
 
-    page_count = df.shape[0] // chunksize
-    if df.shape[0] % chunksize != 0:
-        page_count += 1
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
 
-    offset = 0
-    limit = offset + chunksize
+        # most files have no quotes at all, then every new line is a record boundary
+        has_quotes = mm.find(b'"') != -1
+        in_quotes = 0
 
-    for page in range(1, page_count+1):
+        for offset in range(0, file_size, chunk_bytes):
 
-        partial_df = df[offset:limit]
-        display_df(df=partial_df)
-        click.echo(f"\nFilename: {filename} - Total number of rows: {df.shape[0]}\n")
-        offset += chunksize
-        limit = offset + chunksize
+            chunk = numpy.frombuffer(mm, dtype=numpy.uint8, count=min(chunk_bytes, file_size - offset), offset=offset)
+            newlines = numpy.flatnonzero(chunk == ord('\n'))
 
+            if has_quotes:
+                quotes = numpy.flatnonzero(chunk == ord('"'))
 
-def get_dtype(series, pretty=False):
-    series = series[series.notna()].copy()
+                # a new line is a boundary if an even number of quotes came before it
+                quotes_before = numpy.searchsorted(quotes, newlines) + in_quotes
+                boundary_count += int(numpy.count_nonzero(quotes_before % 2 == 0))
 
-    if series.shape[0] > 0:
+                in_quotes = (in_quotes + len(quotes)) % 2
 
-        if pretty:
-            return type(series.head(1).values[0]).__name__
+            else:
+                boundary_count += len(newlines)
 
-        else:
-            return type(series.head(1).values[0])
+            # the memory map can not be closed while a view on it is alive
+            del chunk
 
-    else:
-        return None
+        last_byte = mm[file_size - 1]
 
+    # the last record may not end with a new line
+    record_count = boundary_count if last_byte == ord('\n') else boundary_count + 1
 
-def get_dtypes(df, pretty=False):
+    return max(record_count - 1, 0)
 
-    type_dict_list = [{"column_name": col, 'data_type': get_dtype(df[col], pretty)} for col in df.columns]
 
-    return pd.DataFrame(type_dict_list)
+def iter_csv_record_offsets(filepath, every, chunk_bytes=COUNT_CHUNK_BYTES):
+    """
+    Finds where every few data rows of a CSV file start, in one pass over a memory map.
+    New lines inside quoted values are not counted as record boundaries.
+    :param every: number of rows between two offsets
+    :return: generator of tuples (row number, byte offset) for rows 0, every, 2 * every... ending with
+             (number of rows, file size)
+    """
 
+    file_size = os.path.getsize(filepath)
 
-def get_summary_stats(df):
+    if file_size == 0:
+        yield 0, 0
+        return
 
-    return df.describe()
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
 
+        # most files have no quotes at all, then every new line is a record boundary
+        has_quotes = mm.find(b'"') != -1
 
-def get_null_columns(df):
+        header_end = find_record_start(mm, 0, in_quotes=0, has_quotes=has_quotes)
 
-    null_df = df.isna().sum().reset_index().rename(columns={'index': 'column_name', 0: 'count_of_nulls'})
+        if header_end == file_size:
+            yield 0, file_size
+            return
 
-    return null_df
+        yield 0, header_end
 
+        row_count = 0
+        in_quotes = 0
 
-def get_df_casted_to_supported_types(df):
+        for offset in range(header_end, file_size, chunk_bytes):
 
-    # pandasql uses SQLite syntax
-    # SQLite does not support arrays
-    # In order to not have the query crash whenever an array is in the query result we need to cast arrays into strings
-    # We also cast dictionaries and dates into str to be on the safe side
+            chunk = numpy.frombuffer(mm, dtype=numpy.uint8, count=min(chunk_bytes, file_size - offset), offset=offset)
+            newlines = numpy.flatnonzero(chunk == ord('\n'))
 
-    not_supported_types = [numpy.ndarray, list, tuple, set, dict, numpy.datetime64]
+            if has_quotes:
+                quotes = numpy.flatnonzero(chunk == ord('"'))
 
-    bad_columns = [col for col in df.columns if get_dtype(df[col]) in not_supported_types]
+                # a new line is a boundary if an even number of quotes came before it
+                quotes_before = numpy.searchsorted(quotes, newlines) + in_quotes
+                newlines = newlines[quotes_before % 2 == 0]
 
-    for col in bad_columns:
-        df[col] = df[col].astype(str)
+                in_quotes = (in_quotes + len(quotes)) % 2
 
-    return df
+            del chunk
 
+            # every boundary starts the next row, unless it is the end of the file
+            starts = newlines + offset + 1
+            starts = starts[starts < file_size]
+            rows = numpy.arange(row_count + 1, row_count + 1 + len(starts))
 
-def filter_df_by_query(df, query):
+            for row, start in zip(rows[rows % every == 0], starts[rows % every == 0]):
+                yield int(row), int(start)
 
-    file = get_df_casted_to_supported_types(df)
+            row_count += len(starts)
 
-    # if the column names contain spaces, convert them to underscores so you can still query them
-    file.columns = [col.replace(' ', '_') for col in file.columns]
+    yield row_count + 1, file_size
 
-    try:
-        result_df = psql.sqldf(query, {**locals(), **globals()})
 
-    except PandaSQLException as e:
+# number of rows between two offsets of a CSV index
+CSV_INDEX_EVERY = 1000
 
-        error = e.__str__().split('\n')[0]
+CSV_INDEX_VERSION = 1
 
-        click.echo(f"Ouch! Your SQL query failed: {error}")
 
-        sys.exit(0)
+def get_csv_index_filepath(filepath):
 
-    return result_df
+    # the index is a hidden file next to the CSV file
+    return os.path.join(os.path.dirname(filepath), f".{os.path.basename(filepath)}.csvidx")
 
 
-def get_value_counts(df, column):
+def build_csv_index(filepath, every=CSV_INDEX_EVERY):
+    """
+    Writes the byte offset of every few rows of a CSV file into a sidecar file, so any row can be reached with one seek.
+    The index records the size and modification time of the file, it is ignored once they change.
+    :param every: number of rows between two offsets
+    :return: the index as read_csv_index returns it
+    """
 
-    result = pd.DataFrame(df[column].value_counts()).reset_index()
-    result.rename(columns={'index': 'unique_value', column: f'count'}, inplace=True)
+    stat = os.stat(filepath)
 
-    return result
+    rows, offsets = zip(*iter_csv_record_offsets(filepath=filepath, every=every))
+
+    header = {'version': CSV_INDEX_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+              'every': every, 'row_count': rows[-1]}
+
+    index_filepath = get_csv_index_filepath(filepath=filepath)
+    temp_filepath = get_temp_filepath(filepath=index_filepath)
+
+    try:
+        # a json header line followed by the offsets as little endian 64-bit integers
+        with open(temp_filepath, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b'\n')
+            f.write(numpy.array(offsets, dtype='<u8').tobytes())
+
+        os.replace(temp_filepath, index_filepath)
+
+    finally:
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+    return dict(header, offsets=numpy.array(offsets, dtype='<u8'))
+
+
+def read_csv_index(filepath):
+    """
+    Reads the sidecar index of a CSV file, if it is still up to date
+    :return: dict with the 'every' and 'row_count' of the index and the 'offsets' where rows 0, every, 2 * every...
+             start, ending with the file size. None if there is no index or the file changed since it was built
+    """
+
+    index_filepath = get_csv_index_filepath(filepath=filepath)
+
+    if not os.path.exists(index_filepath):
+        return None
+
+    stat = os.stat(filepath)
+
+    try:
+        with open(index_filepath, 'rb') as f:
+            header = json.loads(f.readline())
+
+            if header.get('version') != CSV_INDEX_VERSION or header.get('size') != stat.st_size \
+                    or header.get('mtime_ns') != stat.st_mtime_ns:
+                return None
+
+            offsets = numpy.frombuffer(f.read(), dtype='<u8')
+
+    # a damaged index is as good as none
+    except (OSError, ValueError):
+        return None
+
+    if len(offsets) != -(-header['row_count'] // header['every']) + 1:
+        return None
+
+    return dict(header, offsets=offsets)
+
+
+def read_excel_row_count(filepath):
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(filepath, read_only=True)
+
+    try:
+        # the sheet dimension is stored in the file, but some writers leave it out
+        max_row = workbook.worksheets[0].max_row
+    finally:
+        workbook.close()
+
+    if max_row is None:
+        return None
+
+    return max(max_row - 1, 0)
+
+
+@check_path
+def read_file_row_count(filepath, format):
+    """
+    Reads the number of rows of a file without parsing its data, when the format allows it
+    :return: number of rows, None if it can not be known without parsing the data
+    """
+
+    if format == 'csv':
+        index = read_csv_index(filepath=filepath)
+        return index['row_count'] if index is not None else count_csv_records(filepath=filepath)
+
+    elif format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(filepath).metadata.num_rows
+
+    elif format == 'excel' and get_file_extension(filepath=filepath) == '.xlsx':
+        return read_excel_row_count(filepath=filepath)
+
+    return None
+
+
+@check_path
+def read_parquet_dtypes(filepath):
+    """
+    Reads the column names and data types of a parquet file from its footer schema
+    :return: Pandas DataFrame with one row per column
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(filepath)
+
+    # the types pandas reads the columns with, named like get_dtypes names them for CSV and excel files
+    dtypes = schema.empty_table().to_pandas().dtypes
+
+    type_dict_list = []
+
+    for field in schema:
+
+        if is_pandas_index_column(field.name):
+            continue
+
+        dtype = dtypes[field.name] if field.name in dtypes.index else None
+
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            data_type = 'str'
+        elif isinstance(dtype, numpy.dtype) and dtype != object:
+            data_type = dtype.type.__name__
+        else:
+            data_type = str(field.type)
+
+        type_dict_list.append({"column_name": field.name, 'data_type': data_type})
+
+    return pd.DataFrame(type_dict_list)
+
+
+def read_parquet_row_group_stats(filepath):
+    """
+    Reads the statistics of every column in every row group of a parquet file from its footer
+    :return: list with one dict per row group as is_never_true expects them, where columns with spaces are also
+             listed with underscores, the way queries refer to them
+    """
+
+    import pyarrow.parquet as pq
+
+    metadata = pq.ParquetFile(filepath).metadata
+
+    row_group_stats = []
+
+    for index in range(metadata.num_row_groups):
+
+        row_group = metadata.row_group(index)
+        stats = {}
+
+        for position in range(row_group.num_columns):
+
+            column = row_group.column(position)
+            statistics = column.statistics
+
+            column_stats = {'min': None, 'max': None, 'null_count': None, 'row_count': row_group.num_rows}
+
+            if statistics is not None and statistics.has_min_max:
+                column_stats['min'], column_stats['max'] = statistics.min, statistics.max
+
+            if statistics is not None and statistics.has_null_count:
+                column_stats['null_count'] = statistics.null_count
+
+            stats[column.path_in_schema.lower()] = column_stats
+            stats[column.path_in_schema.replace(' ', '_').lower()] = column_stats
+
+        row_group_stats.append(stats)
+
+    return row_group_stats
+
+
+def get_parquet_row_groups(filepath, where=None):
+    """
+    Picks the row groups of a parquet file that have to be read, skipping those where a condition can not be true
+    :param where: (optional) condition as returned by parse_condition
+    :return: list of row group indexes, all of them if there is no condition
+    """
+
+    import pyarrow.parquet as pq
+
+    if where is None:
+        return list(range(pq.ParquetFile(filepath).metadata.num_row_groups))
+
+    return [index for index, stats in enumerate(read_parquet_row_group_stats(filepath=filepath))
+            if not is_never_true(where, stats)]
+
+
+def read_parquet_row_group(filepath, row_group, columns=None):
+
+    import pyarrow.parquet as pq
+
+    # every thread opens the file on its own, a ParquetFile is not meant to be shared between threads
+    return pq.ParquetFile(filepath).read_row_group(row_group, columns=columns, use_pandas_metadata=True)
+
+
+def read_parquet_to_df(filepath, columns=None, where=None, workers=None):
+    """
+    Reads the row groups of a parquet file in a thread pool, skipping those where a condition can not be true.
+    The rows of the row groups read are not filtered.
+    :param columns: (optional) list of columns to read
+    :param where: (optional) condition as returned by parse_condition
+    :param workers: (optional) number of threads, defaults to the number of cores
+    :return: Pandas DataFrame
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    row_groups = get_parquet_row_groups(filepath=filepath, where=where)
+
+    if len(row_groups) == 0:
+        df = pq.ParquetFile(filepath).schema_arrow.empty_table().to_pandas()
+        return df if columns is None else df[columns]
+
+    with ThreadPoolExecutor(max_workers=min(get_workers(workers), len(row_groups))) as executor:
+        tables = list(executor.map(read_parquet_row_group,
+                                   [filepath] * len(row_groups), row_groups, [columns] * len(row_groups)))
+
+    return pa.concat_tables(tables).to_pandas()
+
+
+def iter_parquet_tables(filepath, chunk_rows=None, columns=None, where=None):
+    """
+    Reads a parquet file as a sequence of Arrow tables, which are never converted to pandas
+    :param chunk_rows: (optional) maximum number of rows of every table, defaults to DEFAULT_CHUNK_ROWS
+    :param columns: (optional) list of columns to read, in the order they are wanted
+    :param where: (optional) condition as returned by parse_condition, row groups where it can not be true are skipped.
+                  The rows read are not filtered
+    :return: generator of Arrow tables, at least one even if the file has no rows
+    """
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(filepath)
+
+    # the index pandas may have stored along the data is left out
+    if columns is None:
+        columns = [col for col in parquet_file.schema_arrow.names if not is_pandas_index_column(col)]
+
+    empty = True
+
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows if chunk_rows is not None else DEFAULT_CHUNK_ROWS,
+                                           columns=columns,
+                                           row_groups=get_parquet_row_groups(filepath=filepath, where=where)):
+        empty = False
+        # selecting the columns only reorders them, no data is copied
+        yield pa.Table.from_batches([batch]).select(columns)
+
+    if empty:
+        yield parquet_file.schema_arrow.empty_table().select(columns)
+
+
+# CSV files smaller than this are parsed by a single process, starting a pool would take longer
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+
+# number of byte ranges per process when a CSV file is fully loaded, so uneven ranges even out
+PARALLEL_RANGES_PER_WORKER = 4
+
+
+def iter_in_order(executor, function, tasks, window):
+    """
+    Runs a function over a list of argument tuples in an executor, with at most window tasks in flight at a time
+    :return: generator of the results in the order of the tasks
+    """
+
+    pending = []
+
+    try:
+        for args in tasks:
+            pending.append(executor.submit(function, *args))
+
+            if len(pending) >= window:
+                yield pending.pop(0).result()
+
+        while len(pending) > 0:
+            yield pending.pop(0).result()
+
+    finally:
+        # a consumer that stops early (i.e. a LIMIT) does not wait for the tasks it will never read
+        for future in pending:
+            future.cancel()
+
+
+def get_workers(workers=None):
+    return workers if workers is not None else os.cpu_count() or 1
+
+
+def is_parallel_csv(filepath, format, workers=None):
+    return format == 'csv' and get_workers(workers) > 1 and os.path.getsize(filepath) >= PARALLEL_MIN_BYTES
+
+
+def count_quotes(mm, start, end, chunk_bytes=COUNT_CHUNK_BYTES):
+
+    count = 0
+
+    for offset in range(start, end, chunk_bytes):
+        chunk = numpy.frombuffer(mm, dtype=numpy.uint8, count=min(chunk_bytes, end - offset), offset=offset)
+        count += int(numpy.count_nonzero(chunk == ord('"')))
+        del chunk
+
+    return count
+
+
+def find_record_start(mm, offset, in_quotes, has_quotes):
+    """
+    Finds the first record boundary at or after offset
+    :param in_quotes: 1 if offset is inside a quoted value, 0 otherwise
+    :return: offset of the first byte of the next record, the file size if there is none
+    """
+
+    while True:
+
+        newline = mm.find(b'\n', offset)
+
+        if newline == -1:
+            return len(mm)
+
+        if has_quotes:
+            in_quotes = (in_quotes + count_quotes(mm, offset, newline)) % 2
+
+        offset = newline + 1
+
+        if in_quotes == 0:
+            return offset
+
+
+def get_csv_byte_ranges(filepath, range_bytes):
+    """
+    Splits the data rows of a CSV file into byte ranges of about range_bytes that start and end on record boundaries.
+    New lines inside quoted values are not taken as boundaries.
+    :return: list of (start, end) byte offsets, the header is left out
+    """
+
+    file_size = os.path.getsize(filepath)
+
+    if file_size == 0:
+        return []
+
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+
+        # most files have no quotes at all, then every new line is a record boundary
+        has_quotes = mm.find(b'"') != -1
+
+        start = find_record_start(mm, 0, in_quotes=0, has_quotes=has_quotes)
+        ranges = []
+
+        # quotes are counted once from the start of the file, to know if a split point falls inside a quoted value
+        counted_to = 0
+        quote_count = 0
+
+        while start < file_size:
+
+            target = min(start + range_bytes, file_size)
+
+            if has_quotes:
+                quote_count += count_quotes(mm, counted_to, target)
+                counted_to = target
+
+            end = find_record_start(mm, target, in_quotes=quote_count % 2, has_quotes=has_quotes)
+
+            if has_quotes:
+                quote_count += count_quotes(mm, counted_to, end)
+                counted_to = end
+
+            ranges.append((start, end))
+            start = end
+
+    return ranges
+
+
+def read_csv_byte_range(filepath, start, end, delimiter, names, columns=None, dtype=None):
+    """
+    Parses the records of a CSV file between two byte offsets, in a worker process
+    :param names: column names from the header of the file
+    :return: Pandas DataFrame
+    """
+
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    # a range of blank lines has no records, pandas would fail to parse it
+    if len(data.strip()) == 0:
+        df = pd.read_csv(filepath, delimiter=delimiter, usecols=columns, nrows=0)
+    else:
+        df = pd.read_csv(io.BytesIO(data), delimiter=delimiter, header=None, names=names, usecols=columns, dtype=dtype)
+
+    return df if columns is None else df[columns]
+
+
+def get_csv_range_bytes(filepath, chunk_rows):
+    """
+    Estimates the number of bytes of chunk_rows records from the first block of the file
+    """
+
+    with open(filepath, 'rb') as f:
+        head = f.read(SNIFF_HEAD_BYTES)
+
+    bytes_per_row = len(head) / max(head.count(b'\n'), 1)
+
+    return max(int(bytes_per_row * chunk_rows), 1024 * 1024)
+
+
+def iter_csv_chunks_parallel(filepath, delimiter, workers=None, range_bytes=None, columns=None, dtype=None, ranges=None):
+    """
+    Parses a CSV file in a process pool, one byte range per task, and yields the pieces in file order.
+    Only a couple of ranges per process are in flight at a time, so the file never has to fit in memory.
+    :param range_bytes: approximate number of bytes per range
+    :param columns: (optional) list of columns to read
+    :return: generator of Pandas DataFrames
+    """
+
+    workers = get_workers(workers)
+    names = read_file_columns(filepath=filepath, format='csv', delimiter=delimiter)
+
+    if ranges is None:
+        ranges = get_csv_byte_ranges(filepath=filepath, range_bytes=range_bytes)
+
+    if len(ranges) == 0:
+        df = pd.read_csv(filepath, delimiter=delimiter, usecols=columns, nrows=0)
+        yield df if columns is None else df[columns]
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+        yield from iter_in_order(executor=executor, function=read_csv_byte_range,
+                                 tasks=[(filepath, start, end, delimiter, names, columns, dtype) for start, end in ranges],
+                                 window=2 * workers)
+
+
+def get_values_kind(values):
+    """
+    :param values: Pandas Series parsed from a CSV file
+    :return: 'empty', 'bool', 'number' or 'text', booleans with nulls are parsed as objects
+    """
+
+    if values.isna().all():
+        return 'empty'
+
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return 'bool'
+
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return 'number'
+
+    if values.dropna().map(type).eq(bool).all():
+        return 'bool'
+
+    return 'text'
+
+
+def read_csv_parallel(filepath, delimiter, workers=None, columns=None):
+    """
+    Reads a full CSV file into a DataFrame, parsing byte ranges of it in a process pool
+    :param columns: (optional) list of columns to read
+    :return: Pandas DataFrame
+    """
+
+    workers = get_workers(workers)
+    data_bytes = os.path.getsize(filepath)
+    ranges = get_csv_byte_ranges(filepath=filepath,
+                                 range_bytes=max(data_bytes // (workers * PARALLEL_RANGES_PER_WORKER), 1024 * 1024))
+
+    pieces = list(iter_csv_chunks_parallel(filepath=filepath, delimiter=delimiter, workers=workers,
+                                           columns=columns, ranges=ranges))
+
+    # every range infers its own types. Read in one go, pandas only keeps numbers or booleans if the whole column
+    # holds them, so a column with text, or more than one kind of values across ranges, has to be text in all of them
+    text_columns = []
+
+    for col in pieces[0].columns:
+        if len({str(piece[col].dtype) for piece in pieces}) > 1:
+            kinds = {get_values_kind(piece[col]) for piece in pieces} - {'empty'}
+            if len(kinds) > 1 or kinds == {'text'}:
+                text_columns.append(col)
+
+    # only those columns, in the ranges where they were parsed as numbers or booleans, are parsed again so their
+    # values keep how they are written, i.e. '007'. Where they are already text there is nothing to do, and where
+    # they are empty only their type changes
+    reparsed = [i for i, piece in enumerate(pieces)
+                if any(get_values_kind(piece[col]) in ['number', 'bool'] for col in text_columns)]
+
+    if len(reparsed) > 0:
+        text_pieces = iter_csv_chunks_parallel(filepath=filepath, delimiter=delimiter, workers=workers,
+                                               columns=text_columns, ranges=[ranges[i] for i in reparsed],
+                                               dtype={col: str for col in text_columns})
+        for i, text_piece in zip(reparsed, text_pieces):
+            for col in text_columns:
+                pieces[i][col] = text_piece[col].set_axis(pieces[i].index)
+
+    for col in text_columns:
+        text_dtype = next(piece[col].dtype for piece in pieces if get_values_kind(piece[col]) == 'text')
+        for piece in pieces:
+            if get_values_kind(piece[col]) == 'empty':
+                piece[col] = piece[col].astype(text_dtype)
+
+    return pd.concat(pieces, ignore_index=True)
+
+
+DEFAULT_CHUNK_ROWS = 100000
+
+# number of counters kept at least for approximate value counts
+APPROX_MIN_CAPACITY = 10000
+
+
+def parse_size(size):
+    """
+    Parses a human readable size like '512MB' or '2G'
+    :return: number of bytes
+    """
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)I?B?\s*", str(size), flags=re.IGNORECASE)
+
+    if match is None:
+        click.echo(f"Ouch! '{size}' is not a valid size, use something like '512MB' or '2GB'")
+        sys.exit(0)
+
+    number, unit = match.groups()
+
+    multipliers = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+    return int(float(number) * multipliers[unit.upper()])
+
+
+def get_chunk_rows(filepath, format, delimiter, max_memory, sample_rows=1000):
+    """
+    Estimates how many rows fit in a memory budget from the in-memory size of the first rows
+    :param max_memory: memory budget in bytes
+    :return: number of rows per chunk
+    """
+
+    sample = read_file_head(filepath=filepath, format=format, delimiter=delimiter, n=sample_rows)
+
+    if sample.shape[0] == 0:
+        return sample_rows
+
+    bytes_per_row = sample.memory_usage(index=False, deep=True).sum() / sample.shape[0]
+
+    # writers make a copy of every chunk, so only half the budget goes to the chunk itself
+    return max(int(max_memory / 2 // max(bytes_per_row, 1)), 1)
+
+
+def iter_file_chunks(filepath, format, delimiter, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None, workers=None, where=None):
+    """
+    Reads a file as a sequence of DataFrames of at most chunk_rows rows, so it never has to fit in memory.
+    Large CSV files are parsed in a process pool, then chunks hold about chunk_rows rows.
+    :param columns: (optional) list of columns to read
+    :param workers: (optional) number of processes parsing large CSV files, defaults to the number of cores
+    :param where: (optional) condition as returned by parse_condition, parquet row groups where it can not be true
+                  are skipped. The rows read are not filtered
+    :return: generator of Pandas DataFrames, at least one even if the file has no rows
+    """
+
+    empty = True
+
+    if is_parallel_csv(filepath=filepath, format=format, workers=workers):
+        range_bytes = get_csv_range_bytes(filepath=filepath, chunk_rows=chunk_rows)
+        for chunk in iter_csv_chunks_parallel(filepath=filepath, delimiter=delimiter, workers=workers,
+                                              range_bytes=range_bytes, columns=columns):
+            empty = False
+            yield chunk
+
+    elif format == 'csv':
+        with pd.read_csv(filepath, delimiter=delimiter, usecols=columns, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                empty = False
+                yield chunk if columns is None else chunk[columns]
+
+    elif format == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(filepath)
+        row_groups = get_parquet_row_groups(filepath=filepath, where=where)
+        # batches of the row groups left are decoded one at a time, so memory is bounded even for huge row groups
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, row_groups=row_groups, columns=columns):
+            empty = False
+            yield batch.to_pandas() if columns is None else batch.to_pandas()[columns]
+
+    elif format == 'excel':
+        for chunk in iter_excel_chunks(filepath=filepath, chunk_rows=chunk_rows):
+            empty = False
+            yield chunk if columns is None else chunk[columns]
+
+    if empty:
+        head = read_file_head(filepath=filepath, format=format, delimiter=delimiter, n=0)
+        yield head if columns is None else head[columns]
+
+
+def assert_col_in_df(df, column):
+    if column not in df.columns:
+        click.echo(f"Ouch! Column '{column}' does not seem to exist...")
+        sys.exit(0)
+
+
+def parse_row_range(rows):
+    """
+    Parses a range of rows like '1000:1100', where either end may be left out
+    :return: tuple (start, stop), stop is None if left out
+    """
+
+    match = re.fullmatch(r"\s*(\d*)\s*:\s*(\d*)\s*", str(rows))
+
+    if match is None:
+        click.echo(f"Ouch! '{rows}' is not a valid range of rows, use something like '1000:1100'")
+        sys.exit(0)
+
+    start = int(match.group(1)) if match.group(1) != '' else 0
+    stop = int(match.group(2)) if match.group(2) != '' else None
+
+    return start, stop
+
+
+def get_ascending(order):
+
+    if order.lower() in ['asc', 'ascending']:
+        return True
+
+    elif order.lower() in ['desc', 'descending']:
+        return False
+
+    click.echo("Ouch! Wrong order value, you can choose either ASC for ascending or DESC for descending")
+    sys.exit(0)
+
+
+def filter_df(df, head=False, n=None, columns=None, sort_by=None, order='ASC'):
+
+    output_df = df
+
+    col_list = None
+
+    if columns is not None:
+
+        col_list = get_col_list(col_string=columns)
+
+        for col in col_list:
+            assert_col_in_df(df=output_df, column=col)
+
+        # keep the sort column until the sort is done, even if it was not selected
+        if sort_by is not None and sort_by not in col_list:
+            output_df = output_df[col_list + [sort_by]]
+        else:
+            output_df = output_df[col_list]
+
+    if sort_by is not None:
+        assert_col_in_df(df=output_df, column=sort_by)
+        output_df = output_df.sort_values(by=sort_by, ascending=get_ascending(order=order))
+
+    if col_list is not None and len(output_df.columns) > len(col_list):
+        output_df = output_df[col_list]
+
+    if head:
+        if n is not None:
+            output_df = output_df.head(n)
+        else:
+            output_df = output_df.head()
+
+    return output_df
+
+
+def get_dtype(series, pretty=False):
+
+    # look up the first non null value without copying the series
+    not_null = series.notna().to_numpy()
+
+    if not_null.any():
+
+        value = series.values[not_null.argmax()]
+
+        if pretty:
+            return type(value).__name__
+
+        else:
+            return type(value)
+
+    else:
+        return None
+
+
+def get_dtypes(df, pretty=False):
+
+    type_dict_list = [{"column_name": col, 'data_type': get_dtype(df[col], pretty)} for col in df.columns]
+
+    return pd.DataFrame(type_dict_list)
+
+
+# text columns with at most this share of unique values are loaded as categoricals in compact mode
+CATEGORY_MAX_RATIO = 0.5
+
+
+def get_compact_series(series, category_max_ratio=CATEGORY_MAX_RATIO):
+    """
+    Converts a column to the smallest data type that holds the same values: smaller integers, float32 when no
+    precision is lost, categoricals for repetitive text and Arrow-backed strings for the rest of the text
+    :return: Pandas Series
+    """
+
+    dtype = series.dtype
+
+    if pd.api.types.is_bool_dtype(dtype):
+        return series
+
+    if pd.api.types.is_integer_dtype(dtype):
+        return pd.to_numeric(series, downcast='integer')
+
+    if pd.api.types.is_float_dtype(dtype) and dtype != 'float32':
+        compact = series.astype('float32')
+        if ((compact.astype(dtype) == series) | series.isna()).all():
+            return compact
+        return series
+
+    if dtype == object or (pd.api.types.is_string_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype)):
+
+        if series.shape[0] > 0 and series.nunique() <= category_max_ratio * series.shape[0]:
+            return series.astype('category')
+
+        # object columns may hold anything, only text goes to Arrow, and other string types are already compact
+        if dtype != object or pd.api.types.infer_dtype(series, skipna=True) != 'string':
+            return series
+
+        return series.astype(pd.StringDtype('pyarrow'))
+
+    return series
+
+
+def get_compact_df(df):
+    """
+    Converts every column of a DataFrame to the smallest data type that holds the same values
+    :return: Pandas DataFrame
+    """
+
+    return pd.DataFrame({col: get_compact_series(df[col]) for col in df.columns}, index=df.index)
+
+
+def get_memory_report(df):
+    """
+    Memory taken by every column of a DataFrame, as loaded and in compact mode.
+    Columns are converted one at a time, so only one compact copy of a column is in memory
+    :return: Pandas DataFrame with one row per column
+    """
+
+    report = []
+
+    for col in df.columns:
+
+        compact = get_compact_series(df[col])
+
+        report.append({'column_name': col,
+                       'data_type': str(df[col].dtype),
+                       'memory_bytes': int(df[col].memory_usage(index=False, deep=True)),
+                       'compact_data_type': str(compact.dtype),
+                       'compact_memory_bytes': int(compact.memory_usage(index=False, deep=True))})
+
+        del compact
+
+    return pd.DataFrame(report, columns=['column_name', 'data_type', 'memory_bytes',
+                                         'compact_data_type', 'compact_memory_bytes'])
+
+
+def format_size(size):
+    """
+    Formats a number of bytes in a human readable way like '512.0MB'
+    """
+
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != 'B' else f"{size}B"
+        size /= 1024
+
+    return f"{size:.1f}TB"
+
+
+def get_summary_stats(df):
+
+    return df.describe()
+
+
+def get_numeric_columns(df):
+
+    return df.select_dtypes(include='number').columns.tolist()
+
+
+@check_path
+def read_parquet_numeric_columns(filepath):
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(filepath)
+
+    return [field.name for field in schema if not is_pandas_index_column(field.name)
+            and (pa.types.is_integer(field.type) or pa.types.is_floating(field.type))]
+
+
+def get_summary_stats_in_chunks(chunks, columns):
+    """
+    Computes summary statistics in one pass over a sequence of chunks, with approximate percentiles
+    :param columns: list of numeric columns to describe
+    :return: Pandas DataFrame laid out like DataFrame.describe(), without the columns that hold text further down
+    """
+
+    sketch = SummaryStatsSketch(columns=columns)
+    text_columns = set()
+
+    for chunk in chunks:
+        # columns are picked from the first rows, a later chunk can still turn them into text
+        text_columns.update(column for column in columns if get_values_kind(chunk[column]) in ('bool', 'text'))
+        sketch.update(chunk)
+
+    df = sketch.to_frame()
+
+    if text_columns:
+        # the values would be coerced to NaN, the full file describe() leaves such columns out as well
+        skipped = [column for column in columns if column in text_columns]
+        df = df.drop(columns=skipped)
+
+        # with no column left the caller describes the text columns instead
+        if len(df.columns) > 0:
+            click.echo(f"Columns {skipped} hold non numeric values further down the file, "
+                       f"so they were left out of the summary statistics", err=True)
+
+    return df
+
+
+def get_row_group_summary_stats_sketch(filepath, row_group, columns):
+
+    import pyarrow.parquet as pq
+
+    table = pq.ParquetFile(filepath).read_row_group(row_group, columns=columns)
+
+    sketch = SummaryStatsSketch(columns=columns)
+    sketch.update(table.to_pandas())
+
+    return sketch
+
+
+def get_parquet_summary_stats(filepath, columns, workers=None):
+    """
+    Computes summary statistics of a parquet file one row group at a time in a process pool, merging the partial results
+    :param columns: list of numeric columns to describe
+    :param workers: (optional) number of processes, defaults to the number of cores
+    :return: Pandas DataFrame laid out like DataFrame.describe()
+    """
+
+    import pyarrow.parquet as pq
+
+    row_group_count = pq.ParquetFile(filepath).metadata.num_row_groups
+    workers = min(get_workers(workers), row_group_count)
+
+    sketch = SummaryStatsSketch(columns=columns)
+
+    # starting processes only pays off when there are several row groups to spread
+    if workers <= 1:
+        for row_group in range(row_group_count):
+            sketch.merge(get_row_group_summary_stats_sketch(filepath, row_group, columns))
+
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial_sketch in executor.map(get_row_group_summary_stats_sketch,
+                                               [filepath] * row_group_count, range(row_group_count),
+                                               [columns] * row_group_count):
+                sketch.merge(partial_sketch)
+
+    return sketch.to_frame()
+
+
+def get_null_columns(df):
+
+    null_df = df.isna().sum().reset_index().rename(columns={'index': 'column_name', 0: 'count_of_nulls'})
+
+    return null_df
+
+
+def get_null_columns_in_chunks(chunks):
+    """
+    Counts the null values per column in one pass over a sequence of chunks
+    :return: Pandas DataFrame with one row per column
+    """
+
+    null_counts = None
+
+    for chunk in chunks:
+        chunk_null_counts = chunk.isna().sum()
+        null_counts = chunk_null_counts if null_counts is None else null_counts + chunk_null_counts
+
+    return null_counts.rename_axis('column_name').reset_index(name='count_of_nulls')
+
+
+@check_path
+def read_parquet_null_counts(filepath):
+    """
+    Adds up the null counts stored in the row group statistics of a parquet file, without reading any data.
+    Columns without statistics are read, one at a time.
+    :return: Pandas DataFrame with one row per column
+    """
+
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(filepath)
+    metadata = parquet_file.metadata
+
+    columns = [col for col in parquet_file.schema_arrow.names if not is_pandas_index_column(col)]
+    null_counts = {col: 0 for col in columns}
+    without_statistics = set()
+
+    for row_group in range(metadata.num_row_groups):
+
+        row_group_metadata = metadata.row_group(row_group)
+
+        for index in range(row_group_metadata.num_columns):
+
+            column_metadata = row_group_metadata.column(index)
+            col = column_metadata.path_in_schema
+            statistics = column_metadata.statistics
+
+            # nested columns are stored as several leaf columns, their statistics do not add up to the column's
+            if col not in null_counts:
+                without_statistics.add(col.split('.')[0])
+
+            elif statistics is None or not statistics.has_null_count:
+                without_statistics.add(col)
+
+            else:
+                null_counts[col] += statistics.null_count
+
+    for col in without_statistics:
+        if col in null_counts:
+            null_counts[col] = parquet_file.read(columns=[col]).column(col).null_count
+
+    return pd.DataFrame({'column_name': columns, 'count_of_nulls': [null_counts[col] for col in columns]})
+
+
+def get_df_casted_to_supported_types(df):
+
+    # pandasql uses SQLite syntax
+    # SQLite does not support arrays
+    # In order to not have the query crash whenever an array is in the query result we need to cast arrays into strings
+    # We also cast dictionaries and dates into str to be on the safe side
+
+    not_supported_types = [numpy.ndarray, list, tuple, set, dict, numpy.datetime64]
+
+    bad_columns = [col for col in df.columns if get_dtype(df[col]) in not_supported_types]
+
+    for col in bad_columns:
+        df[col] = df[col].astype(str)
+
+    return df
+
+
+def get_query_columns(query, columns):
+    """
+    Finds which columns of the file a SQL query refers to, so only those need to be read
+    :param query: SQL query against the 'file' table
+    :param columns: list of column names of the file
+    :return: list of referenced columns in file order, None if the query needs all of them
+    """
+
+    # string literals and comments can not refer to columns
+    query = re.sub(r"'(?:[^']|'')*'", "''", query)
+    query = re.sub(r"--[^\n]*|/\*.*?\*/", " ", query, flags=re.DOTALL)
+
+    # SELECT * or file.* selects every column, as opposed to COUNT(*) or a product
+    if re.search(r"(\bselect|\bdistinct|,|\.)\s*\*", query, flags=re.IGNORECASE):
+        return None
+
+    identifiers = set()
+
+    for token in re.findall(r'"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[A-Za-z_][A-Za-z0-9_$]*', query):
+        if token[0] in '"`[':
+            token = token[1:-1].replace('""', '"')
+        identifiers.add(token.lower())
+
+    query_columns = get_columns_named(names=identifiers, columns=columns)
+
+    # a query like SELECT COUNT(1) FROM file still needs the rows, so we read the first column
+    if len(query_columns) == 0 and len(columns) > 0:
+        query_columns = [columns[0]]
+
+    return query_columns
+
+
+def get_columns_named(names, columns):
+    """
+    :param names: set of lowercase names used in a query or a filter
+    :param columns: list of column names of the file
+    :return: list of the columns the names refer to, in file order
+    """
+
+    # queries refer to columns with their spaces converted to underscores
+    return [col for col in columns if str(col).lower() in names or str(col).replace(' ', '_').lower() in names]
+
+
+def get_df_with_queryable_columns(df):
+
+    # if the column names contain spaces, convert them to underscores so you can still query them
+    return df.set_axis([col.replace(' ', '_') for col in df.columns], axis=1)
+
+
+def get_query_where(query):
+    """
+    :return: WHERE condition of a SQL query as returned by parse_condition, None if it has none or can not be parsed
+    """
+
+    try:
+        return parse_query(query)['where']
+    except UnsupportedQuery:
+        return None
+
+
+def parse_filter(condition):
+
+    try:
+        return parse_condition(condition)
+    except UnsupportedQuery as error:
+        click.echo(f"Ouch! Your filter could not be parsed: {error}")
+        sys.exit(0)
+
+
+def get_filter_columns(condition, columns):
+    """
+    :return: list of the columns of the file a filter refers to, in file order
+    """
+
+    return get_columns_named(names={name.lower() for name in get_expr_columns(condition)}, columns=columns)
+
+
+def get_sql_errors():
+    """
+    :return: tuple of the exceptions pandasql raises when SQLite can not run a query, they depend on the versions of
+             pandas and SQLAlchemy installed
+    """
+
+    import sqlite3
+    from pandasql.sqldf import PandaSQLException
+
+    errors = [PandaSQLException, sqlite3.Error]
+
+    if hasattr(pd.errors, 'DatabaseError'):
+        errors.append(pd.errors.DatabaseError)
+
+    try:
+        from sqlalchemy.exc import DBAPIError
+        errors.append(DBAPIError)
+    except ImportError:
+        pass
+
+    return tuple(errors)
+
+
+def get_sql_error_message(error):
+
+    # the error of SQLite itself reads best, pandas and SQLAlchemy wrap it in theirs
+    while error.__cause__ is not None:
+        error = error.__cause__
+
+    return str(error).split('\n')[0]
+
+
+# column numbering the rows of a DataFrame copied into SQLite to filter it
+ROW_NUMBER_COLUMN = '__csvcli_row_number'
+
+
+def get_row_mask_with_sqlite(df, filter_text):
+    """
+    Evaluates a filter in SQLite, for the conditions the engine leaves to it, i.e. dates compared with text
+    :param filter_text: SQL condition as written by the user
+    :return: NumPy boolean array, true for the rows of df where the condition is true
+    """
+
+    import pandasql as psql
+
+    mask = numpy.zeros(df.shape[0], dtype=bool)
+
+    if df.shape[0] == 0:
+        return mask
+
+    file = get_df_casted_to_supported_types(
+        get_df_with_queryable_columns(df).assign(**{ROW_NUMBER_COLUMN: numpy.arange(df.shape[0])}))
+
+    try:
+        rows = psql.sqldf(f"SELECT {ROW_NUMBER_COLUMN} FROM file WHERE {filter_text}", {'file': file})
+
+    except get_sql_errors() as e:
+
+        error = get_sql_error_message(e)
+
+        click.echo(f"Ouch! Your filter failed: {error}")
+
+        sys.exit(0)
+
+    mask[rows[ROW_NUMBER_COLUMN].to_numpy(dtype=numpy.int64)] = True
+
+    return mask
+
+
+def filter_df_by_condition(df, condition, filter_text):
+    """
+    :param condition: condition as returned by parse_condition
+    :param filter_text: the same condition as written by the user, it runs through SQLite if the engine can not run it
+    """
+
+    try:
+        return filter_rows(df=df, where=condition)
+    except UnsupportedQuery:
+        return df[get_row_mask_with_sqlite(df=df, filter_text=filter_text)]
+
+
+def get_first_rows(chunks, n):
+    """
+    :param chunks: iterable of Pandas DataFrames, there must be at least one
+    :return: Pandas DataFrame with the first n rows of the chunks, the rest are not read
+    """
+
+    parts = []
+    row_count = 0
+
+    for chunk in chunks:
+        parts.append(chunk.head(n - row_count))
+        row_count += parts[-1].shape[0]
+        if row_count >= n:
+            break
+
+    return pd.concat(parts, ignore_index=True)
+
+
+def filter_table_by_condition(table, condition, filter_text):
+    """
+    Filters an Arrow table. Only the columns the condition refers to are converted to pandas to find the rows
+    :param condition: condition as returned by parse_condition
+    :param filter_text: the same condition as written by the user, it runs through SQLite if the engine can not run it
+    :return: Arrow table with the rows where the condition is true
+    """
+
+    import pyarrow as pa
+
+    df = table.select(get_filter_columns(condition=condition, columns=table.column_names)).to_pandas()
+
+    # a condition without columns still has to be evaluated once per row
+    df.index = pd.RangeIndex(table.num_rows)
+
+    try:
+        mask = get_row_mask(df=df, where=condition)
+    except UnsupportedQuery:
+        mask = get_row_mask_with_sqlite(df=df, filter_text=filter_text)
+
+    return table.filter(pa.array(mask))
+
+
+def iter_first_table_rows(tables, n):
+    """
+    :param tables: iterable of Arrow tables, there must be at least one
+    :return: generator of Arrow tables with the first n rows of the tables, the rest are not read
+    """
+
+    for table in tables:
+
+        # slices share the buffers of the table
+        yield table.slice(0, n)
+
+        n -= table.num_rows
+        if n <= 0:
+            return
+
+
+def filter_df_by_query(df, query):
+
+    import pandasql as psql
+
+    df = get_df_with_queryable_columns(df)
+
+    # most queries run directly on the DataFrame, without copying it into SQLite
+    try:
+        return execute_query(df=df, query=query)
+
+    except Exception:
+        pass
+
+    file = get_df_casted_to_supported_types(df)
+
+    try:
+        result_df = psql.sqldf(query, {**locals(), **globals()})
+
+    except get_sql_errors() as e:
+
+        error = get_sql_error_message(e)
+
+        click.echo(f"Ouch! Your SQL query failed: {error}")
+
+        sys.exit(0)
+
+    return result_df
+
+
+def iter_query_result_chunks(filepath, format, delimiter, query, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS, workers=None):
+    """
+    Runs a query that only filters and projects rows over the file chunk by chunk, without loading it
+    :param columns: (optional) list of columns the query refers to, the others are not read
+    :return: generator of Pandas DataFrames with the result rows, None if the query needs the whole file at once
+    """
+
+    try:
+        parsed = parse_query(query)
+    except UnsupportedQuery:
+        return None
+
+    if not is_streamable_query(parsed):
+        return None
+
+    chunks = iter_file_chunks(filepath=filepath, format=format, delimiter=delimiter, chunk_rows=chunk_rows, columns=columns,
+                              workers=workers, where=parsed['where'])
+
+    return iter_query_chunks(chunks=(get_df_with_queryable_columns(chunk) for chunk in chunks), parsed=parsed)
+
+
+def query_file_in_chunks(filepath, format, delimiter, query, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS, workers=None):
+    """
+    Runs a filter and projection query chunk by chunk, reading the file only until its LIMIT is met
+    :return: Pandas DataFrame with the query result, None if the query can not run in chunks
+    """
+
+    results = iter_query_result_chunks(filepath=filepath, format=format, delimiter=delimiter, query=query,
+                                       columns=columns, chunk_rows=chunk_rows, workers=workers)
+
+    if results is None:
+        return None
+
+    # a chunk may not fit the engine (i.e. a column read with another type), then the whole file is queried
+    try:
+        return pd.concat(list(results), ignore_index=True)
+    except Exception:
+        return None
+
+
+def iter_query_in_chunks(filepath, format, delimiter, query, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS, workers=None):
+    """
+    Runs a filter and projection query chunk by chunk, for results written out as soon as every chunk is ready
+    :return: generator of Pandas DataFrames with the query result, None if the query can not run in chunks
+    """
+
+    results = iter_query_result_chunks(filepath=filepath, format=format, delimiter=delimiter, query=query,
+                                       columns=columns, chunk_rows=chunk_rows, workers=workers)
+
+    if results is None:
+        return None
+
+    # the first rows are written before the rest of the file is read, so the columns the query computes with must
+    # hold the same kind of values all along, as they do when the whole file is queried. Parquet files have one
+    # schema, every chunk of a CSV file infers its own
+    if format == 'csv' and not has_stable_kinds(filepath=filepath, delimiter=delimiter,
+                                                columns=get_computed_columns(query=query, columns=read_file_columns(
+                                                    filepath=filepath, format=format, delimiter=delimiter)),
+                                                chunk_rows=chunk_rows, workers=workers):
+        return None
+
+    # nothing is written until the first rows of the result are ready, so a query that does not fit the engine can
+    # still be run on the whole file
+    try:
+        first = next(results)
+
+        while first.shape[0] == 0:
+            result = next(results, None)
+            if result is None:
+                break
+            first = result
+
+    except Exception:
+        return None
+
+    return iter_written_results(first=first, results=results)
+
+
+def get_computed_columns(query, columns):
+    """
+    :param columns: list of column names of the file
+    :return: list of the columns a filter and projection query compares or computes with, the ones it only selects
+             are left out
+    """
+
+    parsed = parse_query(query)
+
+    names = get_expr_columns(parsed['where']) if parsed['where'] is not None else []
+
+    for item in parsed['items']:
+        if not item['star'] and item['expr'][0] != 'column':
+            names += get_expr_columns(item['expr'])
+
+    return get_columns_named(names={name.lower() for name in names}, columns=columns)
+
+
+def has_stable_kinds(filepath, delimiter, columns, chunk_rows=DEFAULT_CHUNK_ROWS, workers=None):
+    """
+    Reads columns of a CSV file chunk by chunk to check their values are of one kind, see get_values_kind
+    :return: true if every column holds only numbers, only text or only booleans in the whole file
+    """
+
+    if len(columns) == 0:
+        return True
+
+    kinds = {col: set() for col in columns}
+
+    for chunk in iter_file_chunks(filepath=filepath, format='csv', delimiter=delimiter, chunk_rows=chunk_rows,
+                                  columns=columns, workers=workers):
+        for col in columns:
+            kinds[col].add(get_values_kind(chunk[col]))
+
+    return all(len(col_kinds - {'empty'}) <= 1 for col_kinds in kinds.values())
+
+
+def iter_written_results(first, results):
+    """
+    Goes on with a query result once its first rows are written, which can not be taken back if a later chunk fails
+    :return: generator of Pandas DataFrames, first and then the rest of results
+    """
+
+    yield first
+
+    while True:
+
+        try:
+            result = next(results)
+
+        except StopIteration:
+            return
+
+        # i.e. a value the engine can not compute further down the file
+        except Exception as error:
+            click.echo(f"Ouch! Your query failed after part of its result was written ({error}). "
+                       f"Save it with -save instead, then it runs on the whole file at once", err=True)
+            sys.exit(1)
+
+        yield result
+
+
+def save_query_in_chunks(filepath, format, delimiter, query, save_to, columns=None, chunk_rows=DEFAULT_CHUNK_ROWS,
+                         workers=None):
+    """
+    Runs a filter and projection query chunk by chunk and writes every chunk of the result as soon as it is ready
+    :return: true if the result was written, false if that failed, None if the query can not run in chunks
+    """
+
+    results = iter_query_result_chunks(filepath=filepath, format=format, delimiter=delimiter, query=query,
+                                       columns=columns, chunk_rows=chunk_rows, workers=workers)
+
+    if results is None:
+        return None
+
+    file_ext = get_file_extension(save_to)
+
+    return write_chunks_to_file(chunks=results, filepath=save_to,
+                                desired_format=get_format_from_file_extension(file_extension=file_ext))
+
+
+def get_value_counts(df, column):
+
+    result = df[column].value_counts().rename_axis('unique_value').reset_index(name='count')
+
+    return result
+
+
+def get_value_counts_in_chunks(chunks, column):
+    """
+    Counts the unique values of a column over a sequence of chunks, merging the counts of every chunk
+    :return: Pandas DataFrame with the unique values and their counts, most frequent first
+    """
+
+    counts = pd.Series(dtype='int64')
+
+    for chunk in chunks:
+        counts = counts.add(chunk[column].value_counts(), fill_value=0)
+
+    counts = counts.astype('int64').sort_values(ascending=False, kind='mergesort')
+
+    return counts.rename_axis('unique_value').reset_index(name='count')
+
+
+def get_approx_value_counts(chunks, column, top, capacity=None):
+    """
+    Finds the most frequent values of a column with a bounded number of counters, for columns with too many unique values
+    :param top: number of values to return
+    :param capacity: (optional) number of counters kept, the more the tighter the error bound
+    :return: tuple (Pandas DataFrame with the top values, maximum error of every count)
+    """
+
+    sketch = FrequentItemsSketch(capacity=capacity if capacity is not None else max(top * 10, APPROX_MIN_CAPACITY))
+
+    for chunk in chunks:
+        sketch.update(chunk[column])
+
+    return sketch.top(top), sketch.error
 
 
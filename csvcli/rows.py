@@ -0,0 +1,227 @@
+"""
+Rows of a file read on demand by position, so a viewer can browse files much larger than memory.
+
+Paged sources split the file into pages of rows: row groups for parquet files, and runs of rows found by byte offset
+for CSV files. Only the pages that are looked at are read, and a few of them are kept in an LRU cache.
+"""
+
+import bisect
+from collections import OrderedDict
+import pandas as pd
+from csvcli.functions import iter_csv_record_offsets, read_csv_byte_range, read_file_columns, is_pandas_index_column
+
+
+# number of rows of a CSV page
+CSV_PAGE_ROWS = 1000
+
+# number of pages kept in memory
+PAGE_CACHE_SIZE = 8
+
+
+class RowSource:
+    """
+    Rows of a table, by position
+    """
+
+    columns = []
+
+    @property
+    def row_count(self):
+        """
+        Number of rows, None while it is not known
+        """
+        raise NotImplementedError
+
+    def count_rows(self, limit):
+        """
+        :return: number of rows, but no more than limit, reading only as far as needed to know it
+        """
+        raise NotImplementedError
+
+    def get_row_count(self):
+        """
+        :return: number of rows, going through the whole file if needed
+        """
+        raise NotImplementedError
+
+    def get_rows(self, start, stop):
+        """
+        :return: Pandas DataFrame with the rows from start to stop, fewer if the table ends before
+        """
+        raise NotImplementedError
+
+
+class DataFrameRowSource(RowSource):
+
+    def __init__(self, df):
+        self.df = df
+        self.columns = df.columns.tolist()
+
+    @property
+    def row_count(self):
+        return self.df.shape[0]
+
+    def count_rows(self, limit):
+        return min(limit, self.df.shape[0])
+
+    def get_row_count(self):
+        return self.df.shape[0]
+
+    def get_rows(self, start, stop):
+        return self.df.iloc[start:stop]
+
+
+class PagedRowSource(RowSource):
+    """
+    Rows read one page at a time. Subclasses find where pages start with find_next_page and read them with read_page
+    """
+
+    def __init__(self, columns, cache_size=PAGE_CACHE_SIZE):
+        self.columns = columns
+        self.cache_size = cache_size
+        self.pages = OrderedDict()
+
+        # row where every known page starts, the last item is where the last known page ends
+        self.page_starts = [0]
+        self.complete = False
+
+    def find_next_page(self):
+        """
+        Appends the end of the next page to page_starts, or sets complete if there are no more pages
+        """
+        self.complete = True
+
+    def read_page(self, page):
+        raise NotImplementedError
+
+    def slice_page(self, data, start, stop):
+        return data.iloc[start:stop]
+
+    def find_pages(self, row):
+
+        # pages are found in order, until the one holding the row
+        while not self.complete and self.page_starts[-1] <= row:
+            self.find_next_page()
+
+    @property
+    def row_count(self):
+        return self.page_starts[-1] if self.complete else None
+
+    def count_rows(self, limit):
+        self.find_pages(row=limit - 1)
+        return min(limit, self.page_starts[-1])
+
+    def get_row_count(self):
+
+        while not self.complete:
+            self.find_next_page()
+
+        return self.page_starts[-1]
+
+    def get_page(self, page):
+
+        if page in self.pages:
+            self.pages.move_to_end(page)
+        else:
+            self.pages[page] = self.read_page(page)
+            while len(self.pages) > self.cache_size:
+                self.pages.popitem(last=False)
+
+        return self.pages[page]
+
+    def get_rows(self, start, stop):
+
+        stop = self.count_rows(stop)
+        parts = []
+        row = start
+
+        while row < stop:
+            page = bisect.bisect_right(self.page_starts, row) - 1
+            page_start = self.page_starts[page]
+            page_stop = min(self.page_starts[page + 1], stop)
+
+            parts.append(self.slice_page(self.get_page(page), row - page_start, page_stop - page_start))
+            row = page_stop
+
+        if len(parts) == 0:
+            return self.slice_page(self.get_page(0), 0, 0) if self.page_starts[-1] > 0 else \
+                pd.DataFrame(columns=self.columns)
+
+        df = pd.concat(parts, ignore_index=True)
+        df.index = pd.RangeIndex(start, start + df.shape[0])
+
+        return df
+
+
+class ParquetRowSource(PagedRowSource):
+    """
+    Pages are the row groups of the file, their sizes are known from the footer
+    """
+
+    def __init__(self, filepath, cache_size=PAGE_CACHE_SIZE):
+
+        import pyarrow.parquet as pq
+
+        self.filepath = filepath
+        self.parquet_file = pq.ParquetFile(filepath)
+
+        # the index pandas may have stored along the data is not shown
+        super().__init__(columns=[col for col in self.parquet_file.schema_arrow.names if not is_pandas_index_column(col)],
+                         cache_size=cache_size)
+
+        metadata = self.parquet_file.metadata
+        for row_group in range(metadata.num_row_groups):
+            self.page_starts.append(self.page_starts[-1] + metadata.row_group(row_group).num_rows)
+
+        self.complete = True
+
+    def read_page(self, page):
+
+        # the row group stays in Arrow format, only the rows on screen are converted
+        return self.parquet_file.read_row_group(page, columns=self.columns)
+
+    def slice_page(self, data, start, stop):
+        return data.slice(start, stop - start).to_pandas()
+
+
+class CsvRowSource(PagedRowSource):
+    """
+    Pages are runs of CSV_PAGE_ROWS rows, whose byte offsets are found as the viewer moves down the file.
+    With an index (see build_csv_index) all the offsets are known from the start, and pages are runs of its rows
+    """
+
+    def __init__(self, filepath, delimiter, page_rows=CSV_PAGE_ROWS, cache_size=PAGE_CACHE_SIZE, index=None):
+
+        self.filepath = filepath
+        self.delimiter = delimiter
+
+        super().__init__(columns=read_file_columns(filepath=filepath, format='csv', delimiter=delimiter),
+                         cache_size=cache_size)
+
+        if index is not None:
+            self.page_starts = list(range(0, index['row_count'], index['every'])) + [index['row_count']]
+            self.page_offsets = index['offsets']
+            self.complete = True
+            return
+
+        self.offsets = iter_csv_record_offsets(filepath=filepath, every=page_rows)
+
+        # the first offset is where the data starts, right after the header
+        self.page_offsets = [next(self.offsets)[1]]
+
+    def find_next_page(self):
+
+        item = next(self.offsets, None)
+
+        if item is None:
+            self.complete = True
+            return
+
+        row, offset = item
+        self.page_starts.append(row)
+        self.page_offsets.append(offset)
+
+    def read_page(self, page):
+        return read_csv_byte_range(filepath=self.filepath, start=int(self.page_offsets[page]),
+                                   end=int(self.page_offsets[page + 1]),
+                                   delimiter=self.delimiter, names=self.columns)
@@ -0,0 +1,703 @@
+"""
+Server that keeps files loaded in memory across csvcli commands.
+
+`csvcli serve` listens on a Unix socket. While it runs, the commands that read a file are sent to it instead of being
+run by a new process. It forks a process per command, with the terminal of the caller as its stdin, stdout and stderr.
+Commands browse, pipe and exit the same way they do on their own, only without starting python and importing pandas
+every time.
+
+The first command that goes through a whole file runs without waiting for it, while a process of its own loads the file
+in the background. Once loaded, that process keeps it and forks the next commands on the file, so they do not parse it
+again. Files are loaded again when they change, files larger than the memory budget are not kept, and the least
+recently used ones are dropped once they take more than it.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import array
+import signal
+import socket
+import struct
+import selectors
+import tempfile
+import traceback
+import contextlib
+from collections import OrderedDict
+
+
+SOCKET_ENV = 'CSVCLI_SOCKET'
+
+# largest request accepted, the arguments and environment of the command
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# length of a request handed over to the process that keeps its file, see hand_over_request
+HANDOVER_HEADER = struct.Struct('!I')
+
+
+def is_supported():
+
+    # processes are forked and terminals are passed over Unix sockets
+    return hasattr(os, 'fork') and hasattr(socket, 'SCM_RIGHTS')
+
+
+def get_socket_path():
+
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), f"csvcli-{os.getuid()}.sock")
+
+
+def parse_args(args):
+    """
+    :return: click context of the arguments, without running anything, None if they can not be parsed
+    """
+
+    import click
+    from csvcli.cli import cli
+
+    try:
+        return cli.make_context('csvcli', list(args), resilient_parsing=True)
+    except click.ClickException:
+        return None
+
+
+def get_command_name(args):
+    """
+    :return: name of the command the arguments run, i.e. 'head', None if they can not be parsed
+    """
+
+    ctx = parse_args(args)
+
+    if ctx is None:
+        return None
+
+    # click keeps the command and its arguments apart from the rest of the arguments left
+    remaining = getattr(ctx, '_protected_args', None)
+    if remaining is None:
+        remaining = ctx.protected_args
+
+    return remaining[0] if len(remaining) > 0 else None
+
+
+def get_file_key(args):
+    """
+    What tells apart the ways the file of a command is loaded, as far as its arguments and environment tell, without
+    reading the file
+    :return: tuple, None if the command does not name a file
+    """
+
+    from csvcli.cache import CACHE_DIR_ENV
+
+    ctx = parse_args(args)
+
+    if ctx is None or ctx.params.get('filepath') is None or not os.path.isfile(ctx.params['filepath']):
+        return None
+
+    return (os.path.abspath(ctx.params['filepath']), ctx.params['delimiter'], ctx.params['compact'], ctx.params['cache'],
+            ctx.params['cache_hash'], os.environ.get(CACHE_DIR_ENV))
+
+
+def send_message(conn, message):
+    conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def forward_command(args, socket_path=None):
+    """
+    Runs a command on the server, if there is one listening, with the terminal of this process
+    :return: exit status of the command, None if it was not run so it has to run here
+    """
+
+    from csvcli.cli import SERVE_COMMANDS
+
+    if not is_supported():
+        return None
+
+    socket_path = socket_path if socket_path is not None else get_socket_path()
+
+    # never hand the terminal over to a socket of another user
+    try:
+        if os.stat(socket_path).st_uid != os.getuid():
+            return None
+    except OSError:
+        return None
+
+    if get_command_name(args) not in SERVE_COMMANDS:
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(socket_path)
+        request = json.dumps({'args': list(args), 'cwd': os.getcwd(), 'env': dict(os.environ)}).encode('utf-8') + b'\n'
+        sock.sendmsg([request], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [0, 1, 2]))])
+    except OSError:
+        sock.close()
+        return None
+
+    reader = sock.makefile('rb')
+    pid = None
+
+    def forward_signal(signum, frame):
+        if pid is not None:
+            os.kill(pid, signum)
+
+    # the command runs in another session, so signals from the terminal only reach this process
+    if hasattr(signal, 'SIGWINCH'):
+        signal.signal(signal.SIGWINCH, forward_signal)
+
+    while True:
+
+        try:
+            line = reader.readline()
+        except KeyboardInterrupt:
+            forward_signal(signal.SIGINT, None)
+            if pid is None:
+                return 130
+            continue
+        except OSError:
+            line = b''
+
+        # the server went away before starting the command, or while running it
+        if len(line) == 0:
+            return None if pid is None else 1
+
+        message = json.loads(line)
+
+        if 'pid' in message:
+            pid = message['pid']
+        elif 'status' in message:
+            return message['status']
+
+
+def use_caller_environment(request):
+
+    # the command runs as it would for the caller, from its directory and with its environment
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+
+
+def receive_request(conn):
+    """
+    :return: tuple (request dict, list of file descriptors of the stdin, stdout and stderr of the caller)
+    """
+
+    fds = array.array('i')
+    data, ancdata, flags, address = conn.recvmsg(MAX_REQUEST_BYTES, socket.CMSG_SPACE(3 * fds.itemsize))
+
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - (len(cmsg_data) % fds.itemsize)])
+
+    while not data.endswith(b'\n') and len(data) < MAX_REQUEST_BYTES:
+        block = conn.recv(MAX_REQUEST_BYTES)
+        if len(block) == 0:
+            break
+        data += block
+
+    return json.loads(data), list(fds)
+
+
+def get_file_version(filepath):
+    """
+    :return: what tells apart the versions of a file without reading it, None if it can not be read
+    """
+
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+
+    return stat.st_size, stat.st_mtime_ns
+
+
+def hand_over_request(sock, conn, request, fds):
+    """
+    Sends a request to the process that keeps its file, along with the connection of the caller and its terminal.
+    The length goes first and carries the file descriptors, so requests sent in a row are never read as one
+    """
+
+    payload = json.dumps(request).encode('utf-8')
+
+    sock.sendmsg([HANDOVER_HEADER.pack(len(payload))],
+                 [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', [conn.fileno()] + fds))])
+    sock.sendall(payload)
+
+
+def receive_exactly(sock, size, data=b''):
+
+    while len(data) < size:
+        block = sock.recv(size - len(data))
+        if len(block) == 0:
+            raise EOFError()
+        data += block
+
+    return data
+
+
+def receive_handed_over_request(sock):
+    """
+    :return: tuple (request dict, connection of the caller, list of file descriptors of its terminal)
+    :raise EOFError: once the server went away
+    """
+
+    fds = array.array('i')
+    header, ancdata, flags, address = sock.recvmsg(HANDOVER_HEADER.size, socket.CMSG_SPACE(4 * fds.itemsize))
+
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - (len(cmsg_data) % fds.itemsize)])
+
+    if len(header) == 0:
+        raise EOFError()
+
+    header = receive_exactly(sock, size=HANDOVER_HEADER.size, data=header)
+    request = json.loads(receive_exactly(sock, size=HANDOVER_HEADER.unpack(header)[0]))
+
+    return request, socket.socket(fileno=fds[0]), list(fds[1:])
+
+
+def keep_file(sock, args, max_bytes, close):
+    """
+    Body of the process that keeps a file: loads it, then forks the commands on it the server hands over, until the
+    server goes away or the file changes. Never returns
+    :param sock: its end of the socket shared with the server, the size of the file is sent there once it is loaded
+    :param close: sockets of the server it does not use
+    """
+
+    from csvcli.cli import CACHE_BUILD_COMMANDS, CommonContext
+    from csvcli.cache import get_file_fingerprint
+    from csvcli.functions import format_size
+
+    try:
+        for other in close:
+            other.close()
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+        start = time.time()
+
+        # errors are left for the commands, they show them to the caller
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                params = parse_args(args).params
+                common_ctx = CommonContext(params['filepath'], params['delimiter'], params['workers'], params['compact'],
+                                           'plain', params['cache'], params['cache_hash'],
+                                           build_cache=get_command_name(args) in CACHE_BUILD_COMMANDS)
+                filepath = os.path.abspath(common_ctx.filepath)
+                key = common_ctx.get_resident_key()
+                fingerprint = common_ctx.get_fingerprint()
+                df = common_ctx.df
+
+            except (Exception, SystemExit):
+                return
+
+        size = int(df.memory_usage(deep=True).sum())
+
+        if size > max_bytes:
+            log(f"not keeping {filepath}, it takes {format_size(size)}, more than the memory budget")
+            send_message(sock, {'too_large': size})
+            return
+
+        log(f"loaded {filepath} in {time.time() - start:.1f}s ({format_size(size)})")
+        send_message(sock, {'bytes': size})
+
+        pids = set()
+        signal.signal(signal.SIGCHLD, lambda signum, frame: reap_commands(pids=pids))
+
+        while True:
+
+            try:
+                request, conn, fds = receive_handed_over_request(sock)
+            except (EOFError, OSError, ValueError):
+                return
+
+            is_current = True
+
+            try:
+                use_caller_environment(request)
+
+                # a file that changed is read by the command itself, and loaded again by the server for the next ones
+                is_current = get_file_fingerprint(filepath=filepath, content_hash=common_ctx.cache_hash) == fingerprint
+                resident = (key, df) if is_current else None
+
+                pids.add(start_command(conn=conn, request=request, fds=fds, resident=resident, close=[sock]))
+
+            except (OSError, KeyError):
+                pass
+
+            finally:
+                conn.close()
+                for fd in fds:
+                    os.close(fd)
+
+            if not is_current:
+                log(f"dropped {filepath}, it changed")
+                return
+
+            reap_commands(pids=pids)
+
+    except BaseException:
+        pass
+
+    finally:
+        os._exit(0)
+
+
+class ResidentFiles:
+    """
+    Files kept in memory, each by a process of its own that forks the commands on it, the most recently used last,
+    within a memory budget
+    """
+
+    def __init__(self, max_bytes, selector):
+        """
+        :param selector: selector of the server, the sockets of the processes are registered there with their key
+        """
+
+        self.max_bytes = max_bytes
+        self.selector = selector
+        self.entries = OrderedDict()
+
+        # versions of the files larger than the budget, they are not loaded again until they change
+        self.too_large = {}
+
+    def get_sockets(self):
+        return [entry['sock'] for entry in self.entries.values()]
+
+    def get_total_bytes(self):
+        return sum(entry['bytes'] for entry in self.entries.values() if entry['bytes'] is not None)
+
+    def hand_over(self, key, conn, request, fds):
+        """
+        Runs the command on the file already loaded
+        :return: true if it was handed over, false if the file is not loaded so the command has to run on its own
+        """
+
+        entry = self.entries.get(key)
+
+        if entry is None or entry['bytes'] is None:
+            return False
+
+        try:
+            hand_over_request(sock=entry['sock'], conn=conn, request=request, fds=fds)
+        except OSError:
+            self.drop(key=key)
+            return False
+
+        self.entries.move_to_end(key)
+
+        return True
+
+    def load(self, key, args, listener):
+        """
+        Starts loading the file of the command in a process of its own, unless it is already loaded or loading
+        :return: pid of the process, None if none was started
+        """
+
+        if key in self.entries or self.too_large.get(key) == get_file_version(filepath=key[0]):
+            return None
+
+        sock, child_sock = socket.socketpair()
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        pid = os.fork()
+
+        if pid == 0:
+            sock.close()
+            keep_file(sock=child_sock, args=args, max_bytes=self.max_bytes, close=[listener] + self.get_sockets())
+
+        child_sock.close()
+
+        self.entries[key] = {'pid': pid, 'sock': sock, 'bytes': None}
+        self.selector.register(sock, selectors.EVENT_READ, data=key)
+
+        return pid
+
+    def receive(self, key, sock):
+        """
+        Reads what the process of the file sent: its size once it is loaded, nothing once it is gone
+        """
+
+        entry = self.entries.get(key)
+
+        # dropped since the socket was selected
+        if entry is None or entry['sock'] is not sock:
+            return
+
+        try:
+            data = entry['sock'].recv(MAX_REQUEST_BYTES)
+        except OSError:
+            data = b''
+
+        if len(data) == 0:
+            self.drop(key=key, kill=False)
+            return
+
+        message = json.loads(data)
+
+        if 'too_large' in message:
+            self.too_large[key] = get_file_version(filepath=key[0])
+            return
+
+        entry['bytes'] = message['bytes']
+
+        # the file just loaded fits on its own, the least recently used others make room for it
+        for old_key in list(self.entries):
+            if self.get_total_bytes() <= self.max_bytes:
+                break
+            if old_key != key and self.entries[old_key]['bytes'] is not None:
+                self.drop(key=old_key)
+
+    def drop(self, key, kill=True):
+
+        from csvcli.functions import format_size
+
+        entry = self.entries.pop(key)
+
+        self.selector.unregister(entry['sock'])
+        entry['sock'].close()
+
+        if kill:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(entry['pid'], signal.SIGTERM)
+
+            if entry['bytes'] is not None:
+                log(f"dropped {key[0]} ({format_size(entry['bytes'])})")
+
+    def close(self):
+        for key in list(self.entries):
+            self.drop(key=key)
+
+
+def log(message):
+
+    import click
+
+    click.echo(f"{time.strftime('%H:%M:%S')} {message}")
+
+
+def run_command(args):
+    """
+    Runs a command like csvcli does in its own process
+    :return: exit status
+    """
+
+    from csvcli.cli import cli
+
+    try:
+        cli.main(args=args, prog_name='csvcli')
+        status = 0
+    except SystemExit as e:
+        status = e.code
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+
+    for stream in [sys.stdout, sys.stderr]:
+        try:
+            stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    if status is None:
+        return 0
+
+    if not isinstance(status, int):
+        sys.stderr.write(f"{status}\n")
+        return 1
+
+    return status
+
+
+def start_command(conn, request, fds, resident, close):
+    """
+    Forks a process that runs the command with the caller's terminal and sends its exit status back
+    :param resident: tuple (key, DataFrame) of the file already loaded, if any
+    :param close: sockets of the server the command does not use, so they go away with the server
+    :return: pid of the process
+    """
+
+    from csvcli.cli import RESIDENT_DFS
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    pid = os.fork()
+
+    if pid != 0:
+        return pid
+
+    status = 1
+
+    try:
+        for sock in close:
+            sock.close()
+
+        # a session of its own, so the caller's terminal can be used without being its controlling terminal
+        os.setsid()
+
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+
+        sys.stdin = open(0, 'r', closefd=False)
+        sys.stdout = open(1, 'w', buffering=1 if os.isatty(1) else -1, closefd=False)
+        sys.stderr = open(2, 'w', buffering=1, closefd=False)
+
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+        if resident is not None:
+            RESIDENT_DFS[resident[0]] = resident[1]
+
+        send_message(conn, {'pid': os.getpid()})
+        status = run_command(args=request['args'])
+
+    except BaseException:
+        traceback.print_exc()
+
+    finally:
+        try:
+            send_message(conn, {'status': status})
+        except OSError:
+            pass
+        os._exit(status)
+
+
+def reap_commands(pids):
+    """
+    Collects the exit status of the commands that finished, only theirs, as loading a file may use a process pool
+    """
+
+    for pid in list(pids):
+        try:
+            if os.waitpid(pid, os.WNOHANG)[0] != 0:
+                pids.discard(pid)
+        except ChildProcessError:
+            pids.discard(pid)
+
+
+def run_request(conn, listener, resident_files, pids):
+    """
+    Hands the command over to the process that keeps its file, or forks one for it right away. Files are only loaded
+    in the background, so the next callers never wait for them
+    """
+
+    from csvcli.cli import PRELOAD_COMMANDS
+
+    environ = dict(os.environ)
+    fds = []
+
+    try:
+        request, fds = receive_request(conn)
+
+        if len(fds) == 3:
+
+            use_caller_environment(request)
+
+            key = get_file_key(args=request['args'])
+
+            if key is None or not resident_files.hand_over(key=key, conn=conn, request=request, fds=fds):
+
+                pids.add(start_command(conn=conn, request=request, fds=fds, resident=None,
+                                       close=[listener] + resident_files.get_sockets()))
+
+                # the process that loads the file must not keep the caller waiting on its connection or terminal
+                conn.close()
+                for fd in fds:
+                    os.close(fd)
+                fds = []
+
+                if key is not None and get_command_name(args=request['args']) in PRELOAD_COMMANDS:
+                    pid = resident_files.load(key=key, args=request['args'], listener=listener)
+                    if pid is not None:
+                        pids.add(pid)
+
+    except (OSError, ValueError, KeyError):
+        pass
+
+    finally:
+        conn.close()
+        for fd in fds:
+            os.close(fd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def serve(socket_path, max_bytes):
+    """
+    Runs commands sent by csvcli until it is interrupted
+    :param max_bytes: memory budget of the files kept loaded
+    """
+
+    import click
+
+    socket_path = os.path.abspath(socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    if os.path.exists(socket_path):
+
+        try:
+            listener.connect(socket_path)
+            click.echo(f"Ouch! There is already a server listening on {socket_path}")
+            sys.exit(0)
+
+        except OSError:
+            # left by a server that did not stop cleanly
+            os.remove(socket_path)
+            listener.close()
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    # only this user can connect, the terminal of whoever does is handed over
+    umask = os.umask(0o177)
+    try:
+        listener.bind(socket_path)
+    finally:
+        os.umask(umask)
+
+    listener.listen()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+
+    resident_files = ResidentFiles(max_bytes=max_bytes, selector=selector)
+    pids = set()
+
+    signal.signal(signal.SIGCHLD, lambda signum, frame: reap_commands(pids=pids))
+
+    log(f"listening on {socket_path}, commands on files are run here until this is stopped")
+
+    try:
+        while True:
+
+            for selector_key, events in selector.select():
+
+                if selector_key.fileobj is listener:
+                    conn, address = listener.accept()
+                    run_request(conn=conn, listener=listener, resident_files=resident_files, pids=pids)
+
+                # a file finished loading, or the process that kept it went away
+                else:
+                    resident_files.receive(key=selector_key.data, sock=selector_key.fileobj)
+
+            # a command may have finished before it was added
+            reap_commands(pids=pids)
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        resident_files.close()
+        listener.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
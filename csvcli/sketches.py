@@ -0,0 +1,208 @@
+"""
+Bounded-memory summaries of columns that can be built chunk by chunk and merged.
+"""
+
+import numpy
+import pandas as pd
+
+
+class FrequentItemsSketch:
+    """
+    Misra-Gries summary of the most frequent values of a column, the mergeable counterpart of Space-Saving.
+
+    It keeps at most `capacity` counters. The count of every value is underestimated by at most `error`,
+    which never exceeds (number of values seen) / (capacity + 1), and any value not kept appears at most `error` times.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.error = 0
+        self.total = 0
+
+    def update(self, series):
+
+        # counting the chunk exactly first keeps the work vectorized
+        self.merge_counts(series.value_counts(), error=0, total=int(series.notna().sum()))
+
+    def merge(self, other):
+        self.merge_counts(other.counts, error=other.error, total=other.total)
+
+    def merge_counts(self, counts, error, total):
+
+        combined = self.counts.add(counts, fill_value=0)
+
+        self.error += error
+        self.total += total
+
+        # decrementing every counter by the (capacity + 1)th largest one leaves at most capacity positive counters
+        if combined.shape[0] > self.capacity:
+            decrement = combined.nlargest(self.capacity + 1).iloc[-1]
+            combined = combined - decrement
+            combined = combined[combined > 0]
+            self.error += int(decrement)
+
+        self.counts = combined.astype('int64')
+
+    def top(self, k):
+        """
+        :return: Pandas DataFrame with the k most frequent values, their minimum and maximum possible counts
+        """
+
+        top_counts = self.counts.nlargest(k)
+
+        return pd.DataFrame({'unique_value': top_counts.index,
+                             'count': top_counts.to_numpy(),
+                             'max_count': top_counts.to_numpy() + self.error})
+
+
+class QuantileSketch:
+    """
+    KLL-style quantile sketch of a numeric column.
+
+    Values live in levels, a value at level h stands for 2^h values of the column. When a level grows over
+    `capacity` it is sorted and every other value, starting at a random one, is promoted to the next level.
+    Sketches built over different chunks merge level by level.
+    """
+
+    def __init__(self, capacity=1000, seed=0):
+        self.capacity = capacity
+        self.levels = [numpy.empty(0)]
+        self.random = numpy.random.default_rng(seed)
+
+    def update(self, values):
+
+        values = numpy.asarray(values, dtype=float)
+        self.levels[0] = numpy.concatenate([self.levels[0], values[~numpy.isnan(values)]])
+        self.compress()
+
+    def merge(self, other):
+
+        for height, level in enumerate(other.levels):
+            if height == len(self.levels):
+                self.levels.append(numpy.empty(0))
+            self.levels[height] = numpy.concatenate([self.levels[height], level])
+
+        self.compress()
+
+    def compress(self):
+
+        height = 0
+
+        while height < len(self.levels):
+
+            level = self.levels[height]
+
+            if level.shape[0] > self.capacity:
+
+                level = numpy.sort(level)
+
+                # an odd value out stays at this level so no weight is lost
+                if level.shape[0] % 2 == 1:
+                    self.levels[height] = level[-1:]
+                    level = level[:-1]
+                else:
+                    self.levels[height] = numpy.empty(0)
+
+                if height + 1 == len(self.levels):
+                    self.levels.append(numpy.empty(0))
+
+                offset = int(self.random.integers(2))
+                self.levels[height + 1] = numpy.concatenate([self.levels[height + 1], level[offset::2]])
+
+            height += 1
+
+    def quantiles(self, qs):
+        """
+        :param qs: list of quantiles between 0 and 1
+        :return: list of approximate values at those quantiles, NaN if the sketch is empty
+        """
+
+        values = numpy.concatenate(self.levels)
+
+        if values.shape[0] == 0:
+            return [numpy.nan for q in qs]
+
+        weights = numpy.concatenate([numpy.full(level.shape[0], 2.0 ** height) for height, level in enumerate(self.levels)])
+
+        order = numpy.argsort(values, kind='mergesort')
+        values = values[order]
+        cumulative = numpy.cumsum(weights[order])
+
+        # the rank of every value is taken at the middle of its weight
+        ranks = (cumulative - weights[order] / 2) / cumulative[-1]
+
+        return list(numpy.interp(qs, ranks, values))
+
+
+class SummaryStatsSketch:
+    """
+    One-pass summary statistics of numeric columns: count, mean and std with mergeable Welford/Chan moments,
+    min and max, and approximate percentiles from a QuantileSketch per column.
+    """
+
+    def __init__(self, columns, percentiles=(0.25, 0.5, 0.75)):
+        self.columns = list(columns)
+        self.percentiles = list(percentiles)
+        self.count = numpy.zeros(len(self.columns))
+        self.mean = numpy.zeros(len(self.columns))
+        self.m2 = numpy.zeros(len(self.columns))
+        self.min = numpy.full(len(self.columns), numpy.nan)
+        self.max = numpy.full(len(self.columns), numpy.nan)
+        self.quantile_sketches = [QuantileSketch(seed=index) for index in range(len(self.columns))]
+
+    def update(self, df):
+
+        values = df[self.columns].apply(pd.to_numeric, errors='coerce').astype(float)
+
+        count = values.count().to_numpy(dtype=float)
+        mean = values.mean().to_numpy(dtype=float)
+        m2 = (values.var(ddof=0) * count).to_numpy(dtype=float)
+
+        self.merge_moments(count, numpy.nan_to_num(mean), numpy.nan_to_num(m2),
+                           values.min().to_numpy(dtype=float), values.max().to_numpy(dtype=float))
+
+        for index, column in enumerate(self.columns):
+            self.quantile_sketches[index].update(values[column].to_numpy())
+
+    def merge(self, other):
+
+        self.merge_moments(other.count, other.mean, other.m2, other.min, other.max)
+
+        for sketch, other_sketch in zip(self.quantile_sketches, other.quantile_sketches):
+            sketch.merge(other_sketch)
+
+    def merge_moments(self, count, mean, m2, minimum, maximum):
+
+        total = self.count + count
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            # Chan et al. parallel update of the mean and the sum of squared differences
+            delta = mean - self.mean
+            new_mean = numpy.where(total > 0, self.mean + delta * count / total, 0.0)
+            new_m2 = numpy.where(total > 0, self.m2 + m2 + delta ** 2 * self.count * count / total, 0.0)
+
+        self.count = total
+        self.mean = new_mean
+        self.m2 = new_m2
+        self.min = numpy.fmin(self.min, minimum)
+        self.max = numpy.fmax(self.max, maximum)
+
+    def to_frame(self):
+        """
+        :return: Pandas DataFrame laid out like DataFrame.describe()
+        """
+
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            mean = numpy.where(self.count > 0, self.mean, numpy.nan)
+            std = numpy.where(self.count > 1, numpy.sqrt(self.m2 / (self.count - 1)), numpy.nan)
+
+        rows = {'count': self.count, 'mean': mean, 'std': std, 'min': self.min}
+
+        quantiles = numpy.array([sketch.quantiles(self.percentiles) for sketch in self.quantile_sketches]).reshape(len(self.columns), -1)
+        for position, percentile in enumerate(self.percentiles):
+            rows[f"{percentile * 100:g}%"] = quantiles[:, position]
+
+        rows['max'] = self.max
+
+        return pd.DataFrame(rows, index=self.columns).T
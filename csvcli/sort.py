@@ -0,0 +1,155 @@
+"""
+Sorting of files that do not fit in memory.
+
+Every chunk of the file is sorted on its own and spilled to disk as a sorted run in Arrow IPC format.
+The runs are then merged batch by batch: all the buffered rows up to the smallest last key among the runs
+can be emitted, since every row still on disk comes after it.
+"""
+
+import os
+import tempfile
+import pandas as pd
+
+# pyarrow is imported when the first run is spilled, selections that fit in memory never need it
+
+
+RUN_BATCH_ROWS = 10000
+
+
+def sort_chunk(df, sort_by, ascending):
+
+    # like in filter_df, NULLs go last in both orders
+    return df.sort_values(by=sort_by, ascending=ascending, na_position='last', kind='mergesort')
+
+
+def write_run(df, filepath):
+
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    with pa.OSFile(filepath, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=RUN_BATCH_ROWS):
+                writer.write_batch(batch)
+
+
+def iter_run_batches(filepath):
+
+    import pyarrow as pa
+
+    with pa.memory_map(filepath, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            yield reader.get_batch(index).to_pandas()
+
+
+def merge_runs(run_filepaths, sort_by, ascending):
+    """
+    Merges sorted runs with k buffered batches in memory at a time
+    :return: generator of sorted Pandas DataFrames
+    """
+
+    runs = [iter_run_batches(filepath) for filepath in run_filepaths]
+    buffers = [next(run, None) for run in runs]
+
+    while any(buffer is not None for buffer in buffers):
+
+        active = [index for index, buffer in enumerate(buffers) if buffer is not None]
+
+        # NULLs are sorted last, so a run whose last buffered key is NULL has only NULLs left on disk
+        last_keys = [buffers[index][sort_by].iloc[-1] for index in active]
+        bounded = [key for key in last_keys if not pd.isna(key)]
+
+        parts = []
+
+        for index in active:
+
+            buffer = buffers[index]
+
+            if len(bounded) > 0:
+                frontier = min(bounded) if ascending else max(bounded)
+                keys = buffer[sort_by]
+                ready = (keys <= frontier) if ascending else (keys >= frontier)
+                ready = ready.fillna(False).to_numpy(dtype=bool)
+            else:
+                ready = None
+
+            # without a frontier every run is down to NULLs, which can all go out
+            if ready is None or ready.all():
+                parts.append(buffer)
+                buffers[index] = next(runs[index], None)
+            else:
+                parts.append(buffer[ready])
+                buffers[index] = buffer[~ready]
+
+        parts = [part for part in parts if part.shape[0] > 0]
+
+        if len(parts) > 0:
+            yield sort_chunk(pd.concat(parts, ignore_index=True), sort_by=sort_by, ascending=ascending)
+
+
+def iter_sorted_chunks(chunks, sort_by, ascending, temp_dir=None):
+    """
+    Sorts a sequence of chunks as a whole while holding only a bounded number of rows in memory
+    :param chunks: iterable of Pandas DataFrames with the same columns
+    :param sort_by: name of the column to sort by
+    :param ascending: true for ascending order, false for descending
+    :param temp_dir: (optional) directory where the sorted runs are spilled, defaults to the system temp dir
+    :return: generator of Pandas DataFrames, sorted across chunks
+    """
+
+    with tempfile.TemporaryDirectory(prefix="csvcli-sort-", dir=temp_dir) as run_dir:
+
+        run_filepaths = []
+        first_run = None
+
+        for index, chunk in enumerate(chunks):
+
+            run = sort_chunk(chunk, sort_by=sort_by, ascending=ascending)
+
+            # a file that fits in one chunk does not need to touch the disk
+            if index == 0:
+                first_run = run
+                continue
+
+            if first_run is not None:
+                run_filepaths.append(os.path.join(run_dir, "run_0.arrow"))
+                write_run(first_run, run_filepaths[-1])
+                first_run = None
+
+            run_filepaths.append(os.path.join(run_dir, f"run_{index}.arrow"))
+            write_run(run, run_filepaths[-1])
+
+        if first_run is not None:
+            yield first_run
+            return
+
+        yield from merge_runs(run_filepaths, sort_by=sort_by, ascending=ascending)
+
+
+def get_top_rows(chunks, sort_by, ascending, n):
+    """
+    Finds the first n rows of a sequence of chunks in sort order, without sorting all of them
+    :return: Pandas DataFrame with at most n sorted rows
+    """
+
+    top = None
+
+    for chunk in chunks:
+
+        candidates = chunk if top is None else pd.concat([top, chunk], ignore_index=True)
+        keys = candidates[sort_by]
+
+        # nsmallest and nlargest only rank the non null keys, NULLs only make it if there are not enough of those
+        not_null = candidates[keys.notna()]
+
+        if pd.api.types.is_numeric_dtype(keys.dtype) and not pd.api.types.is_bool_dtype(keys.dtype):
+            top = not_null.nsmallest(n, sort_by) if ascending else not_null.nlargest(n, sort_by)
+        else:
+            top = sort_chunk(not_null, sort_by=sort_by, ascending=ascending).head(n)
+
+        if top.shape[0] < n:
+            top = pd.concat([top, candidates[keys.isna()].head(n - top.shape[0])])
+
+    return sort_chunk(top, sort_by=sort_by, ascending=ascending).reset_index(drop=True)
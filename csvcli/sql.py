@@ -0,0 +1,1323 @@
+"""
+A small SQL engine that runs the common subset of SQLite queries directly on the columns of a DataFrame.
+
+Supported: SELECT [DISTINCT] with expressions and aliases, FROM file, WHERE, GROUP BY with COUNT, SUM, TOTAL,
+AVG, MIN and MAX, HAVING, ORDER BY, LIMIT and OFFSET. Anything else raises UnsupportedQuery so the caller can
+fall back to pandasql, which also takes care of reporting errors in the query.
+"""
+
+import re
+import string
+import datetime
+import numpy
+import pandas as pd
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+# bumped whenever results of the same query may change, so results cached by older versions are not used
+ENGINE_VERSION = 1
+
+
+KEYWORDS = {'select', 'distinct', 'all', 'from', 'where', 'group', 'by', 'having', 'order', 'asc', 'desc',
+            'limit', 'offset', 'and', 'or', 'not', 'is', 'null', 'in', 'between', 'like', 'as',
+            'join', 'inner', 'left', 'right', 'outer', 'cross', 'on', 'using', 'union', 'intersect', 'except',
+            'case', 'when', 'then', 'else', 'end', 'cast', 'exists', 'glob', 'regexp', 'match', 'escape',
+            'collate', 'with', 'window', 'over', 'nulls', 'values'}
+
+AGGREGATES = {'count', 'sum', 'total', 'avg', 'min', 'max'}
+
+SCALAR_FUNCTIONS = {'lower', 'upper', 'length', 'abs', 'round', 'coalesce', 'ifnull'}
+
+TOKEN_REGEX = re.compile(r"""
+    (?P<space>\s+|--[^\n]*|/\*.*?\*/)
+    |(?P<str>'(?:[^']|'')*')
+    |(?P<qident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+    |(?P<num>(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+    |(?P<op><=|>=|<>|!=|==|\|\||[=<>+\-*/%(),.;])
+""", re.VERBOSE | re.DOTALL)
+
+
+def tokenize(query):
+    """
+    Splits a SQL query into tokens
+    :return: list of tuples (kind, value, start, end), ending with an 'eof' token
+    """
+
+    tokens = []
+    position = 0
+
+    while position < len(query):
+
+        match = TOKEN_REGEX.match(query, position)
+
+        if match is None:
+            raise UnsupportedQuery(f"unexpected character {query[position]!r}")
+
+        kind = match.lastgroup
+        value = match.group()
+
+        if kind == 'str':
+            tokens.append(('str', value[1:-1].replace("''", "'"), match.start(), match.end()))
+
+        elif kind == 'qident':
+            tokens.append(('ident', value[1:-1].replace('""', '"'), match.start(), match.end()))
+
+        elif kind == 'ident':
+            kind = 'keyword' if value.lower() in KEYWORDS else 'ident'
+            tokens.append((kind, value.lower() if kind == 'keyword' else value, match.start(), match.end()))
+
+        elif kind != 'space':
+            tokens.append((kind, value, match.start(), match.end()))
+
+        position = match.end()
+
+    tokens.append(('eof', None, len(query), len(query)))
+
+    return tokens
+
+
+def normalize_query(query):
+    """
+    Writes a SQL query in a canonical way, so queries that only differ in spaces, comments, the case of keywords
+    and function names or the quoting of identifiers are equal
+    """
+
+    try:
+        tokens = tokenize(query)
+    except UnsupportedQuery:
+        return ' '.join(query.split())
+
+    words = []
+
+    for position, (kind, value, start, end) in enumerate(tokens[:-1]):
+        if kind == 'str':
+            words.append("'" + value.replace("'", "''") + "'")
+        elif kind == 'ident' and tokens[position + 1][:2] == ('op', '('):
+            words.append(value.lower())
+        elif kind == 'ident':
+            words.append('"' + value.replace('"', '""') + '"')
+        else:
+            words.append(value)
+
+    return ' '.join(words)
+
+
+class Parser:
+    """
+    Recursive descent parser for the supported subset of SQLite.
+    Expressions are nested tuples whose first item is the node type, i.e. ('column', None, 'units')
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.tokens = tokenize(query)
+        self.position = 0
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.position += 1
+            return token
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            raise UnsupportedQuery(f"expected {value or kind} at position {self.peek()[2]}")
+        return token
+
+    def parse_query(self):
+
+        self.expect('keyword', 'select')
+
+        distinct = self.accept('keyword', 'distinct') is not None
+        if not distinct:
+            self.accept('keyword', 'all')
+
+        items = [self.parse_select_item()]
+        while self.accept('op', ','):
+            items.append(self.parse_select_item())
+
+        self.expect('keyword', 'from')
+        table = self.expect('ident')[1]
+        if table.lower() != 'file':
+            raise UnsupportedQuery(f"unknown table {table}")
+
+        table_alias = None
+        if self.accept('keyword', 'as'):
+            table_alias = self.expect('ident')[1]
+        elif self.peek()[0] == 'ident':
+            table_alias = self.next()[1]
+
+        where = None
+        if self.accept('keyword', 'where'):
+            where = self.parse_expr()
+
+        group_by = []
+        having = None
+        if self.accept('keyword', 'group'):
+            self.expect('keyword', 'by')
+            group_by = [self.parse_expr()]
+            while self.accept('op', ','):
+                group_by.append(self.parse_expr())
+
+            if self.accept('keyword', 'having'):
+                having = self.parse_expr()
+
+        order_by = []
+        if self.accept('keyword', 'order'):
+            self.expect('keyword', 'by')
+            order_by = [self.parse_order_item()]
+            while self.accept('op', ','):
+                order_by.append(self.parse_order_item())
+
+        limit = None
+        offset = None
+        if self.accept('keyword', 'limit'):
+            limit = self.parse_integer()
+            if self.accept('keyword', 'offset'):
+                offset = self.parse_integer()
+            elif self.accept('op', ','):
+                # LIMIT offset, count
+                offset, limit = limit, self.parse_integer()
+
+        self.accept('op', ';')
+        self.expect('eof')
+
+        return {'distinct': distinct, 'items': items, 'table_alias': table_alias, 'where': where,
+                'group_by': group_by, 'having': having, 'order_by': order_by, 'limit': limit, 'offset': offset}
+
+    def parse_integer(self):
+
+        sign = -1 if self.accept('op', '-') else 1
+        token = self.expect('num')
+
+        if not token[1].isdigit():
+            raise UnsupportedQuery("LIMIT and OFFSET must be integers")
+
+        return sign * int(token[1])
+
+    def parse_select_item(self):
+
+        if self.accept('op', '*'):
+            return {'star': True, 'qualifier': None}
+
+        if self.peek()[0] == 'ident' and self.peek(1)[:2] == ('op', '.') and self.peek(2)[:2] == ('op', '*'):
+            qualifier = self.next()[1]
+            self.next()
+            self.next()
+            return {'star': True, 'qualifier': qualifier}
+
+        start = self.peek()[2]
+        expr = self.parse_expr()
+        end = self.tokens[self.position - 1][3]
+
+        alias = None
+        if self.accept('keyword', 'as'):
+            alias = self.next()
+            if alias[0] not in ('ident', 'str'):
+                raise UnsupportedQuery("invalid alias")
+            alias = alias[1]
+        elif self.peek()[0] in ('ident', 'str'):
+            alias = self.next()[1]
+
+        # like SQLite, columns are named after the text of their expression unless they have an alias, and a column
+        # on its own after the name it is declared with, see get_item_name
+        is_declared_name = alias is None and expr[0] == 'column'
+        if alias is None:
+            alias = expr[2] if expr[0] == 'column' else self.query[start:end]
+
+        return {'star': False, 'expr': expr, 'name': alias, 'is_declared_name': is_declared_name}
+
+    def parse_order_item(self):
+
+        expr = self.parse_expr()
+
+        ascending = True
+        if self.accept('keyword', 'desc'):
+            ascending = False
+        else:
+            self.accept('keyword', 'asc')
+
+        return expr, ascending
+
+    def parse_expr(self):
+        return self.parse_or()
+
+    def parse_or(self):
+        expr = self.parse_and()
+        while self.accept('keyword', 'or'):
+            expr = ('or', expr, self.parse_and())
+        return expr
+
+    def parse_and(self):
+        expr = self.parse_not()
+        while self.accept('keyword', 'and'):
+            expr = ('and', expr, self.parse_not())
+        return expr
+
+    def parse_not(self):
+        if self.accept('keyword', 'not'):
+            return ('not', self.parse_not())
+        return self.parse_predicate()
+
+    def parse_predicate(self):
+
+        expr = self.parse_additive()
+
+        while True:
+
+            token = self.peek()
+
+            if token[0] == 'op' and token[1] in ('=', '==', '!=', '<>', '<', '<=', '>', '>='):
+                self.next()
+                op = {'==': '=', '<>': '!='}.get(token[1], token[1])
+                expr = ('compare', op, expr, self.parse_additive())
+
+            elif self.accept('keyword', 'is'):
+                negate = self.accept('keyword', 'not') is not None
+                self.expect('keyword', 'null')
+                expr = ('isnull', expr, negate)
+
+            elif token[0] == 'keyword' and (token[1] in ('in', 'between', 'like')
+                                            or (token[1] == 'not' and self.peek(1)[1] in ('in', 'between', 'like'))):
+
+                negate = self.accept('keyword', 'not') is not None
+                keyword = self.next()[1]
+
+                if keyword == 'in':
+                    self.expect('op', '(')
+                    values = [self.parse_expr()]
+                    while self.accept('op', ','):
+                        values.append(self.parse_expr())
+                    self.expect('op', ')')
+                    expr = ('in', expr, values, negate)
+
+                elif keyword == 'between':
+                    low = self.parse_additive()
+                    self.expect('keyword', 'and')
+                    high = self.parse_additive()
+                    expr = ('between', expr, low, high, negate)
+
+                else:
+                    expr = ('like', expr, self.parse_additive(), negate)
+
+            else:
+                return expr
+
+    def parse_additive(self):
+        expr = self.parse_multiplicative()
+        while self.peek()[:2] in (('op', '+'), ('op', '-')):
+            expr = ('arith', self.next()[1], expr, self.parse_multiplicative())
+        return expr
+
+    def parse_multiplicative(self):
+        expr = self.parse_concat()
+        while self.peek()[:2] in (('op', '*'), ('op', '/'), ('op', '%')):
+            expr = ('arith', self.next()[1], expr, self.parse_concat())
+        return expr
+
+    def parse_concat(self):
+        expr = self.parse_unary()
+        while self.accept('op', '||'):
+            expr = ('concat', expr, self.parse_unary())
+        return expr
+
+    def parse_unary(self):
+        if self.accept('op', '-'):
+            return ('negative', self.parse_unary())
+        if self.accept('op', '+'):
+            return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_primary(self):
+
+        token = self.next()
+
+        if token[0] == 'num':
+            value = float(token[1]) if re.search(r'[.eE]', token[1]) else int(token[1])
+            return ('literal', value)
+
+        if token[0] == 'str':
+            return ('literal', token[1])
+
+        if token[:2] == ('keyword', 'null'):
+            return ('literal', None)
+
+        if token[:2] == ('op', '('):
+            expr = self.parse_expr()
+            self.expect('op', ')')
+            return expr
+
+        if token[0] == 'ident':
+
+            # function call
+            if self.accept('op', '('):
+                name = token[1].lower()
+
+                if name not in AGGREGATES and name not in SCALAR_FUNCTIONS:
+                    raise UnsupportedQuery(f"function {name} is not supported")
+
+                if name == 'count' and self.accept('op', '*'):
+                    self.expect('op', ')')
+                    return ('function', 'count', [], False)
+
+                distinct = self.accept('keyword', 'distinct') is not None
+
+                args = [self.parse_expr()]
+                while self.accept('op', ','):
+                    args.append(self.parse_expr())
+                self.expect('op', ')')
+
+                return ('function', name, args, distinct)
+
+            # qualified column
+            if self.accept('op', '.'):
+                return ('column', token[1], self.expect('ident')[1])
+
+            return ('column', None, token[1])
+
+        raise UnsupportedQuery(f"unexpected {token[1]!r} at position {token[2]}")
+
+
+def parse_query(query):
+    return Parser(query).parse_query()
+
+
+def get_item_name(item, columns):
+    """
+    :param item: selected item as returned by parse_query
+    :param columns: list of the column names of the table
+    :return: name of the column of the result, a column selected on its own is named as declared, whatever case it
+             is written in
+    """
+
+    if item['is_declared_name']:
+        for col in columns:
+            if str(col).lower() == item['expr'][2].lower():
+                return str(col)
+
+    return item['name']
+
+
+def get_query_column_names(query, columns):
+    """
+    Names of the columns of the result of a query, which depend on how it is written when they have no alias
+    :param columns: list of the column names of the table
+    :return: list with the name of every selected item, None for the ones selecting *.
+             None if the query is not supported
+    """
+
+    try:
+        parsed = parse_query(query)
+    except UnsupportedQuery:
+        return None
+
+    return [None if item['star'] else get_item_name(item=item, columns=columns) for item in parsed['items']]
+
+
+def parse_condition(condition):
+    """
+    Parses a condition on its own, like the one of a WHERE clause
+    """
+
+    parser = Parser(condition)
+    expr = parser.parse_expr()
+    parser.expect('eof')
+
+    return expr
+
+
+def get_expr_columns(expr):
+    """
+    :return: list of the names of the columns an expression refers to
+    """
+
+    if expr[0] == 'column':
+        return [expr[2]]
+
+    columns = []
+
+    for child in expr[1:]:
+        if isinstance(child, tuple):
+            columns += get_expr_columns(child)
+        if isinstance(child, list):
+            for item in child:
+                columns += get_expr_columns(item)
+
+    return columns
+
+
+def is_aggregate(expr):
+
+    if expr[0] == 'function' and expr[1] in AGGREGATES:
+        return True
+
+    for child in expr[1:]:
+        if isinstance(child, tuple) and is_aggregate(child):
+            return True
+        if isinstance(child, list) and any(is_aggregate(item) for item in child):
+            return True
+
+    return False
+
+
+"""
+EVALUATION
+"""
+
+
+def is_null(value):
+    return value is None or (isinstance(value, float) and numpy.isnan(value))
+
+
+def is_text(value):
+
+    if isinstance(value, pd.Series):
+        return pd.api.types.is_string_dtype(value.dtype) or value.dtype == object
+
+    return isinstance(value, str)
+
+
+def is_number(value):
+
+    if isinstance(value, pd.Series):
+        return pd.api.types.is_numeric_dtype(value.dtype)
+
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_datetime(value):
+
+    if isinstance(value, pd.Series):
+
+        if pd.api.types.is_datetime64_any_dtype(value.dtype):
+            return True
+
+        # dates of parquet files are loaded as python objects
+        not_null = value.notna().to_numpy()
+        return value.dtype == object and not_null.any() and isinstance(value.iloc[not_null.argmax()], datetime.date)
+
+    return isinstance(value, (datetime.date, numpy.datetime64))
+
+
+def get_null_mask(value, index):
+
+    if isinstance(value, pd.Series):
+        return value.isna()
+
+    return pd.Series(is_null(value), index=index)
+
+
+def to_boolean(value, index):
+    """
+    Converts a value into a nullable boolean Series, with SQLite's truthiness for numbers
+    """
+
+    if isinstance(value, pd.Series):
+
+        if value.dtype == 'boolean':
+            return value
+
+        if pd.api.types.is_bool_dtype(value.dtype):
+            return value.astype('boolean')
+
+        if not is_number(value):
+            raise UnsupportedQuery("only numbers and booleans can be used as conditions")
+
+        result = (value != 0).astype('boolean')
+        result[value.isna()] = pd.NA
+        return result
+
+    if is_null(value):
+        return pd.Series(pd.NA, index=index, dtype='boolean')
+
+    if not is_number(value) and not isinstance(value, bool):
+        raise UnsupportedQuery("only numbers and booleans can be used as conditions")
+
+    return pd.Series(bool(value), index=index, dtype='boolean')
+
+
+def with_nulls(result, operands, index):
+    """
+    Turns a boolean result into a nullable boolean that is NULL wherever one of the operands is NULL
+    """
+
+    result = to_boolean(result, index)
+
+    null_mask = pd.Series(False, index=index)
+    for operand in operands:
+        null_mask = null_mask | get_null_mask(operand, index)
+
+    if null_mask.any():
+        result = result.copy()
+        result[null_mask.to_numpy()] = pd.NA
+
+    return result
+
+
+def compare(op, left, right, index):
+
+    # SQLite would compare text and numbers with type affinity rules that pandas does not follow
+    if (is_text(left) and is_number(right)) or (is_number(left) and is_text(right)):
+
+        # a column with no values at all is read as numbers, whatever it holds in the rest of the file
+        if any(isinstance(side, pd.Series) and side.isna().all() for side in (left, right)):
+            return pd.Series(pd.NA, index=index, dtype='boolean')
+
+        raise UnsupportedQuery("comparison between text and numbers")
+
+    # SQLite gets dates as text, and compares them with other values as text, not as points in time
+    if is_datetime(left) != is_datetime(right) and \
+            not any(not isinstance(side, pd.Series) and is_null(side) for side in (left, right)):
+        raise UnsupportedQuery("comparison between dates and other values")
+
+    if any(not isinstance(side, pd.Series) and is_null(side) for side in (left, right)):
+        return pd.Series(pd.NA, index=index, dtype='boolean')
+
+    if not isinstance(left, pd.Series) and not isinstance(right, pd.Series):
+        left = pd.Series(left, index=index)
+
+    if op == '=':
+        result = left == right
+    elif op == '!=':
+        result = left != right
+    elif op == '<':
+        result = left < right
+    elif op == '<=':
+        result = left <= right
+    elif op == '>':
+        result = left > right
+    else:
+        result = left >= right
+
+    return with_nulls(result, [left, right], index)
+
+
+def is_integer(value):
+
+    if isinstance(value, pd.Series):
+        return pd.api.types.is_integer_dtype(value.dtype)
+
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def arithmetic(op, left, right, index):
+
+    for side in (left, right):
+        if not is_number(side) and not (not isinstance(side, pd.Series) and is_null(side)):
+            raise UnsupportedQuery("arithmetic on non numeric values")
+
+    if not isinstance(left, pd.Series):
+        left = pd.Series(numpy.nan if left is None else left, index=index)
+
+    if right is None:
+        right = numpy.nan
+
+    if op == '+':
+        return left + right
+    if op == '-':
+        return left - right
+    if op == '*':
+        return left * right
+
+    # division by zero is NULL in SQLite
+    divisor = pd.Series(right, index=index) if not isinstance(right, pd.Series) else right
+    divisor = divisor.where(divisor != 0)
+
+    if op == '/':
+        result = left / divisor
+        # integer division truncates towards zero
+        if is_integer(left) and is_integer(right):
+            result = numpy.trunc(result).astype('Int64')
+        return result
+
+    if not (is_integer(left) and is_integer(right)):
+        raise UnsupportedQuery("modulo of non integer values")
+
+    # SQLite keeps the sign of the dividend
+    return (numpy.sign(left) * (left.abs() % divisor.abs())).astype('Int64')
+
+
+ASCII_LOWERCASE = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+ASCII_UPPERCASE = str.maketrans(string.ascii_lowercase, string.ascii_uppercase)
+
+
+def like_to_regex(pattern):
+
+    regex = ''
+    for char in pattern:
+        if char == '%':
+            regex += '.*'
+        elif char == '_':
+            regex += '.'
+        else:
+            regex += re.escape(char)
+
+    return regex
+
+
+def get_group_key(expr):
+    """
+    Normalizes an expression so the same column written in different ways compares equal
+    """
+
+    if not isinstance(expr, tuple):
+        return expr
+
+    if expr[0] == 'column':
+        return ('column', None, expr[2].lower())
+
+    return tuple(get_group_key(child) if isinstance(child, tuple)
+                 else [get_group_key(item) for item in child] if isinstance(child, list)
+                 else child for child in expr)
+
+
+class RowContext:
+    """
+    Evaluates expressions row by row over the columns of a DataFrame
+    """
+
+    def __init__(self, df, table_alias=None):
+        self.df = df
+        self.index = df.index
+        self.table_alias = table_alias
+        self.columns = {str(col).lower(): col for col in df.columns}
+
+    def get_column(self, expr):
+
+        qualifier, name = expr[1], expr[2]
+
+        if qualifier is not None and qualifier.lower() not in ('file', str(self.table_alias).lower()):
+            raise UnsupportedQuery(f"unknown table {qualifier}")
+
+        if name.lower() not in self.columns:
+            raise UnsupportedQuery(f"no such column: {name}")
+
+        return widen_numbers(self.df[self.columns[name.lower()]])
+
+    def resolve(self, expr):
+
+        if expr[0] == 'column':
+            return self.get_column(expr)
+
+        if expr[0] == 'function' and expr[1] in AGGREGATES:
+            raise UnsupportedQuery("misuse of aggregate function")
+
+        return None
+
+
+class GroupContext:
+    """
+    Evaluates expressions once per group, aggregates are computed over the rows of each group
+    """
+
+    def __init__(self, row_context, group_by):
+
+        self.row_context = row_context
+        self.group_keys = [get_group_key(expr) for expr in group_by]
+
+        if len(group_by) > 0:
+            key_values = [to_series(evaluate(expr, row_context), row_context.index) for expr in group_by]
+
+            # groups come out sorted by their keys with NULL first, like in SQLite
+            key_codes = [pd.factorize(values, sort=True)[0] + 1 for values in key_values]
+            self.codes = numpy.unique(numpy.column_stack(key_codes), axis=0, return_inverse=True)[1].ravel() \
+                if len(row_context.index) > 0 else numpy.zeros(0, dtype=numpy.int64)
+            self.group_count = int(self.codes.max()) + 1 if len(self.codes) > 0 else 0
+            self.key_values = [values.groupby(self.codes).first().reindex(range(self.group_count)) for values in key_values]
+
+        else:
+            # aggregates without GROUP BY always give one row, even for an empty table
+            self.codes = numpy.zeros(len(row_context.index), dtype=numpy.int64)
+            self.group_count = 1
+            self.key_values = []
+
+        self.index = pd.RangeIndex(self.group_count)
+
+    def aggregate(self, expr):
+
+        name, args, distinct = expr[1], expr[2], expr[3]
+
+        if len(args) == 0:
+            counts = pd.Series(self.codes).value_counts()
+            return counts.reindex(self.index, fill_value=0)
+
+        if len(args) > 1 or any(is_aggregate(arg) for arg in args):
+            raise UnsupportedQuery(f"unsupported use of {name}")
+
+        values = to_series(evaluate(args[0], self.row_context), self.row_context.index)
+        grouped = values.reset_index(drop=True).groupby(self.codes)
+
+        if distinct and name != 'count':
+            raise UnsupportedQuery(f"{name} DISTINCT is not supported")
+
+        if name == 'count':
+            result = grouped.nunique() if distinct else grouped.count()
+            return result.reindex(self.index, fill_value=0)
+
+        if name in ('sum', 'total', 'avg') and not is_number(values):
+            raise UnsupportedQuery(f"{name} of non numeric values")
+
+        if name == 'sum':
+            result = grouped.sum(min_count=1)
+        elif name == 'total':
+            return grouped.sum().astype(float).reindex(self.index, fill_value=0.0)
+        elif name == 'avg':
+            result = grouped.mean()
+        elif name == 'min':
+            result = grouped.min()
+        else:
+            result = grouped.max()
+
+        return result.reindex(self.index)
+
+    def resolve(self, expr):
+
+        key = get_group_key(expr)
+
+        if key in self.group_keys:
+            return self.key_values[self.group_keys.index(key)]
+
+        if expr[0] == 'function' and expr[1] in AGGREGATES:
+            return self.aggregate(expr)
+
+        if expr[0] == 'column':
+            raise UnsupportedQuery(f"column {expr[2]} is neither grouped nor aggregated")
+
+        return None
+
+
+def widen_numbers(values):
+    """
+    Numbers in 64 bits like in SQLite, columns made smaller with --compact would overflow or lose precision in
+    arithmetic and sums
+    :param values: Pandas Series
+    :return: Pandas Series
+    """
+
+    dtype = values.dtype
+
+    if pd.api.types.is_bool_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype) or dtype.itemsize >= 8:
+        return values
+
+    is_nullable = isinstance(dtype, pd.api.extensions.ExtensionDtype)
+
+    if pd.api.types.is_integer_dtype(dtype):
+        return values.astype('Int64' if is_nullable else 'int64')
+
+    if pd.api.types.is_float_dtype(dtype):
+        return values.astype('Float64' if is_nullable else 'float64')
+
+    return values
+
+
+def to_series(value, index):
+
+    if isinstance(value, pd.Series):
+        return value
+
+    return pd.Series(value, index=index, dtype=object if value is None else None)
+
+
+def evaluate(expr, context):
+    """
+    Evaluates an expression vectorized over all the rows (or groups) of the context
+    :return: Pandas Series aligned to the index of the context, or a python scalar for constants
+    """
+
+    resolved = context.resolve(expr)
+    if resolved is not None:
+        return resolved
+
+    node = expr[0]
+    index = context.index
+
+    if node == 'literal':
+        return expr[1]
+
+    if node == 'and':
+        return to_boolean(evaluate(expr[1], context), index) & to_boolean(evaluate(expr[2], context), index)
+
+    if node == 'or':
+        return to_boolean(evaluate(expr[1], context), index) | to_boolean(evaluate(expr[2], context), index)
+
+    if node == 'not':
+        return ~to_boolean(evaluate(expr[1], context), index)
+
+    if node == 'compare':
+        return compare(expr[1], evaluate(expr[2], context), evaluate(expr[3], context), index)
+
+    if node == 'isnull':
+        result = get_null_mask(evaluate(expr[1], context), index)
+        return (~result if expr[2] else result).astype('boolean')
+
+    if node == 'between':
+        value = evaluate(expr[1], context)
+        result = compare('>=', value, evaluate(expr[2], context), index) & \
+            compare('<=', value, evaluate(expr[3], context), index)
+        return ~result if expr[4] else result
+
+    if node == 'in':
+        value = evaluate(expr[1], context)
+        options = [evaluate(option, context) for option in expr[2]]
+
+        if any(isinstance(option, pd.Series) or is_null(option) for option in options):
+            raise UnsupportedQuery("IN only supports lists of constants")
+
+        if any((is_text(value) and is_number(option)) or (is_number(value) and is_text(option)) for option in options):
+            raise UnsupportedQuery("comparison between text and numbers")
+
+        if any(is_datetime(value) != is_datetime(option) for option in options):
+            raise UnsupportedQuery("comparison between dates and other values")
+
+        result = with_nulls(to_series(value, index).isin(options), [value], index)
+        return ~result if expr[3] else result
+
+    if node == 'like':
+        value = evaluate(expr[1], context)
+        pattern = evaluate(expr[2], context)
+
+        if not isinstance(pattern, str) or not (isinstance(value, pd.Series) and is_text(value)):
+            raise UnsupportedQuery("LIKE only supports text columns and constant patterns")
+
+        # LIKE is case insensitive in SQLite, only for ASCII letters, and % matches line breaks too
+        result = value.astype(str).str.translate(ASCII_LOWERCASE).str.fullmatch(
+            like_to_regex(pattern.translate(ASCII_LOWERCASE)), flags=re.DOTALL)
+        result = with_nulls(result, [value], index)
+        return ~result if expr[3] else result
+
+    if node == 'arith':
+        return arithmetic(expr[1], evaluate(expr[2], context), evaluate(expr[3], context), index)
+
+    if node == 'negative':
+        return arithmetic('-', 0, evaluate(expr[1], context), index)
+
+    if node == 'concat':
+        left = to_series(evaluate(expr[1], context), index)
+        right = to_series(evaluate(expr[2], context), index)
+        if not all(is_text(side) or is_integer(side) for side in (left, right)):
+            raise UnsupportedQuery("concatenation of non text values")
+        result = left.astype(str) + right.astype(str)
+        return result.where(left.notna() & right.notna())
+
+    if node == 'function':
+        return evaluate_scalar_function(expr[1], [evaluate(arg, context) for arg in expr[2]], index)
+
+    raise UnsupportedQuery(f"unsupported expression {node}")
+
+
+def evaluate_scalar_function(name, args, index):
+
+    if name in ('coalesce', 'ifnull'):
+        if len(args) < 2:
+            raise UnsupportedQuery(f"wrong number of arguments to {name}")
+        result = to_series(args[0], index)
+        for arg in args[1:]:
+            result = result.where(result.notna(), arg)
+        return result
+
+    if len(args) != 1 and not (name == 'round' and len(args) == 2):
+        raise UnsupportedQuery(f"wrong number of arguments to {name}")
+
+    value = to_series(args[0], index)
+
+    if name in ('lower', 'upper', 'length'):
+        if not is_text(value):
+            raise UnsupportedQuery(f"{name} of non text values")
+        # SQLite only changes the case of ASCII letters
+        if name == 'lower':
+            return value.str.translate(ASCII_LOWERCASE)
+        if name == 'upper':
+            return value.str.translate(ASCII_UPPERCASE)
+        return value.str.len()
+
+    if not is_number(value):
+        raise UnsupportedQuery(f"{name} of non numeric values")
+
+    if name == 'abs':
+        return value.abs()
+
+    digits = args[1] if len(args) == 2 else 0
+    if not is_integer(digits):
+        raise UnsupportedQuery("ROUND only supports a constant number of digits")
+
+    return round_like_sqlite(value.astype(float), digits)
+
+
+def round_like_sqlite(values, digits):
+    """
+    Rounds half away from zero like SQLite, which prints the value with that many decimals and reads it back:
+    a tiny part of the value is added before rounding, and only 16 significant digits are kept
+    :param values: Pandas Series of floats
+    :return: Pandas Series of floats, SQLite always returns a float from ROUND
+    """
+
+    digits = min(max(digits, 0), 30)
+
+    # the arithmetic of SQLite is done in long double, where the platform has it
+    magnitude = values.abs().to_numpy(dtype=numpy.longdouble)
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+
+        if digits == 0:
+            rounded = numpy.floor(magnitude + numpy.longdouble(0.5))
+
+        else:
+            exponent = numpy.frexp(values.abs().to_numpy(dtype=float))[1] - 1
+            nudge = numpy.where(digits + numpy.trunc(exponent / 3) < 15, magnitude * numpy.longdouble(3e-16), 0)
+            shifted = magnitude + numpy.longdouble(0.5) * numpy.longdouble(10) ** -digits + nudge
+
+            integer_digits = numpy.where(shifted >= 1, numpy.floor(numpy.log10(shifted)) + 1, 0)
+            scale = numpy.longdouble(10) ** numpy.minimum(digits, 16 - integer_digits)
+            rounded = numpy.floor(shifted * scale) / scale
+
+        # values this large have no decimals to round
+        rounded = numpy.where(magnitude <= 2.0 ** 52, rounded, magnitude)
+
+    return pd.Series(numpy.sign(values.to_numpy(dtype=float)) * rounded.astype(float), index=values.index)
+
+
+def get_result_column(values, index):
+
+    values = to_series(values, index)
+
+    # SQLite has no booleans, conditions come out as 0 or 1
+    if values.dtype == 'boolean' or pd.api.types.is_bool_dtype(values.dtype):
+        values = values.astype('Int64')
+
+    return values
+
+
+def sort_result(result, keys, index):
+    """
+    Sorts the result by a list of (values, ascending) keys, NULLs first when ascending like SQLite
+    """
+
+    sort_frame = {}
+    ascending = []
+
+    for position, (values, ascending_key) in enumerate(keys):
+        values = to_series(values, index).reset_index(drop=True)
+        sort_frame[f"null_{position}"] = values.isna()
+        sort_frame[f"key_{position}"] = values
+        ascending += [not ascending_key, ascending_key]
+
+    sort_frame = pd.DataFrame(sort_frame)
+    order = sort_frame.sort_values(by=list(sort_frame.columns), ascending=ascending, kind='mergesort').index
+
+    return result.iloc[order.to_numpy()]
+
+
+def execute_query(df, query):
+    """
+    Runs a SQL query against a DataFrame known as 'file', without copying it into a database
+    :param df: Pandas DataFrame
+    :param query: SQL query in the supported subset of SQLite
+    :return: Pandas DataFrame with the query result
+    :raises UnsupportedQuery: if the query uses anything the engine does not support
+    """
+
+    return execute_parsed_query(df=df, parsed=parse_query(query))
+
+
+def is_streamable_query(parsed):
+    """
+    Whether a parsed query only filters and projects rows, so it can run over one chunk of the file at a time
+    """
+
+    return not parsed['distinct'] and len(parsed['group_by']) == 0 and parsed['having'] is None \
+        and len(parsed['order_by']) == 0 \
+        and not any(is_aggregate(item['expr']) for item in parsed['items'] if not item['star'])
+
+
+def iter_query_chunks(chunks, parsed):
+    """
+    Runs a filter and projection query over a sequence of chunks of the file, stopping as soon as the LIMIT is met
+    :param chunks: iterable of Pandas DataFrames
+    :param parsed: query as returned by parse_query, it must be streamable
+    :return: generator of Pandas DataFrames with the result rows of every chunk read
+    """
+
+    offset = parsed['offset'] if parsed['offset'] is not None and parsed['offset'] > 0 else 0
+    remaining = parsed['limit'] if parsed['limit'] is not None and parsed['limit'] >= 0 else None
+
+    # LIMIT and OFFSET apply to the whole result, not to every chunk
+    chunk_query = dict(parsed, limit=None, offset=None)
+
+    for chunk in chunks:
+
+        result = execute_parsed_query(df=chunk, parsed=chunk_query)
+
+        if offset > 0:
+            skipped = min(offset, result.shape[0])
+            result = result.iloc[skipped:]
+            offset -= skipped
+
+        if remaining is not None:
+            result = result.iloc[:remaining]
+            remaining -= result.shape[0]
+
+        yield result.reset_index(drop=True)
+
+        if remaining == 0:
+            return
+
+
+def get_row_mask(df, where, table_alias=None):
+    """
+    :param where: condition as returned by parse_condition
+    :return: NumPy boolean array, true for the rows of df where the condition is true
+    """
+
+    row_context = RowContext(df, table_alias=table_alias)
+
+    return to_boolean(evaluate(where, row_context), row_context.index).fillna(False).to_numpy(dtype=bool)
+
+
+def filter_rows(df, where, table_alias=None):
+    """
+    :param where: condition as returned by parse_condition
+    :return: Pandas DataFrame with the rows of df where the condition is true
+    """
+
+    return df[get_row_mask(df=df, where=where, table_alias=table_alias)]
+
+
+def execute_parsed_query(df, parsed):
+
+    if parsed['where'] is not None:
+        df = filter_rows(df=df, where=parsed['where'], table_alias=parsed['table_alias'])
+
+    row_context = RowContext(df, table_alias=parsed['table_alias'])
+
+    aliases = {item['name'].lower(): item['expr'] for item in parsed['items'] if not item['star']}
+
+    # GROUP BY may refer to the aliases of the selected columns
+    group_by = []
+    for expr in parsed['group_by']:
+        if expr[0] == 'literal' and is_integer(expr[1]):
+            raise UnsupportedQuery("GROUP BY column positions are not supported")
+        if expr[0] == 'column' and expr[1] is None and expr[2].lower() not in row_context.columns and expr[2].lower() in aliases:
+            expr = aliases[expr[2].lower()]
+        group_by.append(expr)
+
+    is_grouped = len(group_by) > 0 or parsed['having'] is not None or \
+        any(is_aggregate(item['expr']) for item in parsed['items'] if not item['star'])
+
+    context = GroupContext(row_context, group_by) if is_grouped else row_context
+
+    names = []
+    columns = []
+
+    for item in parsed['items']:
+
+        if item['star']:
+            if is_grouped:
+                raise UnsupportedQuery("SELECT * with aggregates is not supported")
+            names += [str(col) for col in row_context.df.columns]
+            columns += [row_context.df[col] for col in row_context.df.columns]
+
+        else:
+            names.append(get_item_name(item=item, columns=row_context.df.columns))
+            columns.append(get_result_column(evaluate(item['expr'], context), context.index))
+
+    keep = None
+    if parsed['having'] is not None:
+        keep = to_boolean(evaluate(parsed['having'], context), context.index).fillna(False).to_numpy(dtype=bool)
+
+    result = pd.concat([column.reset_index(drop=True) for column in columns], axis=1)
+    result.columns = names
+
+    # ORDER BY may refer to selected columns by position or by name, or to any other expression
+    sort_keys = []
+    for expr, ascending in parsed['order_by']:
+
+        if expr[0] == 'literal' and is_integer(expr[1]):
+            if not 1 <= expr[1] <= len(names):
+                raise UnsupportedQuery("ORDER BY position out of range")
+            sort_keys.append((result.iloc[:, expr[1] - 1], ascending))
+
+        elif expr[0] == 'column' and expr[1] is None and expr[2].lower() in [name.lower() for name in names]:
+            position = [name.lower() for name in names].index(expr[2].lower())
+            sort_keys.append((result.iloc[:, position], ascending))
+
+        else:
+            if parsed['distinct']:
+                raise UnsupportedQuery("ORDER BY terms of a DISTINCT query must be selected")
+            sort_keys.append((to_series(evaluate(expr, context), context.index).reset_index(drop=True), ascending))
+
+    if keep is not None:
+        result = result[keep]
+        sort_keys = [(values[keep], ascending) for values, ascending in sort_keys]
+
+    if parsed['distinct']:
+        result = result.drop_duplicates()
+        sort_keys = [(values[result.index], ascending) for values, ascending in sort_keys]
+
+    result = result.reset_index(drop=True)
+    sort_keys = [(values.reset_index(drop=True), ascending) for values, ascending in sort_keys]
+
+    if len(sort_keys) > 0:
+        result = sort_result(result, sort_keys, result.index)
+
+    offset = parsed['offset'] if parsed['offset'] is not None and parsed['offset'] > 0 else 0
+
+    # a negative LIMIT means no limit in SQLite
+    if parsed['limit'] is not None and parsed['limit'] >= 0:
+        result = result.iloc[offset:offset + parsed['limit']]
+    else:
+        result = result.iloc[offset:]
+
+    return result.reset_index(drop=True)
+
+
+"""
+PRUNING
+"""
+
+
+NOT_CONSTANT = object()
+
+FLIPPED_OPERATORS = {'=': '=', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+
+def get_constant(expr):
+
+    if expr[0] == 'literal':
+        return expr[1]
+
+    if expr[0] == 'negative' and expr[1][0] == 'literal' and is_number(expr[1][1]):
+        return -expr[1][1]
+
+    return NOT_CONSTANT
+
+
+def get_comparable_range(column_stats, value):
+    """
+    Puts the min and max statistics of a column and a constant in types that compare the way the engine does
+    :return: tuple (minimum, maximum, value), None if they can not be compared safely
+    """
+
+    minimum, maximum = column_stats['min'], column_stats['max']
+
+    if is_number(value) and is_number(minimum) and is_number(maximum):
+        return minimum, maximum, value
+
+    if isinstance(value, str) and isinstance(minimum, str) and isinstance(maximum, str):
+        return minimum, maximum, value
+
+    if isinstance(value, str) and isinstance(minimum, datetime.date) and isinstance(maximum, datetime.date):
+        return get_day_text_range(minimum, maximum, value)
+
+    return None
+
+
+def get_day_text_range(minimum, maximum, value):
+    """
+    SQLite gets dates and timestamps as text starting with their day, i.e. '2021-03-01 12:00:00', and compares that
+    text with text constants. Whatever follows the day, the text is between the first day and the day after the last
+    :return: tuple (minimum, maximum, value) of text, None if the days do not always come first
+    """
+
+    # timestamps with a time zone are read in their own time, statistics are kept in UTC
+    if any(getattr(side, 'tzinfo', None) is not None for side in (minimum, maximum)):
+        return None
+
+    first_day = minimum.date() if isinstance(minimum, datetime.datetime) else minimum
+    last_day = maximum.date() if isinstance(maximum, datetime.datetime) else maximum
+
+    # years out of 1000-9999 are not written with 4 digits
+    if first_day.year < 1000 or last_day.year >= 9999:
+        return None
+
+    return first_day.isoformat(), (last_day + datetime.timedelta(days=1)).isoformat(), value
+
+
+def is_comparison_never_true(op, left, right, stats):
+
+    if left[0] != 'column':
+        op, left, right = FLIPPED_OPERATORS[op], right, left
+
+    value = get_constant(right)
+
+    if left[0] != 'column' or value is NOT_CONSTANT or left[2].lower() not in stats:
+        return False
+
+    column_stats = stats[left[2].lower()]
+
+    # comparisons with NULL are never true
+    if is_null(value) or column_stats['null_count'] == column_stats['row_count']:
+        return True
+
+    comparable = get_comparable_range(column_stats, value)
+
+    if comparable is None:
+        return False
+
+    minimum, maximum, value = comparable
+
+    try:
+        if op == '=':
+            return value < minimum or value > maximum
+        if op == '!=':
+            return minimum == maximum == value
+        if op == '<':
+            return minimum >= value
+        if op == '<=':
+            return minimum > value
+        if op == '>':
+            return maximum <= value
+        return maximum < value
+
+    # i.e. timestamps with and without time zone
+    except TypeError:
+        return False
+
+
+def is_never_true(expr, stats):
+    """
+    Whether a condition can not be true for any row of a part of the file, judging by the statistics of its columns.
+    False means it may be true, not that it is.
+    :param expr: condition as returned by parse_condition
+    :param stats: dict of lowercase column names to dicts with the 'min' and 'max' values (None if unknown),
+                  'null_count' (None if unknown) and 'row_count' of the column
+    """
+
+    node = expr[0]
+
+    if node == 'and':
+        return is_never_true(expr[1], stats) or is_never_true(expr[2], stats)
+
+    if node == 'or':
+        return is_never_true(expr[1], stats) and is_never_true(expr[2], stats)
+
+    if node == 'compare':
+        return is_comparison_never_true(expr[1], expr[2], expr[3], stats)
+
+    if node == 'between' and not expr[4]:
+        return is_comparison_never_true('>=', expr[1], expr[2], stats) or \
+            is_comparison_never_true('<=', expr[1], expr[3], stats)
+
+    if node == 'in' and not expr[3]:
+        return all(is_comparison_never_true('=', expr[1], option, stats) for option in expr[2])
+
+    if node == 'isnull' and expr[1][0] == 'column' and expr[1][2].lower() in stats:
+        column_stats = stats[expr[1][2].lower()]
+        if column_stats['null_count'] is None:
+            return False
+        return column_stats['null_count'] == column_stats['row_count'] if expr[2] else column_stats['null_count'] == 0
+
+    return False
@@ -27,7 +27,7 @@ setup(
  python_requires='>=3.7', # any python greater than 3.7
  entry_points='''
      [console_scripts]
-     csvcli=csvcli.cli:cli
+     csvcli=csvcli.cli:main
      ''',
  author="Ignacio Marin",
  keyword="csv,parquet,excel, table, tabular, cli, command-line, read, convert, query",
@@ -0,0 +1,25 @@
+"""
+Text of the table cells, shared by the terminal viewer and the output to stdout.
+"""
+
+import math
+
+
+# number of rows used to size the columns before anything is drawn, they widen later if needed
+WIDTH_SAMPLE_ROWS = 100
+
+# longer values are cut, so one cell can not push all the others off screen
+MAX_CELL_WIDTH = 60
+
+
+def format_value(value):
+
+    if isinstance(value, float):
+        text = 'nan' if math.isnan(value) else format(value, 'g')
+    elif value is None:
+        text = 'nan'
+    else:
+        text = str(value)
+
+    # every row has to be one line
+    return text.replace('\r', ' ').replace('\n', ' ')
@@ -0,0 +1,158 @@
+"""
+Output of results to stdout as text, for pipes and scripts.
+
+Results are written one chunk at a time as they are produced, so memory stays bounded and a reader that stops
+early (i.e. `| head`) stops the command right away.
+"""
+
+import os
+import sys
+import pandas as pd
+from show.cells import format_value, WIDTH_SAMPLE_ROWS, MAX_CELL_WIDTH
+
+
+# rows formatted and written at a time, so a reader gets the first ones without waiting for a whole chunk
+OUTPUT_BATCH_ROWS = 1000
+
+# exit status of a process killed by SIGPIPE, what a reader closing the pipe expects
+BROKEN_PIPE_STATUS = 128 + 13
+
+
+def get_output_df(df):
+
+    # row numbers are left out, but labels like the ones of describe() are data
+    if pd.api.types.is_integer_dtype(df.index.dtype):
+        return df
+
+    return df.reset_index(names=df.index.name if df.index.name is not None else '')
+
+
+class DelimitedWriter:
+
+    def __init__(self, stream, sep):
+        self.stream = stream
+        self.sep = sep
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.stream, sep=self.sep, index=False, header=self.header)
+        self.header = False
+
+
+class JsonLinesWriter:
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, df):
+
+        if df.shape[0] == 0:
+            return
+
+        text = df.to_json(orient='records', lines=True, date_format='iso', double_precision=15, force_ascii=False)
+        self.stream.write(text if text.endswith('\n') else text + '\n')
+
+
+class PlainWriter:
+    """
+    Aligned columns without borders. Widths come from the header and the first rows, later values that are
+    longer are written whole and just push the rest of their line
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.widths = None
+        self.right_aligned = None
+
+    def format_row(self, cells):
+
+        cells = [cell.rjust(width) if right else cell.ljust(width)
+                 for cell, width, right in zip(cells, self.widths, self.right_aligned)]
+
+        return '  '.join(cells).rstrip()
+
+    def write_header(self, headers):
+        self.stream.write(self.format_row(headers) + '\n')
+
+    def write(self, df):
+
+        rows = [[format_value(value) for value in row] for row in df.itertuples(index=False, name=None)]
+
+        if self.widths is None:
+
+            headers = [format_value(col) for col in df.columns]
+            self.widths = [min(max([len(header)] + [len(row[position]) for row in rows[:WIDTH_SAMPLE_ROWS]]),
+                               MAX_CELL_WIDTH)
+                           for position, header in enumerate(headers)]
+            self.right_aligned = [pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+                                  for dtype in df.dtypes]
+
+            self.write_header(headers)
+
+        self.stream.write(''.join(self.format_row(row) + '\n' for row in rows))
+
+
+class MarkdownWriter(PlainWriter):
+
+    def format_row(self, cells):
+
+        cells = [cell.replace('|', '\\|') for cell in cells]
+        cells = [cell.rjust(width) if right else cell.ljust(width)
+                 for cell, width, right in zip(cells, self.widths, self.right_aligned)]
+
+        return '| ' + ' | '.join(cells) + ' |'
+
+    def write_header(self, headers):
+
+        # markdown needs at least three dashes, and a colon on the right for right aligned columns
+        self.widths = [max(width, 3) for width in self.widths]
+        separators = ['-' * (width - 1) + ':' if right else '-' * width
+                      for width, right in zip(self.widths, self.right_aligned)]
+
+        self.stream.write(self.format_row(headers) + '\n')
+        self.stream.write('| ' + ' | '.join(separators) + ' |\n')
+
+
+def get_writer(output, stream):
+
+    if output == 'csv':
+        return DelimitedWriter(stream, sep=',')
+
+    elif output == 'tsv':
+        return DelimitedWriter(stream, sep='\t')
+
+    elif output == 'jsonl':
+        return JsonLinesWriter(stream)
+
+    elif output == 'markdown':
+        return MarkdownWriter(stream)
+
+    return PlainWriter(stream)
+
+
+def write_output(chunks, output, stream=None):
+    """
+    Writes DataFrames to stdout as one table, flushing after every one of them
+    :param chunks: iterable of Pandas DataFrames with the same columns, there must be at least one
+    :param output: 'plain', 'csv', 'tsv', 'jsonl' or 'markdown'
+    :param stream: (optional) file object to write to, defaults to stdout
+    """
+
+    stream = stream if stream is not None else sys.stdout
+    writer = get_writer(output=output, stream=stream)
+
+    try:
+        for chunk in chunks:
+
+            chunk = get_output_df(chunk)
+
+            # an empty chunk is still written once, for the header
+            for offset in range(0, max(chunk.shape[0], 1), OUTPUT_BATCH_ROWS):
+                writer.write(chunk[offset:offset + OUTPUT_BATCH_ROWS])
+                stream.flush()
+
+    except BrokenPipeError:
+
+        # the reader is gone, python would fail again flushing stdout on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+        sys.exit(BROKEN_PIPE_STATUS)
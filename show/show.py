@@ -3,83 +3,216 @@ import pandas as pd
 from csvcli.functions import *
 import math
 import unicodedata
+from collections import OrderedDict
+from csvcli.rows import DataFrameRowSource
+from show.cells import format_value, WIDTH_SAMPLE_ROWS, MAX_CELL_WIDTH
 
 
-def get_clean_df(df):
+# number of rows whose formatted cells are kept between key presses
+ROW_CACHE_SIZE = 1000
 
-    # remove new line chars from df values to ensure each row is one line
-    return df.replace(r'\n', ' ', regex=True).copy()
 
+def format_cell(value):
 
-def get_table_str_from_df(df, repl_for_wide='?'):
+    text = format_value(value)
 
-    table_str = pd_tabulate(df)
+    # wide chars would take two screen cells and break the alignment
+    if not text.isascii():
+        text = ''.join([char if unicodedata.east_asian_width(char) not in ('W', 'F') else '?' for char in text])
 
-    # replace wide chars
-    table_str = ''.join([char if unicodedata.east_asian_width(char) != 'W' else repl_for_wide for char in table_str])
+    if len(text) > MAX_CELL_WIDTH:
+        text = text[:MAX_CELL_WIDTH - 1] + '…'
 
-    return table_str
+    return text
 
 
-def get_df_line_matrix_from_table_str(df_table_str):
+class TableView:
+    """
+    Draws the rows of a RowSource as a fancy grid table one screen at a time, like tabulate would.
+    Column widths come from a sample of rows, cells are formatted only when they become visible and are kept
+    in an LRU cache by row, so a key press costs about one screen of cells whatever the size of the table.
+    """
 
-    return df_table_str.split("\n")
+    def __init__(self, source, sample_rows=WIDTH_SAMPLE_ROWS, cache_size=ROW_CACHE_SIZE):
+        self.source = source
+        self.cache_size = cache_size
+        self.rows = OrderedDict()
 
+        sample = source.get_rows(0, sample_rows)
 
-def get_table_str_from_line_matrix(df_line_matrix):
+        # the index is shown as a first column without a name
+        self.headers = [''] + [format_cell(col) for col in source.columns]
+        self.right_aligned = [pd.api.types.is_numeric_dtype(sample.index.dtype)] + \
+            [pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in sample.dtypes]
+        self.widths = [len(header) for header in self.headers]
 
-    return '\n'.join(df_line_matrix)
+        # the last index value is usually the longest one
+        if source.row_count is not None and source.row_count > 0 and isinstance(source, DataFrameRowSource):
+            self.widths[0] = len(format_cell(source.df.index[-1]))
+        elif source.row_count is not None:
+            self.widths[0] = len(str(max(source.row_count - 1, 0)))
 
+        self.update_widths(self.get_cells(0, sample.shape[0], range(len(self.headers))))
 
-def get_line_matrix_maxyx(df_line_matrix):
+    @property
+    def row_count(self):
+        return self.source.row_count
 
-    th = len(df_line_matrix)
+    def count_rows(self, limit):
+        return self.source.count_rows(limit)
 
-    # the width of the table is determined by its widest line
-    tw = len(df_line_matrix[0])
+    def get_row_count(self):
+        return self.source.get_row_count()
 
-    for line in df_line_matrix[1:]:
-        if len(line) > tw:
-            tw = len(line)
+    def get_cells(self, start, stop, columns):
+        """
+        Formatted cells of rows start to stop, only for the given columns (0 is the index)
+        :return: list of dicts of column position to text, one per row
+        """
 
-    return th, tw
+        missing = [row for row in range(start, stop)
+                   if row not in self.rows or any(col not in self.rows[row] for col in columns)]
 
+        if len(missing) > 0:
 
-def get_partial_line_matrix(df_line_matrix, sw, w_offset):
+            first, last = min(missing), max(missing) + 1
+            data_columns = [col - 1 for col in columns if col > 0]
 
-    df_partial_line_matrix = df_line_matrix
+            df = self.source.get_rows(first, last)
+            values = df.iloc[:, data_columns].to_numpy(dtype=object)
 
-    th,tw = get_line_matrix_maxyx(df_line_matrix)
+            for row in missing:
 
-    # if the str matrix is wider than fits on screen
-    # we only show as many chars as we can fit
-    if tw + 1 > sw:
-        for index in range(0, th):
-            if len(df_partial_line_matrix[index]) > sw:
-                df_partial_line_matrix[index] = df_partial_line_matrix[index][w_offset:w_offset+sw-1]
+                # rows past the end of the table are left out
+                if row - first >= df.shape[0]:
+                    continue
 
-    return df_partial_line_matrix
+                cells = self.rows.get(row, {})
+                if 0 in columns:
+                    cells[0] = format_cell(df.index[row - first])
+                for position, col in enumerate(data_columns):
+                    if col + 1 not in cells:
+                        cells[col + 1] = format_cell(values[row - first, position])
+                self.rows[row] = cells
 
+        result = []
 
-def get_partial_table_str(df, row_count, sw, h_offset, w_offset):
+        for row in range(start, stop):
+            if row in self.rows:
+                self.rows.move_to_end(row)
+                result.append(self.rows[row])
 
-    limit = h_offset + row_count
+        while len(self.rows) > self.cache_size:
+            self.rows.popitem(last=False)
 
-    df = df[h_offset:limit].copy()
+        return result
 
-    df = get_clean_df(df).copy()
+    def update_widths(self, rows):
+        """
+        Widens the columns that have a value longer than any seen before
+        :return: true if any column changed
+        """
 
-    df_table_str = get_table_str_from_df(df)
+        changed = False
 
-    df_line_matrix = get_df_line_matrix_from_table_str(df_table_str)
+        for cells in rows:
+            for col, text in cells.items():
+                if len(text) > self.widths[col]:
+                    self.widths[col] = len(text)
+                    changed = True
 
-    th, tw = get_line_matrix_maxyx(df_line_matrix)
+        return changed
 
-    partial_df_line_matrix = get_partial_line_matrix(df_line_matrix,sw,w_offset)
+    def get_width(self):
 
-    partial_table_str = get_table_str_from_line_matrix(partial_df_line_matrix)
+        # every column has a border on its left and a space on each side, plus the border on the right of the table
+        return sum(width + 3 for width in self.widths) + 1
 
-    return partial_table_str, tw
+    def get_visible_columns(self, w_offset, width):
+        """
+        :return: list of the columns that show between w_offset and w_offset + width, and the x where the first one starts
+        """
+
+        columns = []
+        first_start = 0
+        start = 0
+
+        for col, col_width in enumerate(self.widths):
+
+            end = start + col_width + 3
+
+            if end > w_offset:
+                if len(columns) == 0:
+                    first_start = start
+                columns.append(col)
+
+            if end >= w_offset + width:
+                break
+
+            start = end
+
+        return columns, first_start
+
+    def get_line(self, columns, cells, chars, w_offset, first_start, width):
+        """
+        Builds the visible part of one line of the table
+        :param cells: dict of column position to text, None for a border line
+        :param chars: left border, fill, inner border and right border characters
+        """
+
+        left, fill, middle, right = chars
+
+        parts = []
+
+        for col in columns:
+
+            parts.append(left if col == 0 else middle)
+
+            if cells is None:
+                parts.append(fill * (self.widths[col] + 2))
+            elif self.right_aligned[col]:
+                parts.append(' ' + cells[col].rjust(self.widths[col]) + ' ')
+            else:
+                parts.append(' ' + cells[col].ljust(self.widths[col]) + ' ')
+
+        if len(columns) > 0 and columns[-1] == len(self.widths) - 1:
+            parts.append(right)
+
+        return ''.join(parts)[w_offset - first_start:w_offset - first_start + width]
+
+    def get_lines(self, h_offset, row_count, w_offset, width):
+        """
+        Lines of the table with the header and rows h_offset to h_offset + row_count, cut to the screen width
+        :return: list of strings
+        """
+
+        stop = self.count_rows(h_offset + row_count)
+
+        columns, first_start = self.get_visible_columns(w_offset=w_offset, width=width)
+        rows = self.get_cells(h_offset, stop, columns)
+
+        # a visible value longer than the sample ones widens its column, which may change what fits on screen
+        if self.update_widths(rows):
+            columns, first_start = self.get_visible_columns(w_offset=w_offset, width=width)
+            rows = self.get_cells(h_offset, stop, columns)
+            self.update_widths(rows)
+
+        def get_line(cells, chars):
+            return self.get_line(columns=columns, cells=cells, chars=chars, w_offset=w_offset,
+                                 first_start=first_start, width=width)
+
+        header = dict(enumerate(self.headers))
+
+        lines = [get_line(None, '╒═╤╕'), get_line(header, '│ ││'), get_line(None, '╞═╪╡')]
+
+        for position, cells in enumerate(rows):
+            if position > 0:
+                lines.append(get_line(None, '├─┼┤'))
+            lines.append(get_line(cells, '│ ││'))
+
+        lines.append(get_line(None, '╘═╧╛'))
+
+        return lines
 
 
 def get_filled_header(msg, width, fill_char):
@@ -90,7 +223,8 @@ def get_filled_header(msg, width, fill_char):
     return "".join(array)
 
 
-def display_meta_info(stdscr, full_filename, format, delimiter, is_delimiter_a_guess, df, display_type, query=""):
+def display_meta_info(stdscr, full_filename, format, delimiter, is_delimiter_a_guess, df, display_type, query="",
+                      row_count=None, count_error=None, delimiter_confidence=None):
 
     sh, sw = stdscr.getmaxyx()
 
@@ -104,7 +238,10 @@ def display_meta_info(stdscr, full_filename, format, delimiter, is_delimiter_a_g
     stdscr.attroff(curses.color_pair(1))
 
     if format == 'csv' and delimiter != ',' and is_delimiter_a_guess and not display_type == "query":
-        stdscr.addstr(2,1,f"Infered CSV Delimiter: '{delimiter}'")
+        delimiter_msg = f"Infered CSV Delimiter: '{delimiter}'"
+        if delimiter_confidence is not None:
+            delimiter_msg += f" (confidence: {delimiter_confidence:.0%})"
+        stdscr.addstr(2,1,delimiter_msg[:sw - 1])
         total_lines +=1
 
     query_msg = f"QUERY: '{query}'"
@@ -116,18 +253,35 @@ def display_meta_info(stdscr, full_filename, format, delimiter, is_delimiter_a_g
             stdscr.addstr(2, 1, query_msg[:sw])
         total_lines += 1
 
-    if display_type == "all":
-        msg_total_number = f"Total number of rows: {df.shape[0]}"
+    if display_type == "all" and row_count is None:
+        msg_total_number = f"Total number of rows: not counted yet"
 
-    elif display_type == "head":
+    elif display_type == "all":
+        msg_total_number = f"Total number of rows: {row_count}"
+
+    elif display_type in ["head", "tail", "rows"]:
         msg_total_number = f"Number of rows displayed: {df.shape[0]}"
 
+    elif display_type == "columns" and row_count is not None:
+        msg_total_number = f"Total number of columns: {df.shape[0]} - Total number of rows: {row_count}"
+
+    elif display_type == "memory":
+        memory = df['memory_bytes'].sum()
+        compact_memory = df['compact_memory_bytes'].sum()
+        msg_total_number = f"Memory: {format_size(memory)} - with --compact: {format_size(compact_memory)}"
+
     elif display_type in ["columns", "null_counts"]:
         msg_total_number = f"Total number of columns: {df.shape[0]}"
 
     elif display_type == "value_counts":
         msg_total_number = f"Total number of unique values: {df.shape[0]}"
 
+    elif display_type == "value_counts_approx" and df.shape[0] == 0:
+        msg_total_number = f"No value appears more than {count_error} times"
+
+    elif display_type == "value_counts_approx":
+        msg_total_number = f"Top {df.shape[0]} most frequent values - counts may be short by up to {count_error}"
+
     elif display_type == "query":
         msg_total_number = f"Rows in query result: {df.shape[0]}"
 
@@ -148,8 +302,35 @@ def display_meta_info(stdscr, full_filename, format, delimiter, is_delimiter_a_g
     return total_lines
 
 
+def draw_lines(stdscr, lines, drawn_lines, y_offset):
+    """
+    Draws the lines that changed since the last screen
+    :param drawn_lines: dict of y to the line drawn there, updated in place
+    """
+
+    for y in set(drawn_lines) - set(range(y_offset, y_offset + len(lines))):
+        stdscr.move(y, 0)
+        stdscr.clrtoeol()
+        del drawn_lines[y]
+
+    for position, line in enumerate(lines):
+
+        y = y_offset + position
+
+        if drawn_lines.get(y) != line:
+            stdscr.move(y, 0)
+            stdscr.clrtoeol()
+            stdscr.addstr(y, 0, line)
+            drawn_lines[y] = line
+
+
 def display_full_table(stdscr, full_filename, format, df, display_type,
-                       query="", is_delimiter_a_guess=None, delimiter=None):
+                       query="", is_delimiter_a_guess=None, delimiter=None, row_count=None, count_error=None, rows=None,
+                       delimiter_confidence=None):
+    """
+    :param rows: (optional) RowSource to browse instead of df, so only the rows on screen have to be read
+    :param delimiter_confidence: (optional) share of the sampled lines the guessed delimiter splits consistently
+    """
 
     curses.curs_set(0)
     h_offset = 0
@@ -159,25 +340,41 @@ def display_full_table(stdscr, full_filename, format, df, display_type,
 
     curses.init_pair(1, curses.COLOR_BLACK, curses.COLOR_WHITE)
 
-    while True:
+    table = TableView(rows if rows is not None else DataFrameRowSource(df))
+
+    # the file info and the footer only change when the terminal is resized
+    redraw = True
+    drawn_lines = {}
 
-        stdscr.clear()
+    while True:
 
         sh, sw = stdscr.getmaxyx()
 
-        h_padding = display_meta_info(stdscr, full_filename, format, delimiter, is_delimiter_a_guess, df, display_type, query)
+        if redraw:
+            stdscr.erase()
+
+            # the row count of a file being browsed may only be known once its end is reached
+            if display_type == "all":
+                row_count = table.row_count
+
+            h_padding = display_meta_info(stdscr, full_filename, format, delimiter, is_delimiter_a_guess, df, display_type,
+                                          query, row_count, count_error, delimiter_confidence)
+            drawn_lines = {}
+            redraw = False
 
         # determine the number of table rows that fit in the screen
-        row_count = math.floor((sh - 3) / 2) - h_padding
+        screen_rows = max(math.floor((sh - 3) / 2) - h_padding, 1)
+
+        lines = table.get_lines(h_offset=h_offset, row_count=screen_rows, w_offset=w_offset, width=sw - 11)
 
-        partial_table_str, tw = get_partial_table_str(df=df, row_count=row_count, sw=sw-10,
-                                                      h_offset=h_offset, w_offset=w_offset)
+        draw_lines(stdscr, lines, drawn_lines, y_offset=h_padding)
+
+        stdscr.noutrefresh()
+        curses.doupdate()
 
-        stdscr.addstr(h_padding, 0, partial_table_str)
-        stdscr.refresh()
         key = stdscr.get_wch()
 
-        if key == curses.KEY_DOWN and (h_offset + 1) <= (df.shape[0] - row_count):
+        if key == curses.KEY_DOWN and table.count_rows(h_offset + screen_rows + 1) > h_offset + screen_rows:
             h_offset += 1
 
         if key == curses.KEY_UP and h_offset > 0:
@@ -186,26 +383,28 @@ def display_full_table(stdscr, full_filename, format, df, display_type,
         if key == curses.KEY_LEFT and w_offset-w_step >= 0:
             w_offset -= w_step
 
-        if key == curses.KEY_RIGHT and w_offset+w_step < tw-1:
+        if key == curses.KEY_RIGHT and w_offset+w_step < table.get_width()-1:
             w_offset += w_step
 
         if key == 'a' or key == 'A':
             h_offset = 0
 
         if key == 'z' or key == 'Z':
-            h_offset = df.shape[0] - row_count
+            h_offset = max(table.get_row_count() - screen_rows, 0)
 
         if key == 'q' or key == 'Q':
             break
 
-        resize = curses.is_term_resized(sh, sw)
+        if display_type == "all" and table.row_count != row_count:
+            redraw = True
+
+        resize = curses.is_term_resized(sh, sw) or key == curses.KEY_RESIZE
 
         # Action in loop if resize is True:
         if resize is True:
             sh, sw = stdscr.getmaxyx()
-            stdscr.clear()
             curses.resizeterm(sh, sw)
-            stdscr.refresh()
+            redraw = True
 
 
 if __name__ == "__main__":
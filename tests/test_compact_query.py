@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+from csvcli.cli import cli
+
+
+QUERIES = ["select id * 100 from file order by id desc limit 1",
+           "select sum(id * 40), avg(id), sum(x * 3), total(-id) from file",
+           "select id / 7, id % 7, abs(id - 500) * 1000 from file where id > 990"]
+
+
+@pytest.fixture
+def filepath(tmp_path):
+
+    filepath = tmp_path / "t.csv"
+    pd.DataFrame({'id': range(1, 1000), 'x': [i * 0.1 for i in range(1, 1000)]}).to_csv(filepath, index=False)
+
+    return str(filepath)
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_compact_query_gives_the_same_result(filepath, query):
+
+    # --compact keeps ids in int16, the query must not overflow them
+    runner = CliRunner()
+    result = runner.invoke(cli, [filepath, 'query', '-q', query])
+    compact_result = runner.invoke(cli, ['--compact', filepath, 'query', '-q', query])
+
+    assert result.exit_code == 0
+    assert compact_result.output == result.output
+    assert "Ouch!" not in result.output
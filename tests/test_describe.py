@@ -0,0 +1,19 @@
+import pandas as pd
+from click.testing import CliRunner
+
+from csvcli.cli import cli
+
+
+def test_describe_leaves_out_columns_with_text_further_down(tmp_path):
+
+    # 'b' looks numeric in the first rows that pick the columns to describe
+    filepath = tmp_path / "t.csv"
+    pd.DataFrame({'a': range(20001), 'b': [str(i) for i in range(20000)] + ['x']}).to_csv(filepath, index=False)
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['-o', 'csv', str(filepath), 'describe', '--chunk-rows', '5000'])
+    exact_result = runner.invoke(cli, ['-o', 'csv', str(filepath), 'describe', '--exact'])
+
+    assert result.exit_code == 0
+    assert result.stdout.splitlines()[0] == exact_result.stdout.splitlines()[0] == ",a"
+    assert "Columns ['b']" in result.stderr